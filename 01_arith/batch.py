@@ -0,0 +1,147 @@
+"""Vectorized evaluation of large batches of arith terms using NumPy.
+
+All terms are flattened into one set of opcode arrays. The nodes are then
+grouped by their depth and each level is evaluated with a handful of masked
+array operations, instead of pattern matching every node in Python.
+"""
+import numpy as np
+
+from nodes import (FalseNode, IfNode, IsZeroNode, NatNode, Node, PredNode, SuccNode,
+                   TrueNode)
+from run import eval_big
+
+# opcodes
+OP_FALSE, OP_TRUE, OP_NAT, OP_SUCC, OP_PRED, OP_ISZERO, OP_IF = range(7)
+
+_OPCODES = {FalseNode: OP_FALSE, TrueNode: OP_TRUE, NatNode: OP_NAT, SuccNode: OP_SUCC,
+            PredNode: OP_PRED, IsZeroNode: OP_ISZERO, IfNode: OP_IF}
+
+# kinds of values
+KIND_BOOL, KIND_NAT, KIND_STUCK = range(3)
+
+
+class Program:
+    """Flat opcode arrays for a batch of terms
+
+    op: Opcode of each node
+    arg: Value for OP_NAT, unused otherwise
+    children: (n, 3) array of indices of the children, -1 if absent
+    depth: Distance of each node from the root of its term
+    roots: Index of the root node of each term
+    """
+
+    def __init__(self, terms: list[Node]) -> None:
+        op: list[int] = []
+        arg: list[int] = []
+        depth: list[int] = []
+        parent: list[int] = []
+        slot: list[int] = []
+        roots: list[int] = []
+
+        for term in terms:
+            roots.append(len(op))
+            # pre-order traversal, the parent links are resolved afterwards
+            stack: list[tuple[Node, int, int, int]] = [(term, 0, -1, 0)]
+            while stack:
+                node, d, par, pos = stack.pop()
+                cls = type(node)
+                try:
+                    op.append(_OPCODES[cls])
+                except KeyError:
+                    raise Exception(f"Unknown node {node}")
+                idx = len(depth)
+                depth.append(d)
+                parent.append(par)
+                slot.append(pos)
+                if cls is NatNode:
+                    arg.append(node.val)  # type: ignore
+                    continue
+                arg.append(0)
+                d += 1
+                if cls is IfNode:
+                    stack.append((node.else_, d, idx, 2))  # type: ignore
+                    stack.append((node.then, d, idx, 1))  # type: ignore
+                    stack.append((node.cond, d, idx, 0))  # type: ignore
+                elif cls is not TrueNode and cls is not FalseNode:
+                    stack.append((node.val, d, idx, 0))  # type: ignore
+
+        self.terms = terms
+        self.op = np.array(op, dtype=np.int8)
+        self.arg = np.array(arg, dtype=np.int64)
+        self.depth = np.array(depth, dtype=np.int64)
+        self.roots = np.array(roots, dtype=np.int64)
+        self.children = np.full((len(op), 3), -1, dtype=np.int64)
+        par = np.array(parent, dtype=np.int64)
+        has_parent = par >= 0
+        self.children[par[has_parent], np.array(slot, dtype=np.int64)[has_parent]] = \
+            np.flatnonzero(has_parent)
+
+    def __len__(self):
+        return len(self.terms)
+
+
+def eval_program(prog: Program) -> tuple[np.ndarray, np.ndarray]:
+    """Evaluate every node of prog, returning the (kind, val) arrays"""
+    n = len(prog.op)
+    kind = np.full(n, KIND_STUCK, dtype=np.int8)
+    val = np.zeros(n, dtype=np.int64)
+    if n == 0:
+        return kind, val
+
+    # children are always one level deeper than their parent, so evaluating
+    # the deepest level first guarantees that they are already done
+    c1, c2, c3 = prog.children.T
+    order = np.argsort(-prog.depth, kind="stable")
+    _, bounds = np.unique(-prog.depth[order], return_index=True)
+    for start, end in zip(bounds, [*bounds[1:], n]):
+        idx = order[start:end]
+        op = prog.op[idx]
+
+        # constants
+        mask = op <= OP_TRUE
+        kind[idx[mask]] = KIND_BOOL
+        val[idx[mask]] = op[mask]
+        mask = op == OP_NAT
+        kind[idx[mask]] = KIND_NAT
+        val[idx[mask]] = prog.arg[idx[mask]]
+
+        # unary ops on numeric values, anything else is stuck
+        for opcode in (OP_SUCC, OP_PRED, OP_ISZERO):
+            sel = idx[op == opcode]
+            child = c1[sel]
+            sel = sel[kind[child] == KIND_NAT]
+            child_val = val[c1[sel]]
+            if opcode == OP_SUCC:
+                kind[sel], val[sel] = KIND_NAT, child_val + 1
+            elif opcode == OP_PRED:
+                kind[sel], val[sel] = KIND_NAT, np.maximum(child_val - 1, 0)
+            else:
+                kind[sel], val[sel] = KIND_BOOL, child_val == 0
+
+        # both arms are already evaluated, so `if` is just a select
+        sel = idx[op == OP_IF]
+        sel = sel[kind[c1[sel]] == KIND_BOOL]
+        branch = np.where(val[c1[sel]] != 0, c2[sel], c3[sel])
+        kind[sel] = kind[branch]
+        val[sel] = val[branch]
+
+    return kind, val
+
+
+def eval_batch(terms: list[Node]) -> list[Node]:
+    """Evaluate all terms together, returning the same results as `eval_big`.
+
+    Stuck terms are re-evaluated with `eval_big`, so that they come out with
+    the same partially evaluated form.
+    """
+    prog = Program(terms)
+    kind, val = eval_program(prog)
+    results: list[Node] = []
+    for term, k, v in zip(terms, kind[prog.roots].tolist(), val[prog.roots].tolist()):
+        if k == KIND_BOOL:
+            results.append(TrueNode() if v else FalseNode())
+        elif k == KIND_NAT:
+            results.append(NatNode(v))
+        else:
+            results.append(eval_big(term))
+    return results
@@ -0,0 +1,60 @@
+"""Throughput of the batch evaluator against evaluating terms one by one"""
+import random
+import sys
+import time
+
+from batch import Program, eval_batch, eval_program
+from nodes import (FalseNode, IfNode, IsZeroNode, NatNode, Node, PredNode, SuccNode,
+                   TrueNode)
+from run import eval_big, eval_node
+
+
+def random_term(rng: random.Random, depth: int, nat: bool, stuck: float = 0.01) -> Node:
+    """Random term of depth at most `depth`, which is a numeral if `nat` is set,
+    and a boolean otherwise. Subterms are flipped to the wrong kind with
+    probability `stuck`.
+    """
+    if rng.random() < stuck:
+        nat = not nat
+    if depth == 0 or rng.random() < 0.2:
+        if nat:
+            return NatNode(rng.randrange(4))
+        return rng.choice([TrueNode(), FalseNode()])
+    match rng.randrange(3):
+        case 0:
+            return IfNode(random_term(rng, depth - 1, False, stuck),
+                          random_term(rng, depth - 1, nat, stuck),
+                          random_term(rng, depth - 1, nat, stuck))
+        case _ if not nat:
+            return IsZeroNode(random_term(rng, depth - 1, True, stuck))
+        case 1:
+            return SuccNode(random_term(rng, depth - 1, True, stuck))
+        case _:
+            return PredNode(random_term(rng, depth - 1, True, stuck))
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main(count=20_000, depth=6, seed=0):
+    rng = random.Random(seed)
+    terms = [random_term(rng, depth, rng.random() < 0.5) for _ in range(count)]
+
+    small, t_small = timed(lambda: [eval_node(t) for t in terms])
+    big, t_big = timed(lambda: [eval_big(t) for t in terms])
+    batch, t_batch = timed(eval_batch, terms)
+    assert small == big == batch
+    prog, t_compile = timed(Program, terms)
+    _, t_eval = timed(eval_program, prog)
+
+    print(f"{count} terms of depth <= {depth}, {len(prog.op)} nodes")
+    for name, secs in [("small-step", t_small), ("big-step", t_big), ("batch", t_batch),
+                       ("(compile)", t_compile), ("(eval)", t_eval)]:
+        print(f"{name:>10}: {secs:8.3f}s  {count / secs:12.0f} terms/s")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,62 @@
+import abc
+from dataclasses import dataclass
+
+
+@dataclass
+class Node(abc.ABC):
+    pass
+
+
+@dataclass
+class TrueNode(Node):
+    def __str__(self) -> str:
+        return "true"
+
+
+@dataclass
+class FalseNode(Node):
+    def __str__(self) -> str:
+        return "false"
+
+
+@dataclass
+class NatNode(Node):
+    """Numeric value `succ^val 0`, stored as a plain int"""
+    val: int
+
+    def __str__(self) -> str:
+        return str(self.val)
+
+
+@dataclass
+class SuccNode(Node):
+    val: Node
+
+    def __str__(self) -> str:
+        return f"(succ {self.val})"
+
+
+@dataclass
+class PredNode(Node):
+    val: Node
+
+    def __str__(self) -> str:
+        return f"(pred {self.val})"
+
+
+@dataclass
+class IsZeroNode(Node):
+    val: Node
+
+    def __str__(self) -> str:
+        return f"(iszero {self.val})"
+
+
+@dataclass
+class IfNode(Node):
+    cond: Node
+    then: Node
+    else_: Node
+
+    def __str__(self) -> str:
+        return f"(if {self.cond} then {self.then} else {self.else_})"
@@ -1,9 +1,70 @@
 from lark import Lark
+from lark.tree import Tree
+from nodes import (FalseNode, IfNode, IsZeroNode, NatNode, Node, PredNode, SuccNode,
+                   TrueNode)
 
 with open("grammar.lark") as f:
     grammar = f.read()
 
 
+def parse_tree(tree: str | Tree) -> Node:
+    """Node for tree
+
+    Uses an explicit stack instead of recursion, so the depth of tree is not
+    limited by the recursion limit. A frame is revisited once the nodes of its
+    children are on `nodes`.
+    """
+    nodes: list[Node] = []
+    stack: list[tuple[str | Tree, int]] = [(tree, 0)]
+    while stack:
+        tree, depth = stack.pop()
+        match tree:
+            case "true":
+                nodes.append(TrueNode())
+            case "false":
+                nodes.append(FalseNode())
+            case Tree(data="zero"):
+                nodes.append(NatNode(0))
+            case Tree(data="succ") if depth == 0:
+                # walk the whole succ chain at once, so that `succ^n 0` becomes
+                # a single NatNode instead of n nested nodes
+                while isinstance(tree, Tree) and tree.data == "succ":
+                    depth += 1
+                    tree = tree.children[0]
+                stack.append((Tree("succ", [tree]), depth))
+                stack.append((tree, 0))
+            case Tree(data="succ"):
+                node = nodes.pop()
+                if isinstance(node, NatNode):
+                    node = NatNode(node.val + depth)
+                else:
+                    for _ in range(depth):
+                        node = SuccNode(node)
+                nodes.append(node)
+            case Tree(data="pred" | "iszero" | "if_stmt", children=children):
+                if depth == 0:
+                    stack.append((tree, 1))
+                    stack.extend((child, 0) for child in reversed(children))
+                    continue
+                match tree.data:
+                    case "pred":
+                        nodes.append(PredNode(nodes.pop()))
+                    case "iszero":
+                        nodes.append(IsZeroNode(nodes.pop()))
+                    case "if_stmt":
+                        else_, then, cond = nodes.pop(), nodes.pop(), nodes.pop()
+                        nodes.append(IfNode(cond, then, else_))
+            case _:
+                raise Exception("Unmatched", tree)
+    return nodes.pop()
+
+
 p = Lark(grammar)
 
-parse = p.parse
+
+def parse(data: str):
+    tree = p.parse(data)
+    # `?start` inlines itself when there is only a single term
+    if not (isinstance(tree, Tree) and tree.data == "start"):
+        return [parse_tree(tree)]
+    return [parse_tree(child) for child in tree.children]
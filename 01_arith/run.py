@@ -1,54 +1,117 @@
 from parser import parse
-from lark import Tree
 
-def is_numval(term: Tree | str):
-    match term:
-        case "zero": return True
-        case Tree(data="zero"): return True
-        case Tree(data="succ", children=[child]) if is_numval(child): return True
-    return False
+from nodes import (FalseNode, IfNode, IsZeroNode, NatNode, Node, PredNode, SuccNode,
+                   TrueNode)
+
+
+def is_numval(node: Node):
+    return isinstance(node, NatNode)
+
+
+def is_val(node: Node):
+    return isinstance(node, (TrueNode, FalseNode, NatNode))
 
-def is_val(term: Tree | str):
-    match term:
-        case "true" | "false": return True
-        case t: return is_numval(t)
 
 class NoRuleApplies(Exception):
     pass
 
-def eval_(term):
-    match term:
-        case Tree(data="if_stmt", children=["true", t2, _]): return t2
-        case Tree(data="if_stmt", children=["false", _, t3]): return t3
-        case Tree(data="if_stmt", children=[t1, t2, t3]): 
-            return Tree(data="if_stmt", children=[eval_(t1), t2, t3])
-        case Tree(data="succ", children=[t1]):
-            return Tree(data="succ", children=[eval_(t1)])
-        case Tree(data="pred", children=[Tree(data="zero")]):
-            return "zero"
-        case Tree(data="pred", children=[Tree(data="succ", children=[t1])]) if is_numval(t1):
-            return t1
-        case Tree(data="iszero", children=[Tree(data="zero")]):
-            return "true"
-        case Tree(data="iszero", children=[Tree(data="succ", children=[t1])]) if is_numval(t1):
-            return "false"
-        case Tree(data="iszero", children=[t1]):
-            return Tree(data="iszero", children=[eval_(t1)])
-        case _: raise NoRuleApplies
-
-inp = """true;
-if false then true else false; 
-
-0; 
-succ (pred 0);
-iszero (pred (succ (succ 0))); 
-"""
-
-t = parse(inp)
-for c in t.children:
+
+def eval_(node: Node) -> Node:
+    """Single step of the small-step semantics"""
+    match node:
+        case IfNode(TrueNode(), then, _): return then
+        case IfNode(FalseNode(), _, else_): return else_
+        case IfNode(cond, then, else_):
+            return IfNode(eval_(cond), then, else_)
+        case SuccNode(NatNode(val)):
+            return NatNode(val + 1)
+        case SuccNode(t1):
+            return SuccNode(eval_(t1))
+        case PredNode(NatNode(val)):
+            return NatNode(max(val - 1, 0))
+        case PredNode(t1):
+            return PredNode(eval_(t1))
+        case IsZeroNode(NatNode(val)):
+            return TrueNode() if val == 0 else FalseNode()
+        case IsZeroNode(t1):
+            return IsZeroNode(eval_(t1))
+    raise NoRuleApplies
+
+
+def eval_node(node: Node) -> Node:
+    """Evaluate node using small steps until no rule applies"""
     while True:
         try:
-            c = eval_(c)
+            node = eval_(node)
         except NoRuleApplies:
-            break
-    print(c)
+            return node
+
+
+def eval_big(node: Node) -> Node:
+    """Big-step evaluation of node in a single pass.
+
+    Returns the same normal form as `eval_node`, including for stuck terms
+    (e.g. `succ true`), which are returned with their subterms evaluated.
+
+    Uses an explicit stack instead of recursion, so deep `succ`/`pred`/`if`
+    nests are not limited by the recursion limit. A frame is revisited once
+    the value of its first subterm is on `results`.
+    """
+    results: list[Node] = []
+    stack: list[tuple[Node, bool]] = [(node, False)]
+    while stack:
+        node, visited = stack.pop()
+        match node:
+            case IfNode(cond, then, else_):
+                if not visited:
+                    stack.append((node, True))
+                    stack.append((cond, False))
+                    continue
+                match results.pop():
+                    case TrueNode(): stack.append((then, False))
+                    case FalseNode(): stack.append((else_, False))
+                    case stuck: results.append(IfNode(stuck, then, else_))
+            case SuccNode(t1) | PredNode(t1) | IsZeroNode(t1):
+                if not visited:
+                    stack.append((node, True))
+                    stack.append((t1, False))
+                    continue
+                match node, results.pop():
+                    case SuccNode(), NatNode(val):
+                        results.append(NatNode(val + 1))
+                    case PredNode(), NatNode(val):
+                        results.append(NatNode(max(val - 1, 0)))
+                    case IsZeroNode(), NatNode(val):
+                        results.append(TrueNode() if val == 0 else FalseNode())
+                    case _, stuck:
+                        results.append(type(node)(stuck))
+            case _:
+                results.append(node)
+    return results.pop()
+
+
+def run(cmd: Node, mode="big"):
+    if mode == "big":
+        print(eval_big(cmd))
+    elif mode == "small":
+        print(eval_node(cmd))
+    else:
+        raise ValueError(f"Unknown mode {mode}")
+
+
+def main():
+    inp = """true;
+    if false then true else false;
+
+    0;
+    succ (pred 0);
+    iszero (pred (succ (succ 0)));
+    succ (if true then succ 0 else 0);
+    pred (succ true);
+    """
+    for cmd in parse(inp):
+        run(cmd)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import random
+import sys
+
+from lark.tree import Tree
+
+from batch import eval_batch
+from bench import random_term
+from nodes import FalseNode, IfNode, IsZeroNode, NatNode, PredNode, SuccNode, TrueNode
+from parser import parse, parse_tree
+from run import eval_big, eval_node
+
+DEEP = 10 * sys.getrecursionlimit()
+
+
+def pred_chain(n, node):
+    for _ in range(n):
+        node = PredNode(node)
+    return node
+
+
+def if_chain(n):
+    """`if (if (... true ...) then false else true) then false else true`"""
+    node = TrueNode()
+    for _ in range(n):
+        node = IfNode(node, FalseNode(), TrueNode())
+    return node
+
+
+# big steps give the same normal forms as small steps, stuck or not
+rng = random.Random(0)
+stuck = 0
+for _ in range(5000):
+    term = random_term(rng, rng.randrange(1, 8), rng.random() < 0.5, stuck=0.1)
+    expected = eval_node(term)
+    assert eval_big(term) == expected, (term, expected)
+    stuck += not isinstance(expected, (TrueNode, FalseNode, NatNode))
+assert 500 < stuck < 4500, stuck
+for term, expected in [
+    (SuccNode(TrueNode()), SuccNode(TrueNode())),
+    (PredNode(SuccNode(IfNode(TrueNode(), TrueNode(), NatNode(0)))), PredNode(SuccNode(TrueNode()))),
+    (IfNode(NatNode(0), TrueNode(), FalseNode()), IfNode(NatNode(0), TrueNode(), FalseNode())),
+    (IfNode(IsZeroNode(PredNode(NatNode(1))), SuccNode(NatNode(2)), TrueNode()), NatNode(3)),
+]:
+    assert eval_big(term) == eval_node(term) == expected, term
+# and keep going past the recursion limit
+assert eval_big(IsZeroNode(pred_chain(DEEP, NatNode(DEEP)))) == TrueNode()
+assert eval_big(if_chain(DEEP)) == (TrueNode() if DEEP % 2 == 0 else FalseNode())
+node = eval_big(pred_chain(DEEP, IsZeroNode(FalseNode())))
+for _ in range(DEEP):
+    assert isinstance(node, PredNode)
+    node = node.val
+assert node == IsZeroNode(FalseNode())
+print("eval: ok")
+
+assert parse("succ (pred 0); iszero (succ succ 0);") == [
+    SuccNode(PredNode(NatNode(0))), IsZeroNode(NatNode(2))]
+assert parse("if true then succ 0 else succ false;") == [
+    IfNode(TrueNode(), NatNode(1), SuccNode(FalseNode()))]
+assert parse("succ succ (pred 0);") == [SuccNode(SuccNode(PredNode(NatNode(0))))]
+# trees nested beyond the recursion limit
+tree = Tree("zero", [])
+for i in range(DEEP):
+    tree = Tree(["pred", "iszero", "succ"][i % 3], [tree])
+tree = Tree("if_stmt", [tree, "true", Tree("succ", [Tree("succ", [Tree("zero", [])])])])
+node = parse_tree(tree)
+assert node.then == TrueNode() and node.else_ == NatNode(2)
+node = node.cond
+for i in reversed(range(DEEP)):
+    assert isinstance(node, [PredNode, IsZeroNode, SuccNode][i % 3])
+    node = node.val
+assert node == NatNode(0)
+tree = "true"
+for _ in range(DEEP):
+    tree = Tree("succ", [tree])
+node = parse_tree(tree)
+for _ in range(DEEP):
+    node = node.val
+assert node == TrueNode()
+print("parse: ok")
+
+# the batch gives the same results as evaluating terms one by one, whether
+# they are values, stuck or deeper than the recursion limit
+rng = random.Random(1)
+terms = [random_term(rng, rng.randrange(0, 8), rng.random() < 0.5, stuck=0.1) for _ in range(5000)]
+expected = [eval_node(term) for term in terms]
+terms += [IsZeroNode(pred_chain(DEEP, NatNode(DEEP))), if_chain(DEEP), IfNode(TrueNode(), NatNode(0), FalseNode())]
+expected += [TrueNode(), TrueNode() if DEEP % 2 == 0 else FalseNode(), NatNode(0)]
+terms += [NatNode(7), FalseNode(), SuccNode(FalseNode()), IfNode(SuccNode(NatNode(0)), TrueNode(), FalseNode())]
+expected += [eval_node(term) for term in terms[-4:]]
+results = eval_batch(terms)
+assert results == expected
+assert sum(not isinstance(r, (TrueNode, FalseNode, NatNode)) for r in results) > 200
+node = eval_batch([pred_chain(DEEP, IsZeroNode(FalseNode())), NatNode(1)])[0]
+for _ in range(DEEP):
+    node = node.val
+assert node == IsZeroNode(FalseNode())
+assert eval_batch([]) == []
+print("batch: ok")
@@ -0,0 +1,327 @@
+"""Accelerator for Church numerals and booleans in `nbe`.
+
+`hook` recognizes closed Church numerals and booleans, and closed well-known
+combinators on them, up to names of binders. Numerals become `Num` values
+that only store their count, and a combinator applied to enough numerals
+computes its result natively. The encoded term is only rebuilt when the
+value is read back, and applying a `Num` as a function does the same as
+applying the numeral. Results keep the binder names that normalizing the
+plain term would give, so they are identical to `nbe.normalize`.
+
+Arguments are lazy, so a combinator only forces the ones that plain
+evaluation would always force too (`Prim.strict`), and the others only if
+they are already evaluated, or are arithmetic on numerals, which always
+terminates.
+"""
+from typing import Callable, NamedTuple, Optional
+
+from nbe import (App, Code, Env, Lam, Native, Thunk, TooDeep, Value, Var, apply,
+                 compile_node, force, normalize, run)
+from parser import AbsNode, AppNode, Node, VarNode, parse
+
+
+class Num(Native):
+    """Church numeral `lambda f. lambda x. f (f ... x)` with n applications"""
+    __slots__ = ("n", "x", "chain")
+
+    def __init__(self, n: int, f: str, x: str) -> None:
+        super().__init__(f, self._apply)
+        self.n = n
+        self.x = x
+        self.chain: Optional[Code] = None
+
+    def _apply(self, f: "Thunk | Value") -> Value:
+        if self.chain is None:
+            # compiled `f (f ... x)`, which `run` evaluates without using the
+            # Python stack for each f, unlike a native function would
+            chain: Code = Var(0)
+            fun = Var(1)
+            for _ in range(self.n):
+                chain = App(fun, chain)
+            self.chain = chain
+        chain = self.chain
+        return Lam(self.x, lambda x: run(chain, (x, (f, None))))
+
+    def rebuild(self, level: int) -> Node:
+        body: Node = VarNode(0, level + 2)
+        # nodes aren't modified, so all uses of f can be the same node
+        f = VarNode(1, level + 2)
+        for _ in range(self.n):
+            body = AppNode(f, body)
+        return AbsNode(self.name, AbsNode(self.x, body))
+
+
+class Tru(Native):
+    """Church boolean `lambda t. lambda f. t`
+
+    False is the same term as the numeral 0, so it is a `Num`.
+    """
+    __slots__ = ("f",)
+
+    def __init__(self, t: str, f: str) -> None:
+        super().__init__(t, lambda a: Lam(f, lambda _: force(a)))
+        self.f = f
+
+    def rebuild(self, level: int) -> Node:
+        return AbsNode(self.name, AbsNode(self.f, VarNode(1, level + 2)))
+
+
+def truth(b: bool, t: str, f: str) -> Native:
+    return Tru(t, f) if b else Num(0, t, f)
+
+
+class Prim(NamedTuple):
+    """Combinator that can be computed natively
+
+    strict: For each argument, whether plain evaluation always forces it
+        when the result is applied or read back
+    native: Result from the arguments, which are None if they shouldn't be
+        forced, and the names of the binders of the combinator in pre-order.
+        Returns None when the result isn't known natively.
+    numeric: Whether the combinator only does arithmetic on numerals
+    """
+    name: str
+    source: str
+    strict: tuple[bool, ...]
+    native: Callable[[list, list[str]], Optional[Value]]
+    numeric: bool = True
+
+
+def _exp(vals: list, names: list[str]):
+    m, n = vals
+    # 0 m is lambda x. m x, which isn't a numeral
+    if isinstance(m, Num) and isinstance(n, Num) and n.n > 0:
+        return Num(m.n ** n.n, n.x, m.x)
+
+
+def _not(vals: list, names: list[str]):
+    (b,) = vals
+    if isinstance(b, Tru) or isinstance(b, Num) and b.n == 0:
+        return truth(isinstance(b, Num), names[1], names[2])
+
+
+prims = [
+    Prim("succ", "lambda n. lambda f. lambda x. f ((n f) x)", (False,),
+         lambda vals, names: isinstance(vals[0], Num) and Num(vals[0].n + 1, names[1], names[2])),
+    Prim("plus", "lambda m. lambda n. lambda f. lambda x. (m f) ((n f) x)", (True, False),
+         lambda vals, names: isinstance(vals[0], Num) and isinstance(vals[1], Num)
+         and Num(vals[0].n + vals[1].n, names[2], names[3])),
+    # 0 doesn't use its argument, so n isn't always forced
+    Prim("times", "lambda m. lambda n. lambda f. m (n f)", (True, False),
+         lambda vals, names: isinstance(vals[0], Num) and isinstance(vals[1], Num)
+         and Num(vals[0].n * vals[1].n, names[2], vals[0].x)),
+    Prim("exp", "lambda m. lambda n. n m", (False, True), _exp),
+    Prim("iszero", "lambda n. (n (lambda x. lambda t. lambda f. f)) (lambda t. lambda f. t)",
+         (True,), lambda vals, names: isinstance(vals[0], Num)
+         and (Tru(names[4], names[5]) if vals[0].n == 0 else Num(0, names[2], names[3])),
+         numeric=False),
+    Prim("not", "lambda b. lambda t. lambda f. (b f) t", (True,), _not, numeric=False),
+]
+
+# largest combinator, so that bigger terms are rejected early
+_MAX_SIZE = 20
+
+
+def shape(node: Node, limit: int = _MAX_SIZE) -> Optional[tuple]:
+    """Structure of node without the names of binders, or None if node isn't
+    closed or has more than limit nodes"""
+    size = 0
+
+    def go(node: Node, depth: int):
+        nonlocal size
+        size += 1
+        if size > limit:
+            raise ValueError
+        match node:
+            case VarNode(idx):
+                if idx >= depth:
+                    raise ValueError
+                return idx
+            case AbsNode(_, body):
+                return (go(body, depth + 1),)
+            case AppNode(c1, c2):
+                return (go(c1, depth), go(c2, depth))
+        raise Exception("Unreachable")
+
+    try:
+        return go(node, 0)
+    except ValueError:
+        return None
+
+
+_prims = {shape(parse(prim.source + ";")[0]): prim for prim in prims}
+
+
+def binders(node: Node) -> list[str]:
+    """Names of the binders in node, in pre-order"""
+    names = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        match node:
+            case AbsNode(orig_name, body):
+                names.append(orig_name)
+                stack.append(body)
+            case AppNode(c1, c2):
+                stack.extend((c2, c1))
+    return names
+
+
+def literal(node: Node) -> Optional[Native]:
+    """Value of a Church numeral or tru literal"""
+    match node:
+        case AbsNode(f, AbsNode(x, body)):
+            if isinstance(body, VarNode) and body.idx == 1:
+                return Tru(f, x)
+            n = 0
+            while isinstance(body, AppNode) and isinstance(body.child1, VarNode) \
+                    and body.child1.idx == 1:
+                n += 1
+                body = body.child2
+            if isinstance(body, VarNode) and body.idx == 0:
+                return Num(n, f, x)
+    return None
+
+
+def recognize(node: Node) -> Optional[Prim]:
+    if isinstance(node, AbsNode):
+        return _prims.get(shape(node))
+    return None
+
+
+def _lookup(env: Env, idx: int) -> "Thunk | Value":
+    for _ in range(idx):
+        env = env[1]  # type: ignore
+    return env[0]  # type: ignore
+
+
+# most nodes looked at when checking if an argument terminates
+_TOTAL_FUEL = 64
+
+
+def _total(arg: "Thunk | Value", fuel: Optional[list[int]] = None) -> bool:
+    """Whether forcing arg is known to terminate
+
+    Gives up, returning False, after looking at _TOTAL_FUEL nodes.
+    """
+    if not isinstance(arg, Thunk) or arg.value is not None:
+        return True
+    node = getattr(arg.code, "node", None)
+    return node is not None and _total_node(node, arg.env, fuel or [_TOTAL_FUEL])
+
+
+def _total_node(node: Node, env: Env, fuel: list[int]) -> bool:
+    """Whether node is arithmetic on numerals"""
+    fuel[0] -= 1
+    if fuel[0] < 0:
+        return False
+    args = []
+    while isinstance(node, AppNode):
+        args.append(node.child2)
+        node = node.child1
+    match node:
+        case AbsNode() if not args:
+            return isinstance(literal(node), Num)
+        case AbsNode():
+            prim = recognize(node)
+        case VarNode(idx):
+            val = _lookup(env, idx)
+            if not args:
+                return _total(val, fuel)
+            prim = getattr(getattr(val, "code", None), "prim", None)
+        case _:
+            return False
+    return prim is not None and prim.numeric and len(prim.strict) == len(args) and \
+        all(_total_node(arg, env, fuel) for arg in args)
+
+
+def prim_code(prim: Prim, node: AbsNode):
+    """Code for the combinator prim, whose source is node"""
+    names = binders(node)
+    # the combinator is closed, so its plain value doesn't need an environment
+    generic = run(compile_node(node), None)
+    arity = len(prim.strict)
+
+    def stage(args: tuple) -> Value:
+        if len(args) == arity:
+            return finish(args)
+        return Lam(names[len(args)], lambda arg: stage(args + (arg,)))
+
+    def finish(args: tuple) -> Value:
+        vals = [force(arg) if strict or _total(arg) else None
+                for arg, strict in zip(args, prim.strict)]
+        res = prim.native(vals, names)
+        if res:
+            return res
+        val = generic
+        for arg in args:
+            val = apply(val, arg)
+        return val
+
+    value = stage(())
+
+    def code(env: Env) -> Value:
+        return value
+    code.prim = prim  # type: ignore
+    return code
+
+
+def hook(node: Node, depth: int):
+    """Compile literals and combinators to native values, for `nbe.compile_node`"""
+    if not isinstance(node, AbsNode):
+        return None
+    val = literal(node)
+    if val is not None:
+        return lambda env: val
+    prim = recognize(node)
+    if prim is not None:
+        return prim_code(prim, node)
+    return None
+
+
+def normalize_church(node: Node, bindings: list) -> Node:
+    """Same as `nbe.normalize`, with Church numerals and booleans computed natively
+
+    A combinator forces its strict arguments with a Python call, so iterating
+    one, e.g. `(n (lambda m. (plus m) one)) zero`, nests a call for each
+    iteration. When that runs out of stack, node is normalized again without
+    natives, which doesn't use the Python stack.
+    """
+    try:
+        return normalize(node, bindings, hook=hook)
+    except TooDeep:
+        return normalize(node, bindings)
+
+
+def main():
+    """Compare with plain normalization on arithmetic with large results"""
+    import time
+
+    from arrays import ArrayTerm
+    from bench import church, program
+
+    def same(node1: Node, node2: Node) -> bool:
+        # too deep for ==
+        arr1, arr2 = ArrayTerm.from_node(node1, 0), ArrayTerm.from_node(node2, 0)
+        return (len(arr1) == len(arr2) and (arr1.tag == arr2.tag).all()
+                and (arr1.idx == arr2.idx).all() and arr1.names == arr2.names)
+
+    print(f"{'term':>40} {'nbe':>8} {'church':>8}")
+    for body in [f"(plus {church(3000)}) {church(3000)}",
+                 f"(times {church(300)}) {church(300)}",
+                 f"(exp {church(2)}) {church(16)}",
+                 f"succ ((times {church(100)}) ((plus {church(50)}) {church(50)}))"]:
+        (cmd,) = parse(program(body))
+        start = time.perf_counter()
+        res = normalize(cmd, [])
+        plain = time.perf_counter() - start
+        start = time.perf_counter()
+        fast = normalize_church(cmd, [])
+        native = time.perf_counter() - start
+        assert same(fast, res)
+        name = body if len(body) <= 40 else body[:37] + "..."
+        print(f"{name:>40} {plain:>8.3f} {native:>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Array-backed representation of untyped terms.
+
+An `ArrayTerm` stores a whole term as a struct of NumPy arrays, one entry per
+node in pre-order. Since the binder depth of every node is stored alongside
+its de Bruijn index, whether a variable is free is just `idx >= depth`, and
+operations like `shift` become a single masked vector operation instead of a
+walk over the tree.
+"""
+import numpy as np
+
+from parser import AbsNode, AppNode, Node, VarNode
+
+TAG_VAR, TAG_ABS, TAG_APP = range(3)
+
+
+class ArrayTerm:
+    """A term as arrays, indexed by node number in pre-order
+
+    tag: TAG_VAR, TAG_ABS or TAG_APP
+    left: Body of an abstraction, or the function of an application, else -1
+    right: Argument of an application, else -1
+    idx: De Bruijn index of a variable, else 0
+    depth: Number of binders between the root and the node
+    names: Name of each abstraction, None for other nodes
+    ctx_len: Length of the context of the root
+    """
+
+    def __init__(self, tag: np.ndarray, left: np.ndarray, right: np.ndarray,
+                 idx: np.ndarray, depth: np.ndarray, names: list, ctx_len: int) -> None:
+        self.tag = tag
+        self.left = left
+        self.right = right
+        self.idx = idx
+        self.depth = depth
+        self.names = names
+        self.ctx_len = ctx_len
+
+    def __len__(self):
+        return len(self.tag)
+
+    @classmethod
+    def from_node(cls, node: Node, ctx_len: int) -> "ArrayTerm":
+        tag: list[int] = []
+        left: list[int] = []
+        right: list[int] = []
+        idx: list[int] = []
+        depth: list[int] = []
+        names: list = []
+        stack: list[tuple[Node, int, int, list[int]]] = [(node, 0, -1, left)]
+        while stack:
+            node, d, parent, slot = stack.pop()
+            i = len(tag)
+            if parent >= 0:
+                slot[parent] = i
+            left.append(-1)
+            right.append(-1)
+            depth.append(d)
+            match node:
+                case VarNode():
+                    tag.append(TAG_VAR)
+                    idx.append(node.idx)
+                    names.append(None)
+                case AbsNode():
+                    tag.append(TAG_ABS)
+                    idx.append(0)
+                    names.append(node.orig_name)
+                    stack.append((node.body, d + 1, i, left))
+                case AppNode():
+                    tag.append(TAG_APP)
+                    idx.append(0)
+                    names.append(None)
+                    stack.append((node.child2, d, i, right))
+                    stack.append((node.child1, d, i, left))
+                case _:
+                    raise Exception("Unreachable")
+        return cls(np.array(tag, dtype=np.int8), np.array(left, dtype=np.int64),
+                   np.array(right, dtype=np.int64), np.array(idx, dtype=np.int64),
+                   np.array(depth, dtype=np.int64), names, ctx_len)
+
+    def to_node(self) -> Node:
+        """Convert back to VarNode/AbsNode/AppNode"""
+        tag, left, right = self.tag.tolist(), self.left.tolist(), self.right.tolist()
+        idx, depth = self.idx.tolist(), self.depth.tolist()
+        # children come after their parents in pre-order
+        nodes: list = [None] * len(tag)
+        for i in reversed(range(len(tag))):
+            if tag[i] == TAG_VAR:
+                nodes[i] = VarNode(idx[i], self.ctx_len + depth[i])
+            elif tag[i] == TAG_ABS:
+                nodes[i] = AbsNode(self.names[i], nodes[left[i]])
+            else:
+                nodes[i] = AppNode(nodes[left[i]], nodes[right[i]])
+        return nodes[0]
+
+    def free_mask(self, c: int = 0) -> np.ndarray:
+        """Mask of the variables that are free at cutoff c"""
+        return (self.tag == TAG_VAR) & (self.idx >= self.depth + c)
+
+    def free_vars(self) -> np.ndarray:
+        """Sorted indices, in the context of the root, of the free variables"""
+        mask = self.free_mask()
+        return np.unique(self.idx[mask] - self.depth[mask])
+
+    def is_closed(self) -> bool:
+        return not self.free_mask().any()
+
+    def shift(self, d: int, c: int = 0) -> "ArrayTerm":
+        """Shift the terms by d
+        d: Shift value
+        c: Cutoff param
+
+        The structure arrays are shared with the result, only idx is new.
+        """
+        idx = np.where(self.free_mask(c), self.idx + d, self.idx)
+        return ArrayTerm(self.tag, self.left, self.right, idx, self.depth,
+                         self.names, self.ctx_len + d)
@@ -0,0 +1,203 @@
+"""Benchmark suite of Church-encoded and fixpoint workloads.
+
+Runs each workload at increasing sizes against one or more evaluators, and
+reports the reductions per second, allocated nodes and peak memory. Any
+function with the `run(cmd, bindings)` interface can be benchmarked:
+
+    python bench.py                    # run.run in its default mode
+    python bench.py eval cek need      # modes of run.run
+    python bench.py mymodule.run       # any other run function
+
+The reductions are the call-by-value beta reductions of each workload, as
+counted by the CEK machine, so the rates are comparable between evaluators
+that reduce in a different order.
+
+All applications below are fully parenthesised, since application in the
+grammar is right-associative.
+"""
+import argparse
+import importlib
+import io
+import re
+import time
+import tracemalloc
+from contextlib import contextmanager, redirect_stdout
+from functools import partial
+from typing import Callable, NamedTuple
+
+import run
+from cek import Stats, eval_cek
+from nbe import nf_equal
+from parser import AbsNode, AppNode, BindNode, VarNode, parse
+
+prelude = [
+    ("id", "lambda x. x"),
+    ("tru", "lambda t. lambda f. t"),
+    ("fls", "lambda t. lambda f. f"),
+    ("not", "lambda b. (b fls) tru"),
+    ("zero", "lambda f. lambda x. x"),
+    ("succ", "lambda n. lambda f. lambda x. f ((n f) x)"),
+    ("plus", "lambda m. lambda n. lambda f. lambda x. (m f) ((n f) x)"),
+    ("times", "lambda m. lambda n. lambda f. m (n f)"),
+    ("exp", "lambda m. lambda n. n m"),
+    ("parity", "lambda n. (n not) tru"),
+    ("iszero", "lambda n. (n (lambda x. fls)) tru"),
+    ("pair", "lambda a. lambda b. lambda s. (s a) b"),
+    ("fst", "lambda p. p tru"),
+    ("snd", "lambda p. p fls"),
+    ("pred", "lambda n. fst ((n (lambda p. (pair (snd p)) (succ (snd p)))) ((pair zero) zero))"),
+    # call-by-value fixpoint (Z combinator)
+    ("fix", "lambda f. (lambda x. f (lambda v. (x x) v)) (lambda x. f (lambda v. (x x) v))"),
+    ("nil", "lambda c. lambda n. n"),
+    ("cons", "lambda h. lambda t. lambda c. lambda n. (c h) ((t c) n)"),
+    ("szero", "lambda s. lambda z. z"),
+    ("ssucc", "lambda n. lambda s. lambda z. s n"),
+    ("fact", """fix (lambda fact. lambda n.
+        (((iszero n) (lambda d. succ zero)) (lambda d. (times n) (fact (pred n)))) id)"""),
+    ("fib", """fix (lambda fib. lambda n.
+        (((iszero n) (lambda d. zero)) (lambda d.
+            (((iszero (pred n)) (lambda d. succ zero)) (lambda d.
+                (plus (fib (pred n))) (fib (pred (pred n))))) id)) id)"""),
+    ("to_church", """fix (lambda rec. lambda n.
+        ((n (lambda p. lambda d. succ (rec p))) (lambda d. zero)) id)"""),
+]
+
+
+def church(n: int) -> str:
+    """Small source expression evaluating to the Church numeral n"""
+    if n <= 10:
+        return "(lambda f. lambda x. " + "f (" * n + "x" + ")" * n + ")"
+    return f"((plus ((times {church(10)}) {church(n // 10)})) {church(n % 10)})"
+
+
+def program(body: str) -> str:
+    """Wrap body in the prelude definitions it (transitively) uses"""
+    used = set(re.findall(r"\w+", body))
+    defs = []
+    for name, term in reversed(prelude):
+        if name in used:
+            defs.append((name, term))
+            used.update(re.findall(r"\w+", term))
+    for name, term in defs:
+        body = f"(lambda {name}. {body}) ({term})"
+    return body + ";"
+
+
+class Workload(NamedTuple):
+    name: str
+    make: Callable[[int], str]
+    parity: Callable[[int], bool]
+    sizes: list[int]
+
+
+workloads = [
+    Workload("add", lambda n: f"parity ((plus {church(n)}) {church(n + 1)})",
+             lambda n: False, [10, 100, 1000, 10000]),
+    Workload("mul", lambda n: f"parity ((times {church(n)}) {church(n)})",
+             lambda n: n % 2 == 0, [10, 30, 100, 300]),
+    Workload("exp", lambda n: f"parity ((exp {church(2)}) {church(n)})",
+             lambda n: n > 0, [4, 8, 12, 15]),
+    Workload("fact", lambda n: f"parity (fact {church(n)})",
+             lambda n: n > 1, [3, 4, 5, 6]),
+    Workload("fib", lambda n: f"parity (fib {church(n)})",
+             lambda n: n % 3 == 0, [5, 8, 11, 14]),
+    Workload("list", lambda n: f"parity (((({church(n)} (lambda l. (cons {church(1)}) l)) nil) plus) zero)",
+             lambda n: n % 2 == 0, [10, 100, 1000, 3000]),
+    Workload("scott", lambda n: f"parity (to_church (({church(n)} ssucc) szero))",
+             lambda n: n % 2 == 0, [10, 100, 1000, 3000]),
+]
+
+
+# default number of sizes for evaluators that are too slow for the largest
+# sizes, e.g. `eval` copies the whole term on every step
+MAX_SIZES = {"eval": 2, "hashcons": 3}
+
+
+@contextmanager
+def count_nodes():
+    """Count the nodes created inside the `with` block"""
+    count = [0]
+    originals = {cls: cls.__init__ for cls in (VarNode, AbsNode, AppNode)}
+
+    def counting(init):
+        def __init__(self, *args, **kwargs):
+            count[0] += 1
+            init(self, *args, **kwargs)
+        return __init__
+
+    for cls, init in originals.items():
+        cls.__init__ = counting(init)  # type: ignore
+    try:
+        yield count
+    finally:
+        for cls, init in originals.items():
+            cls.__init__ = init  # type: ignore
+
+
+class Result(NamedTuple):
+    reductions: int
+    seconds: float
+    nodes: int
+    peak_bytes: int
+
+
+def measure(run_fn, source: str, expected: bool) -> Result:
+    cmds = parse(source)
+    (cmd,) = [cmd for cmd in cmds if not isinstance(cmd, BindNode)]
+    stats = Stats()
+    eval_cek(cmd, [], stats)
+
+    with redirect_stdout(io.StringIO()) as out:
+        start = time.perf_counter()
+        run_fn(cmd, [])
+        seconds = time.perf_counter() - start
+    want = "(lambda t. (lambda f. t))" if expected else "(lambda t. (lambda f. f))"
+    # compared up to names of binders, and eta for evaluators like ski
+    (got,) = parse(out.getvalue().strip() + ";")
+    if not nf_equal(got, parse(want + ";")[0], [], eta=True):
+        raise AssertionError(f"Expected {want}, got {out.getvalue().strip()}")
+
+    # instrumented run, kept separate so it doesn't affect the timing
+    with redirect_stdout(io.StringIO()), count_nodes() as nodes:
+        tracemalloc.start()
+        run_fn(cmd, [])
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return Result(stats.betas, seconds, nodes[0], peak)
+
+
+def get_evaluator(name: str):
+    if "." in name:
+        module, func = name.rsplit(".", 1)
+        return getattr(importlib.import_module(module), func)
+    return partial(run.run, mode=name)
+
+
+def main():
+    args = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    args.add_argument("evaluators", nargs="*", default=["eval"],
+                      help="modes of run.run, or module.function")
+    args.add_argument("-w", "--workload", action="append",
+                      help="only run these workloads")
+    args.add_argument("-s", "--max-size", type=int, default=None,
+                      help="number of sizes to run, from smallest (default: all, "
+                           "or fewer for the slowest evaluators)")
+    opts = args.parse_args()
+
+    print(f"{'evaluator':>10} {'workload':>8} {'size':>6} {'reductions':>10} "
+          f"{'secs':>8} {'red/s':>10} {'nodes':>10} {'peak KiB':>10}")
+    for name in opts.evaluators:
+        run_fn = get_evaluator(name)
+        max_size = opts.max_size if opts.max_size is not None else MAX_SIZES.get(name)
+        for workload in workloads:
+            if opts.workload and workload.name not in opts.workload:
+                continue
+            for size in workload.sizes[:max_size]:
+                res = measure(run_fn, program(workload.make(size)), workload.parity(size))
+                print(f"{name:>10} {workload.name:>8} {size:>6} {res.reductions:>10} "
+                      f"{res.seconds:>8.3f} {res.reductions / res.seconds:>10.0f} "
+                      f"{res.nodes:>10} {res.peak_bytes // 1024:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Benchmark of shifting terms as arrays against shifting `Node` trees.
+
+The conversion to and from arrays is timed separately, since it only pays off
+when the term stays in array form across several operations.
+"""
+import sys
+import time
+
+from arrays import ArrayTerm
+from bench_deep import church_numeral, size
+from parser import AbsNode, AppNode, Node, VarNode
+from run import shift
+
+
+def free_vars(node: Node) -> set[int]:
+    """Free variables of node, found by walking the tree"""
+    res = set()
+    stack = [(node, 0)]
+    while stack:
+        node, depth = stack.pop()
+        match node:
+            case VarNode():
+                if node.idx >= depth:
+                    res.add(node.idx - depth)
+            case AbsNode():
+                stack.append((node.body, depth + 1))
+            case AppNode():
+                stack.append((node.child1, depth))
+                stack.append((node.child2, depth))
+    return res
+
+
+def timed(name: str, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    secs = time.perf_counter() - start
+    print(f"{name:>30}: {secs:8.3f}s")
+    return result, secs
+
+
+def main(nodes=1_000_000):
+    ctx_len = 2
+    # numeral with a free variable in every other application, so that half of
+    # the variables are shifted
+    body: Node = VarNode(0, ctx_len + 2)
+    for i in range(nodes // 4):
+        arg = VarNode(2 + i % 2, ctx_len + 2)
+        body = AppNode(AppNode(VarNode(1, ctx_len + 2), arg), body)
+    term = AppNode(AbsNode("f", AbsNode("x", body)), church_numeral(nodes // 8, ctx_len))
+    print(f"{size(term)} nodes")
+
+    arr, _ = timed("from_node", ArrayTerm.from_node, term, ctx_len)
+    shifted, tree_secs = timed("shift tree", shift, term, 3)
+    arr_shifted, arr_secs = timed("shift arrays", arr.shift, 3)
+    print(f"{'speedup':>30}: {tree_secs / arr_secs:8.1f}x")
+    back, _ = timed("to_node", arr_shifted.to_node)
+    # the trees are too deep for ==, so compare them as arrays
+    for res in (shifted, back):
+        other = ArrayTerm.from_node(res, ctx_len + 3)
+        assert (other.tag == arr_shifted.tag).all() and (other.idx == arr_shifted.idx).all()
+
+    tree_fv, tree_secs = timed("free vars tree", free_vars, term)
+    arr_fv, arr_secs = timed("free vars arrays", arr.free_vars)
+    print(f"{'speedup':>30}: {tree_secs / arr_secs:8.1f}x")
+    assert tree_fv == set(arr_fv.tolist()) == {0, 1}
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
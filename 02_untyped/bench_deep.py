@@ -0,0 +1,105 @@
+"""Regression benchmark for evaluating and printing very deep terms.
+
+All of these are far deeper than the recursion limit, so they only work with
+the explicit-stack `shift`, `subst`, `eval_` and `pprint_tree`. Printing with a
+limit only walks the part of the term that is printed.
+"""
+import io
+import sys
+import time
+from contextlib import redirect_stdout
+
+from parser import AbsNode, AppNode, Node, VarNode
+from run import eval_, eval_node, pprint_tree, shift, subst
+
+
+def church_numeral(n: int, ctx_len: int) -> Node:
+    """lambda f. lambda x. f (f (... (f x)))"""
+    body: Node = VarNode(0, ctx_len + 2)
+    for _ in range(n):
+        body = AppNode(VarNode(1, ctx_len + 2), body)
+    return AbsNode("f", AbsNode("x", body))
+
+
+def left_spine(n: int, ctx_len: int) -> Node:
+    """((((w w) w) w) ... w)"""
+    node: Node = VarNode(0, ctx_len)
+    for _ in range(n):
+        node = AppNode(node, VarNode(0, ctx_len))
+    return node
+
+
+def right_spine(n: int, ctx_len: int) -> Node:
+    """id (id (... (id id)))"""
+    ident = AbsNode("y", VarNode(0, ctx_len + 1))
+    node: Node = ident
+    for _ in range(n):
+        node = AppNode(ident, node)
+    return node
+
+
+def binders(n: int, ctx_len: int) -> Node:
+    """lambda x. lambda x. ... w"""
+    node: Node = VarNode(n, ctx_len + n)
+    for _ in range(n):
+        node = AbsNode("x", node)
+    return node
+
+
+def size(node: Node) -> int:
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        match node:
+            case AbsNode(_, body):
+                stack.append(body)
+            case AppNode(c1, c2):
+                stack.extend((c1, c2))
+    return count
+
+
+def timed(name: str, fn, *args):
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()) as out:
+        result = fn(*args)
+    print(f"{name:>40}: {time.perf_counter() - start:8.3f}s")
+    return result, out.getvalue()
+
+
+def main(depth=200_000):
+    bindings = ["w"]
+    print(f"depth {depth}, recursion limit {sys.getrecursionlimit()}")
+
+    ident = AbsNode("z", VarNode(0, 2))
+    numeral = church_numeral(depth, 1)
+    # numeral applied to id reduces in one step to lambda x. id (id (... x))
+    res, _ = timed("eval church numeral applied to id", eval_node,
+                   AppNode(numeral, ident), bindings)
+    assert isinstance(res, AbsNode) and size(res) == 3 * depth + 2
+
+    timed("shift left spine", shift, left_spine(depth, 1), 1)
+    timed("subst left spine", subst, left_spine(depth, 1), 0, ident)
+    timed("shift binders", shift, binders(depth, 1), 2)
+    # the redex is at the bottom of the spine
+    timed("single step of right spine", eval_, right_spine(depth, 1), bindings)
+
+    big = AppNode(church_numeral(depth * 3, 1), numeral)
+    print(f"{size(big)} nodes")
+    timed("shift", shift, big, 1)
+    _, out = timed("pprint_tree", pprint_tree, big, bindings)
+    assert out.count("f") == 4 * depth + 2
+    _, out = timed("pprint_tree, 80 columns", lambda: pprint_tree(big, bindings, max_width=80))
+    assert len(out) == 83
+    _, out = timed("pprint_tree, 1000 nodes", lambda: pprint_tree(big, bindings, max_nodes=1000))
+
+    # every binder has a different name, so none of them is freshened
+    nested = VarNode(0, depth + 1)
+    for i in reversed(range(depth)):
+        nested = AbsNode(f"x{i}", nested)
+    timed("pprint_tree distinct binders", pprint_tree, nested, bindings)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,71 @@
+"""Scaling benchmark of the shared memory process pool runner.
+
+Evaluates a batch of independent Church arithmetic programs serially, on a
+pool that pickles every term to the workers and back, and with `run_pool`
+from 1 up to N workers. In the default "array" mode, it also times encoding
+the program store and evaluating the store in place serially:
+
+    python bench_shared.py [programs] [max workers] [mode]
+"""
+import multiprocessing as mp
+import os
+import random
+import sys
+import time
+
+import bench
+from parser import BindNode, parse
+from shared import ProgramStore, eval_in_place, evaluators, run_pool
+
+
+def make_programs(count: int, seed=0) -> list:
+    rng = random.Random(seed)
+    programs = []
+    for _ in range(count):
+        a, b = rng.randrange(1, 60), rng.randrange(1, 60)
+        body = f"(times {bench.church(a)}) {bench.church(b)}"
+        (cmd,) = [cmd for cmd in parse(bench.program(body)) if not isinstance(cmd, BindNode)]
+        programs.append((cmd, 0))
+    return programs
+
+
+def _pickled(args):
+    node, ctx_len, mode = args
+    return evaluators[mode](node, [None] * ctx_len)
+
+
+def timed(name: str, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    secs = time.perf_counter() - start
+    print(f"{name:>30}: {secs:8.3f}s")
+    return result, secs
+
+
+def main(count=2000, max_workers=os.cpu_count() or 1, mode="array"):
+    programs = make_programs(int(count))
+    max_workers = int(max_workers)
+    evaluate = evaluators[mode]
+    print(f"{len(programs)} programs, mode {mode}, {os.cpu_count()} cpus")
+
+    expected, serial = timed("serial", lambda: [evaluate(node, [None] * ctx_len)
+                                                for node, ctx_len in programs])
+    if mode == "array":
+        store, _ = timed("encoding store", ProgramStore, programs)
+        timed("in place, serial", lambda: [eval_in_place(store.arena, start)
+                                           for start, _, _ in store.table.tolist()])
+        store.close()
+    with mp.Pool(max_workers) as pool:
+        res, _ = timed(f"pickling pool, {max_workers} workers", pool.map, _pickled,
+                       [(node, ctx_len, mode) for node, ctx_len in programs], 64)
+    assert res == expected
+
+    counts = [2 ** i for i in range(max_workers.bit_length()) if 2 ** i < max_workers]
+    for workers in counts + [max_workers]:
+        res, secs = timed(f"shared, {workers} workers", run_pool, programs, mode, workers)
+        assert res == expected
+        print(f"{'speedup':>30}: {serial / secs:8.2f}x")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
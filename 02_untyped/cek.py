@@ -0,0 +1,143 @@
+"""CEK abstract machine for call-by-value evaluation of untyped terms.
+
+Instead of substituting the argument into the body on every beta step, the
+machine pairs each term with an environment holding the values of its bound
+variables. Nothing is substituted until the final result is read back into a
+`Node`, which gives the same term as the substitution based `eval_`.
+"""
+from dataclasses import dataclass
+from typing import NamedTuple, Optional
+
+from parser import AbsNode, AppNode, Node, VarNode
+
+
+@dataclass
+class Stats:
+    betas: int = 0
+
+
+class Env(NamedTuple):
+    """Persistent linked list of values, innermost binding first"""
+    val: "Closure"
+    next: Optional["Env"]
+
+
+class Closure(NamedTuple):
+    abs: AbsNode
+    env: Optional[Env]
+
+
+class ArgFrame(NamedTuple):
+    """Continuation: evaluate the argument `term` next"""
+    term: Node
+    env: Optional[Env]
+
+
+class FunFrame(NamedTuple):
+    """Continuation: apply `fun` to the value being computed"""
+    fun: Closure
+
+
+def lookup(env: Optional[Env], idx: int) -> tuple[Optional[Closure], int]:
+    """Find the value of variable idx in env.
+
+    Returns (None, remaining index) if idx is not bound by env.
+    """
+    while env is not None:
+        if idx == 0:
+            return env.val, 0
+        idx -= 1
+        env = env.next
+    return None, idx
+
+
+def read_back(node: Node, env: Optional[Env], ctx_len: int, depth: int = 0,
+              outer: int = 0) -> Node:
+    """Substitute the values from env into node
+
+    Uses an explicit stack instead of recursion, so the depth of the result
+    is not limited by the recursion limit.
+
+    ctx_len: Length of the context the result should live in
+    depth: Number of binders inside node that were passed so far
+    outer: Number of binders the result is placed under, which free
+        variables need to be shifted by
+    """
+    results: list[Node] = []
+    stack = [(node, env, ctx_len, depth, outer, False)]
+    while stack:
+        node, env, ctx_len, depth, outer, visited = stack.pop()
+        match node:
+            case VarNode(idx) if idx < depth:
+                results.append(VarNode(idx, ctx_len))
+            case VarNode(idx):
+                val, free_idx = lookup(env, idx - depth)
+                if val is None:
+                    results.append(VarNode(free_idx + depth + outer, ctx_len))
+                else:
+                    stack.append((val.abs, val.env, ctx_len, 0, outer + depth, False))
+            case AbsNode(orig_name, body):
+                if visited:
+                    results.append(AbsNode(orig_name, results.pop()))
+                else:
+                    stack.append((node, env, ctx_len, depth, outer, True))
+                    stack.append((body, env, ctx_len + 1, depth + 1, outer, False))
+            case AppNode(c1, c2):
+                if visited:
+                    arg = results.pop()
+                    results.append(AppNode(results.pop(), arg))
+                else:
+                    stack.append((node, env, ctx_len, depth, outer, True))
+                    stack.append((c2, env, ctx_len, depth, outer, False))
+                    stack.append((c1, env, ctx_len, depth, outer, False))
+            case _:
+                raise Exception("Unreachable")
+    return results.pop()
+
+
+def eval_cek(node: Node, bindings: list, stats: Optional[Stats] = None) -> Node:
+    """Evaluate node to the same normal form as repeatedly applying `eval_`
+
+    stats: Collects the number of beta reductions, which is the same as the
+        number of `eval_` steps
+    """
+    if stats is None:
+        stats = Stats()
+    ctx_len = len(bindings)
+    term, env = node, None
+    stack: list[ArgFrame | FunFrame] = []
+    while True:
+        # evaluate term in env
+        match term:
+            case AppNode(c1, c2):
+                stack.append(ArgFrame(c2, env))
+                term = c1
+                continue
+            case AbsNode():
+                val = Closure(term, env)
+            case VarNode(idx):
+                val, _ = lookup(env, idx)
+                if val is None:
+                    break  # free variable, no rule applies
+            case _:
+                raise Exception("Unreachable")
+
+        # continue with val
+        if not stack:
+            return read_back(val.abs, val.env, ctx_len)
+        frame = stack.pop()
+        if isinstance(frame, ArgFrame):
+            stack.append(FunFrame(val))
+            term, env = frame.term, frame.env
+        else:
+            stats.betas += 1
+            term, env = frame.fun.abs.body, Env(val, frame.fun.env)
+
+    # stuck: plug the stuck term back into its continuation
+    result = read_back(term, env, ctx_len)
+    for frame in reversed(stack):
+        if isinstance(frame, ArgFrame):
+            result = AppNode(result, read_back(frame.term, frame.env, ctx_len))
+        else:
+            result = AppNode(read_back(frame.fun.abs, frame.fun.env, ctx_len), result)
+    return result
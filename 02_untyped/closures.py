@@ -0,0 +1,208 @@
+"""Closure compiler for untyped terms.
+
+`compile_node` turns a `Node` into Python closures once, so that evaluating
+it doesn't have to match on the term again: a variable becomes a read from
+the environment at a fixed depth, and an abstraction becomes a closure that
+builds a `Fun` value. Applications become `App` records, which `run_code`
+evaluates on an explicit continuation stack like the CEK machine, so neither
+compiling nor running a term is limited by the recursion limit.
+
+The evaluation order is the same call-by-value order as `eval_`. Reaching a
+free variable raises `Stuck`, and the pending applications on the stack are
+plugged back around it, so that the result is the same as with `eval_`.
+"""
+from typing import Callable, Optional, Union
+
+from parser import AbsNode, AppNode, Node, VarNode
+
+# environments are linked tuples (innermost value, rest)
+Env = Optional[tuple["Fun", "Env"]]
+Code = Union[Callable[[Env], "Fun"], "App"]
+
+
+class Fun:
+    """Value of an abstraction: its node, environment and compiled body"""
+    __slots__ = ("abs", "env", "body")
+
+    def __init__(self, abs: AbsNode, env: Env, body: Code) -> None:
+        self.abs = abs
+        self.env = env
+        self.body = body
+
+
+class Stuck(Exception):
+    """Raised when no rule applies, with the term evaluated so far"""
+
+    def __init__(self, term: Node) -> None:
+        self.term = term
+
+
+class App:
+    """Compiled application, whose operands are evaluated by `run_code`"""
+    __slots__ = ("node", "fun", "arg")
+
+    def __init__(self, node: AppNode, fun: Code, arg: Code) -> None:
+        self.node = node
+        self.fun = fun
+        self.arg = arg
+
+
+def read_back(node: Node, env: Env, ctx_len: int, depth: int = 0, outer: int = 0) -> Node:
+    """Substitute the values from env into node
+
+    Uses an explicit stack instead of recursion, so the depth of the result
+    is not limited by the recursion limit.
+
+    ctx_len: Length of the context the result should live in
+    depth: Number of binders inside node that were passed so far
+    outer: Number of binders the result is placed under, which free
+        variables need to be shifted by
+    """
+    results: list[Node] = []
+    stack = [(node, env, ctx_len, depth, outer, False)]
+    while stack:
+        node, env, ctx_len, depth, outer, visited = stack.pop()
+        match node:
+            case VarNode(idx) if idx < depth:
+                results.append(VarNode(idx, ctx_len))
+            case VarNode(idx):
+                idx -= depth
+                while env is not None and idx:
+                    env, idx = env[1], idx - 1
+                if env is None:
+                    results.append(VarNode(idx + depth + outer, ctx_len))
+                else:
+                    val = env[0]
+                    stack.append((val.abs, val.env, ctx_len, 0, outer + depth, False))
+            case AbsNode(orig_name, body):
+                if visited:
+                    results.append(AbsNode(orig_name, results.pop()))
+                else:
+                    stack.append((node, env, ctx_len, depth, outer, True))
+                    stack.append((body, env, ctx_len + 1, depth + 1, outer, False))
+            case AppNode(c1, c2):
+                if visited:
+                    arg = results.pop()
+                    results.append(AppNode(results.pop(), arg))
+                else:
+                    stack.append((node, env, ctx_len, depth, outer, True))
+                    stack.append((c2, env, ctx_len, depth, outer, False))
+                    stack.append((c1, env, ctx_len, depth, outer, False))
+            case _:
+                raise Exception("Unreachable")
+    return results.pop()
+
+
+def _compile_var(idx: int, ctx_len: int, depth: int) -> Code:
+    if idx >= depth:
+        free = VarNode(idx - depth, ctx_len)
+
+        def var(env: Env) -> Fun:
+            raise Stuck(free)
+    elif idx == 0:
+        def var(env):
+            return env[0]  # type: ignore
+    elif idx == 1:
+        def var(env):
+            return env[1][0]  # type: ignore
+    else:
+        def var(env):
+            for _ in range(idx):
+                env = env[1]  # type: ignore
+            return env[0]  # type: ignore
+    return var
+
+
+def _compile_abs(node: AbsNode, body_code: Code) -> Code:
+    def abs_(env: Env) -> Fun:
+        return Fun(node, env, body_code)
+    return abs_
+
+
+def compile_node(node: Node, ctx_len: int, depth: int = 0) -> Code:
+    """Compile node into code computing its value from its environment
+
+    Uses an explicit stack instead of recursion, so the depth of node is not
+    limited by the recursion limit.
+
+    ctx_len: Length of the context outside of node
+    depth: Number of binders around node, which the environment will hold
+    """
+    codes: list[Code] = []
+    stack: list[tuple[Node, int, bool]] = [(node, depth, False)]
+    while stack:
+        node, depth, visited = stack.pop()
+        match node:
+            case VarNode(idx):
+                codes.append(_compile_var(idx, ctx_len, depth))
+            case AbsNode(_, body):
+                if visited:
+                    codes.append(_compile_abs(node, codes.pop()))
+                else:
+                    stack.append((node, depth, True))
+                    stack.append((body, depth + 1, False))
+            case AppNode(c1, c2):
+                if visited:
+                    arg = codes.pop()
+                    codes.append(App(node, codes.pop(), arg))
+                else:
+                    stack.append((node, depth, True))
+                    stack.append((c2, depth, False))
+                    stack.append((c1, depth, False))
+            case _:
+                raise Exception("Unreachable")
+    return codes.pop()
+
+
+def run_code(code: Code, ctx_len: int, env: Env = None) -> Fun:
+    """Value of code in env
+
+    The pending applications are kept on an explicit stack of
+    (app, env, fun) frames: fun is None while the operator of app is being
+    evaluated, and its value while the operand is. Applying a function
+    replaces the current code, so the stack only grows with the nesting of
+    applications that are still waiting for their operands, never with the
+    number of beta steps.
+
+    Raises `Stuck` with the whole term if no rule applies.
+    """
+    stack: list[tuple[App, Env, Optional[Fun]]] = []
+    while True:
+        while type(code) is App:
+            stack.append((code, env, None))
+            code = code.fun
+        try:
+            val = code(env)  # type: ignore
+        except Stuck as e:
+            raise Stuck(_plug(e.term, stack, ctx_len)) from None
+        if not stack:
+            return val
+        app, env, fun = stack.pop()
+        if fun is None:
+            stack.append((app, env, val))
+            code = app.arg
+        else:
+            # a stuck body replaces the whole redex, so the frame is dropped
+            code, env = fun.body, (val, fun.env)
+
+
+def _plug(term: Node, stack: list[tuple[App, Env, Optional[Fun]]], ctx_len: int) -> Node:
+    """Put the stuck term back into the applications waiting on stack"""
+    for app, env, fun in reversed(stack):
+        if fun is None:
+            term = AppNode(term, read_back(app.node.child2, env, ctx_len))
+        else:
+            term = AppNode(read_back(fun.abs, fun.env, ctx_len), term)
+    return term
+
+
+def eval_compiled(node: Node, bindings: list) -> Node:
+    """Evaluate node to the same normal form as `eval_node`, by compiling it
+    to Python closures.
+    """
+    ctx_len = len(bindings)
+    try:
+        val = run_code(compile_node(node, ctx_len), ctx_len)
+    except Stuck as e:
+        return e.term
+    return read_back(val.abs, val.env, ctx_len)
@@ -0,0 +1,245 @@
+"""Hash-consed untyped terms.
+
+A `HashConsTable` makes sure there is only ever a single live object for each
+distinct term, so identical subterms are shared and can be compared with `is`.
+The table only holds weak references, so terms that are no longer in use are
+evicted automatically.
+
+Interned nodes don't track `ctx_len`, since that would make the same term at
+different depths distinct. Use `HashConsTable.export` to turn them back into
+plain nodes for `pprint_tree`.
+"""
+import weakref
+from typing import Optional
+
+from parser import AbsNode, AppNode, Node, VarNode
+
+# number of `shift` results cached per node, so that a long lived node doesn't
+# keep an entry for every (d, c) it was ever shifted by
+MAX_SHIFTS = 8
+
+
+class _Interned:
+    """Mixin for interned nodes: equality is identity
+
+    free: One more than the largest free de Bruijn index, 0 if closed
+    shifts: Weak cache of at most `MAX_SHIFTS` `shift` results, keyed on (d, c)
+    """
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+    free: int
+    shifts: dict[tuple[int, int], weakref.ref]
+
+
+class IVarNode(_Interned, VarNode):
+    pass
+
+
+class IAbsNode(_Interned, AbsNode):
+    pass
+
+
+class IAppNode(_Interned, AppNode):
+    pass
+
+
+class HashConsTable:
+    def __init__(self) -> None:
+        self._nodes: weakref.WeakValueDictionary[tuple, Node] = weakref.WeakValueDictionary()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        """Number of live interned nodes"""
+        return len(self._nodes)
+
+    def _get(self, key: tuple) -> Optional[Node]:
+        node = self._nodes.get(key)
+        if node is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return node
+
+    def _add(self, key: tuple, node, free: int):
+        node.free = free
+        node.shifts = {}
+        self._nodes[key] = node
+        return node
+
+    # children are interned before their parents, so their ids are stable
+    # for as long as the parent is alive
+    def var(self, idx: int) -> IVarNode:
+        key = ("var", idx)
+        return self._get(key) or self._add(key, IVarNode(idx), idx + 1)  # type: ignore
+
+    def abs(self, orig_name: str, body: Node) -> IAbsNode:
+        key = ("abs", orig_name, id(body))
+        return self._get(key) or self._add(
+            key, IAbsNode(orig_name, body), max(body.free - 1, 0))  # type: ignore
+
+    def app(self, c1: Node, c2: Node) -> IAppNode:
+        key = ("app", id(c1), id(c2))
+        return self._get(key) or self._add(
+            key, IAppNode(c1, c2), max(c1.free, c2.free))  # type: ignore
+
+    def _rebuild(self, node: Node, c: int, visit, make_abs, make_app, done=None) -> Node:
+        """Rebuild node bottom up with an explicit stack, like `run.node_map`
+
+        visit: Called as visit(node, c) before the children of node are walked.
+            Returns the result for node if it is already known, which it must
+            be for a VarNode, or None to rebuild node from its children.
+        make_abs, make_app: Constructors for the rebuilt nodes
+        done: Optional done(node, c, res) called on each rebuilt node
+        c: Cutoff param, incremented under each abstraction
+        """
+        results: list[Node] = []
+        stack: list[tuple[Node, int, bool]] = [(node, c, False)]
+        while stack:
+            node, c, visited = stack.pop()
+            if not visited:
+                res = visit(node, c)
+                if res is not None:
+                    results.append(res)
+                    continue
+                stack.append((node, c, True))
+                match node:
+                    case AbsNode(_, body):
+                        stack.append((body, c + 1, False))
+                    case AppNode(c1, c2):
+                        stack.append((c2, c, False))
+                        stack.append((c1, c, False))
+                    case _:
+                        raise Exception("Unreachable")
+                continue
+            match node:
+                case AbsNode(orig_name):
+                    res = make_abs(orig_name, results.pop())
+                case _:
+                    c2 = results.pop()
+                    res = make_app(results.pop(), c2)
+            if done is not None:
+                done(node, c, res)
+            results.append(res)
+        return results.pop()
+
+    def intern(self, node: Node) -> Node:
+        """Return the interned version of a plain node"""
+        def visit(node: Node, c: int) -> Optional[Node]:
+            match node:
+                case _Interned():
+                    return node
+                case VarNode(idx):
+                    return self.var(idx)
+            return None
+
+        return self._rebuild(node, 0, visit, self.abs, self.app)
+
+    def export(self, node: Node, ctx_len: int) -> Node:
+        """Convert an interned node to plain nodes living in a context of ctx_len"""
+        memo: dict[tuple[int, int], Node] = {}
+
+        def visit(node: Node, ctx_len: int) -> Optional[Node]:
+            if isinstance(node, VarNode):
+                return VarNode(node.idx, ctx_len)
+            return memo.get((id(node), ctx_len))
+
+        def done(node: Node, ctx_len: int, res: Node):
+            memo[(id(node), ctx_len)] = res
+
+        return self._rebuild(node, ctx_len, visit, AbsNode, AppNode, done)
+
+    def shift(self, node, d: int, c: int = 0) -> Node:
+        """Shift the terms in node by d, reusing previous results
+        d: Shift value
+        c: Cutoff param
+        """
+        if d == 0:
+            return node
+
+        def visit(node, c: int) -> Optional[Node]:
+            if node.free <= c:
+                return node  # no free variables to shift
+            ref = node.shifts.get((d, c))
+            res = ref() if ref is not None else None
+            if res is None and isinstance(node, VarNode):
+                res = self.var(node.idx + d)
+                _remember_shift(node, (d, c), res)
+            return res
+
+        def done(node, c: int, res: Node):
+            _remember_shift(node, (d, c), res)
+
+        return self._rebuild(node, c, visit, self.abs, self.app, done)
+
+    def subst(self, node: Node, j: int, s: Node) -> Node:
+        """Substitute j with s in node
+        j: Orig val
+        s: Substitution
+        """
+        memo: dict[tuple[int, int], Node] = {}
+
+        def visit(node, c: int) -> Optional[Node]:
+            if node.free <= j + c:
+                return node  # j doesn't occur in node
+            if isinstance(node, VarNode):
+                return self.shift(s, c) if node.idx == j + c else node
+            return memo.get((id(node), c))
+
+        def done(node: Node, c: int, res: Node):
+            memo[(id(node), c)] = res
+
+        return self._rebuild(node, 0, visit, self.abs, self.app, done)
+
+    def subst_top(self, s: Node, node: Node) -> Node:
+        return self.shift(self.subst(node, 0, self.shift(s, 1)), -1)
+
+
+def _remember_shift(node, key: tuple[int, int], res: Node):
+    """Cache res as the shift of node by key, evicting dead and then the
+    oldest entries once there are `MAX_SHIFTS` of them"""
+    shifts = node.shifts
+    if len(shifts) >= MAX_SHIFTS:
+        for dead in [k for k, ref in shifts.items() if ref() is None]:
+            del shifts[dead]
+        if len(shifts) >= MAX_SHIFTS:
+            del shifts[next(iter(shifts))]
+    shifts[key] = weakref.ref(res)
+
+
+table = HashConsTable()
+
+
+def eval_hashcons(node: Node, bindings: list, table: HashConsTable = table) -> Node:
+    """Evaluate node like `eval_node`, but on hash-consed terms
+
+    Returns plain nodes, ready for `pprint_tree`.
+    """
+    from run import NoRuleApplies
+
+    def step(node: Node) -> Node:
+        """Single step, walking down to the redex iteratively like `run.eval_`"""
+        path: list[AppNode] = []
+        while True:
+            match node:
+                case AppNode(AbsNode(_, body), AbsNode() as c2):
+                    node = table.subst_top(c2, body)
+                    break
+                case AppNode(c1, c2):
+                    path.append(node)
+                    node = c2 if isinstance(c1, AbsNode) else c1
+                case _:
+                    raise NoRuleApplies
+        for parent in reversed(path):
+            if isinstance(parent.child1, AbsNode):
+                node = table.app(parent.child1, node)
+            else:
+                node = table.app(node, parent.child2)
+        return node
+
+    node = table.intern(node)
+    while True:
+        try:
+            node = step(node)
+        except NoRuleApplies:
+            return table.export(node, len(bindings))
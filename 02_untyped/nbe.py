@@ -0,0 +1,382 @@
+"""Normalization by evaluation for untyped terms.
+
+Terms are evaluated into a semantic domain where abstractions are Python
+closures (`Lam`) and terms stuck on a variable are `Neutral`. Variables in the
+semantic domain are identified by their de Bruijn level, which doesn't change
+when going under binders. Reading a value back, including under binders,
+gives its full beta normal form.
+
+Arguments are evaluated lazily, so that reduction happens in normal order and
+every term that has a normal form is normalized.
+
+Compiling, evaluating, reading back and comparing values all use explicit
+stacks, so none of them is limited by the recursion limit. Natives from a
+`hook` are plain Python functions though, which raise `TooDeep` when they
+recurse too deeply, instead of raising the recursion limit, which overflows
+the C stack on Python 3.10.
+"""
+import abc
+import sys
+from contextlib import contextmanager
+from typing import Callable, Optional, Union
+
+from parser import AbsNode, AppNode, Node, VarNode
+
+
+class Lam:
+    __slots__ = ("name", "fn")
+
+    def __init__(self, name: str, fn: Callable[["Thunk | Value"], "Value"]) -> None:
+        self.name = name
+        self.fn = fn
+
+
+class Closure(Lam):
+    """Compiled abstraction, whose body `run` enters without calling fn"""
+    __slots__ = ("body", "env")
+
+    def __init__(self, name: str, body: "Code", env: "Env") -> None:
+        super().__init__(name, lambda arg: run(body, (arg, env)))
+        self.body = body
+        self.env = env
+
+
+class Native(Lam, abc.ABC):
+    """Abstraction whose normal form can be rebuilt without applying it"""
+    __slots__ = ()
+
+    @abc.abstractmethod
+    def rebuild(self, level: int) -> Node:
+        """Normal form of the abstraction, with level variables in scope"""
+
+
+class Neutral:
+    __slots__ = ()
+
+
+class NVar(Neutral):
+    __slots__ = ("lvl",)
+
+    def __init__(self, lvl: int) -> None:
+        self.lvl = lvl
+
+
+class NApp(Neutral):
+    __slots__ = ("fn", "arg")
+
+    def __init__(self, fn: Neutral, arg: "Thunk | Value") -> None:
+        self.fn = fn
+        self.arg = arg
+
+
+class Var:
+    """Compiled variable, whose thunk `run` forces"""
+    __slots__ = ("idx", "node")
+
+    def __init__(self, idx: int) -> None:
+        self.idx = idx
+
+
+class App:
+    """Compiled application, whose operator `run` evaluates"""
+    __slots__ = ("fun", "arg", "node")
+
+    def __init__(self, fun: "Code", arg: "Code") -> None:
+        self.fun = fun
+        self.arg = arg
+
+
+Value = Union[Lam, Neutral]
+Env = Optional[tuple["Thunk | Value", "Env"]]
+Code = Union[Callable[[Env], Value], Var, App]
+Hook = Callable[[Node, int], Optional[Code]]
+
+
+class Thunk:
+    """Argument that is evaluated at most once, when first needed"""
+    __slots__ = ("code", "env", "value")
+
+    def __init__(self, code: Code, env: Env) -> None:
+        self.code = code
+        self.env = env
+        self.value: Optional[Value] = None
+
+    def force(self) -> Value:
+        if self.value is None:
+            self.value = run(self.code, self.env)
+            self.env = None
+        return self.value
+
+
+class _Update:
+    """Frame of `run` waiting for the value of thunk"""
+    __slots__ = ("thunk",)
+
+    def __init__(self, thunk: Thunk) -> None:
+        self.thunk = thunk
+
+
+def force(val: "Thunk | Value") -> Value:
+    return val.force() if isinstance(val, Thunk) else val
+
+
+def apply(fn: Value, arg: "Thunk | Value") -> Value:
+    if isinstance(fn, Lam):
+        return fn.fn(arg)
+    return NApp(fn, arg)
+
+
+class TooDeep(RecursionError):
+    """Raised when natives from a hook need more of the Python stack than the
+    recursion limit allows"""
+
+
+@contextmanager
+def python_stack():
+    """Turn a RecursionError inside the `with` block into `TooDeep`"""
+    try:
+        yield
+    except RecursionError:
+        raise TooDeep("Term is too deeply nested to evaluate within the recursion "
+                      f"limit of {sys.getrecursionlimit()}") from None
+
+
+def run(code: Code, env: Env) -> Value:
+    """Value of code in env, in weak head normal form
+
+    Works like a lazy Krivine machine: an `App` pushes its operand as a thunk
+    and continues with its operator, a `Var` whose thunk isn't forced yet
+    pushes an `_Update` frame and continues with the thunk's code, and a
+    `Closure` pops an argument and continues with its body. So neither deep
+    applications nor long chains of thunks use the Python stack. Only other
+    abstractions, which are Python functions, are called.
+    """
+    stack: list["Thunk | _Update"] = []
+    push, pop = stack.append, stack.pop
+    while True:
+        kind = type(code)
+        if kind is App:
+            push(Thunk(code.arg, env))  # type: ignore
+            code = code.fun  # type: ignore
+            continue
+        if kind is Var:
+            for _ in range(code.idx):  # type: ignore
+                env = env[1]  # type: ignore
+            val = env[0]  # type: ignore
+            if type(val) is Thunk:
+                if val.value is None:
+                    push(_Update(val))
+                    code, env = val.code, val.env
+                    continue
+                val = val.value
+        else:
+            val = code(env)  # type: ignore
+        while stack:
+            frame = pop()
+            if type(frame) is _Update:
+                frame.thunk.value = val
+                frame.thunk.env = None
+            elif type(val) is Closure:
+                code, env = val.body, (frame, val.env)
+                break
+            elif isinstance(val, Lam):
+                val = val.fn(frame)
+            else:
+                val = NApp(val, frame)  # type: ignore
+        else:
+            return val  # type: ignore
+
+
+def compile_node(node: Node, depth: int = 0, hook: Optional[Hook] = None) -> Code:
+    """Compile node into code computing its value from its environment, for `run`
+
+    Uses an explicit stack instead of recursion, so the depth of node is not
+    limited by the recursion limit.
+
+    hook: Called first on every node, to compile it differently by returning
+        a code. Codes compiled with a hook keep their node as `code.node`.
+    """
+    codes: list[Code] = []
+    stack: list[tuple[Node, int, bool]] = [(node, depth, False)]
+    while stack:
+        node, depth, visited = stack.pop()
+        if visited:
+            match node:
+                case AbsNode(orig_name):
+                    code = _compile_abs(orig_name, codes.pop())
+                case _:
+                    code2 = codes.pop()
+                    code = App(codes.pop(), code2)
+        else:
+            code = hook(node, depth) if hook is not None else None
+            if code is None:
+                match node:
+                    case VarNode(idx):
+                        code = Var(idx)
+                    case AbsNode(_, body):
+                        stack.append((node, depth, True))
+                        stack.append((body, depth + 1, False))
+                        continue
+                    case AppNode(c1, c2):
+                        stack.append((node, depth, True))
+                        stack.append((c2, depth, False))
+                        stack.append((c1, depth, False))
+                        continue
+                    case _:
+                        raise Exception("Unreachable")
+        if hook is not None:
+            code.node = node  # type: ignore
+        codes.append(code)
+    return codes.pop()
+
+
+def _compile_abs(orig_name: str, body_code: Code) -> Code:
+    def abs_(env: Env) -> Value:
+        return Closure(orig_name, body_code, env)
+    return abs_
+
+
+def evaluate(node: Node, ctx_len: int, hook: Optional[Hook] = None) -> Value:
+    """Evaluate node in a context of ctx_len free variables"""
+    env: Env = None
+    for lvl in range(ctx_len):
+        env = (NVar(lvl), env)
+    return run(compile_node(node, hook=hook), env)
+
+
+def read_back(val: Value, level: int, eta=False) -> Node:
+    """Read back the beta normal form of val
+
+    Uses explicit stacks instead of recursion, which forces the arguments in
+    the same order as reading back recursively would.
+
+    level: Number of variables in scope, including the context
+    eta: Also eta-reduce `lambda x. f x` to f, when x is not free in f
+    """
+    # free de Bruijn levels of each node as a bitmask, only needed for eta
+    free: dict[int, int] = {}
+
+    def lower(node: Node) -> Node:
+        """Shift the terms in node by -1, keeping track of their free levels.
+
+        Levels don't change when moving node out of a binder, so the free
+        levels of the original nodes stay valid.
+        """
+        results: list[Node] = []
+        stack: list[tuple[Node, int, bool]] = [(node, 0, False)]
+        while stack:
+            node, c, visited = stack.pop()
+            match node:
+                case VarNode(idx, ctx_len):
+                    res: Node = VarNode(idx - 1 if idx >= c else idx, ctx_len - 1)
+                case AbsNode(orig_name) if visited:
+                    res = AbsNode(orig_name, results.pop())
+                case AbsNode(_, body):
+                    stack.append((node, c, True))
+                    stack.append((body, c + 1, False))
+                    continue
+                case AppNode() if visited:
+                    arg = results.pop()
+                    res = AppNode(results.pop(), arg)
+                case AppNode(c1, c2):
+                    stack.append((node, c, True))
+                    stack.append((c2, c, False))
+                    stack.append((c1, c, False))
+                    continue
+                case _:
+                    raise Exception("Unreachable")
+            free[id(res)] = free[id(node)]
+            results.append(res)
+        return results.pop()
+
+    results: list[Node] = []
+    # a frame with a value reads it back, ("abs", name, level) and ("app",)
+    # build a node from the last results, and ("force", arg) reads back arg
+    stack: list = [(val, level)]
+    while stack:
+        frame = stack.pop()
+        match frame:
+            case ("abs", name, level):
+                body = results.pop()
+                match body:
+                    case AppNode(f, VarNode(0)) if eta and not free[id(f)] >> level & 1:
+                        results.append(lower(f))
+                        continue
+                node: Node = AbsNode(name, body)
+                if eta:
+                    free[id(node)] = free[id(body)] & ~(1 << level)
+            case ("app",):
+                c2 = results.pop()
+                node = AppNode(results.pop(), c2)
+                if eta:
+                    free[id(node)] = free[id(node.child1)] | free[id(c2)]
+            case ("force", arg, level):
+                stack.append((force(arg), level))
+                continue
+            case (Native() as val, level) if not eta:
+                node = val.rebuild(level)
+            case (Lam(name=name, fn=fn), level):
+                stack.append(("abs", name, level))
+                stack.append((fn(NVar(level)), level + 1))
+                continue
+            case (NVar(lvl=lvl), level):
+                node = VarNode(level - 1 - lvl, level)
+                if eta:
+                    free[id(node)] = 1 << lvl
+            case (NApp(fn=fn, arg=arg), level):
+                stack.append(("app",))
+                stack.append(("force", arg, level))
+                stack.append((fn, level))
+                continue
+            case _:
+                raise Exception("Unreachable")
+        results.append(node)
+    return results.pop()
+
+
+def normalize(node: Node, bindings: list, eta=False, hook: Optional[Hook] = None) -> Node:
+    """Full beta (or beta-eta) normal form of node
+
+    hook: Passed on to `compile_node`
+    """
+    with python_stack():
+        return read_back(evaluate(node, len(bindings), hook), len(bindings), eta)
+
+
+def conv(val1: Value, val2: Value, level: int, eta=False) -> bool:
+    """Check if two values have the same normal form, up to names of binders.
+
+    Compares the values directly and stops at the first difference, without
+    reading back either of them. Uses an explicit stack of the pairs left to
+    compare, whose arguments are only forced once they are compared.
+    """
+    stack: list[tuple["Thunk | Value", "Thunk | Value", int]] = [(val1, val2, level)]
+    while stack:
+        val1, val2, level = stack.pop()
+        val1, val2 = force(val1), force(val2)
+        match val1, val2:
+            case Lam(), Lam():
+                var = NVar(level)
+                stack.append((val1.fn(var), val2.fn(var), level + 1))
+            case Lam(), Neutral() if eta:
+                var = NVar(level)
+                stack.append((val1.fn(var), NApp(val2, var), level + 1))
+            case Neutral(), Lam() if eta:
+                var = NVar(level)
+                stack.append((NApp(val1, var), val2.fn(var), level + 1))
+            case NVar(lvl=lvl1), NVar(lvl=lvl2):
+                if lvl1 != lvl2:
+                    return False
+            case NApp(), NApp():
+                stack.append((val1.arg, val2.arg, level))
+                stack.append((val1.fn, val2.fn, level))
+            case _:
+                return False
+    return True
+
+
+def nf_equal(node1: Node, node2: Node, bindings: list, eta=False) -> bool:
+    """Check if node1 and node2 have the same normal form"""
+    ctx_len = len(bindings)
+    with python_stack():
+        return conv(evaluate(node1, ctx_len), evaluate(node2, ctx_len), ctx_len, eta)
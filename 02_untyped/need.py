@@ -0,0 +1,206 @@
+"""Call-by-need evaluation of untyped terms by graph reduction.
+
+Every argument becomes a `Thunk`, a shared cell holding the argument term
+together with its environment. The first time a variable bound to the thunk
+is needed, the thunk is evaluated and its value written back into the cell,
+so all other occurrences reuse it instead of reducing the argument again.
+
+Note that this is lazy evaluation, unlike the call-by-value `eval_`:
+arguments that are never used are never evaluated.
+"""
+from dataclasses import dataclass
+from typing import NamedTuple, Optional
+
+from parser import AbsNode, AppNode, BindNode, Node, VarNode, parse
+
+
+class Env(NamedTuple):
+    """Persistent linked list of thunks, innermost binding first"""
+    val: "Thunk"
+    next: Optional["Env"]
+
+
+class Closure(NamedTuple):
+    abs: AbsNode
+    env: Optional[Env]
+
+
+@dataclass
+class Thunk:
+    term: Node
+    env: Optional[Env]
+    value: Optional[Closure] = None
+
+
+class ArgFrame(NamedTuple):
+    """Continuation: apply the value being computed to `arg`"""
+    arg: Thunk
+
+
+class UpdateFrame(NamedTuple):
+    """Continuation: write the value being computed back into `thunk`"""
+    thunk: Thunk
+
+
+@dataclass
+class Stats:
+    betas: int = 0
+    thunks_forced: int = 0
+    thunks_reused: int = 0
+
+
+def lookup(env: Optional[Env], idx: int) -> tuple[Optional[Thunk], int]:
+    """Find the thunk of variable idx in env.
+
+    Returns (None, remaining index) if idx is not bound by env.
+    """
+    while env is not None:
+        if idx == 0:
+            return env.val, 0
+        idx -= 1
+        env = env.next
+    return None, idx
+
+
+def read_back(node: Node, env: Optional[Env], ctx_len: int, depth: int = 0,
+              outer: int = 0) -> Node:
+    """Substitute the thunks from env into node, using their values where
+    they have already been evaluated.
+
+    Uses an explicit stack instead of recursion, so the depth of the result
+    is not limited by the recursion limit.
+
+    ctx_len: Length of the context the result should live in
+    depth: Number of binders inside node that were passed so far
+    outer: Number of binders the result is placed under, which free
+        variables need to be shifted by
+    """
+    results: list[Node] = []
+    stack = [(node, env, ctx_len, depth, outer, False)]
+    while stack:
+        node, env, ctx_len, depth, outer, visited = stack.pop()
+        match node:
+            case VarNode(idx) if idx < depth:
+                results.append(VarNode(idx, ctx_len))
+            case VarNode(idx):
+                thunk, free_idx = lookup(env, idx - depth)
+                if thunk is None:
+                    results.append(VarNode(free_idx + depth + outer, ctx_len))
+                elif thunk.value is not None:
+                    stack.append((thunk.value.abs, thunk.value.env, ctx_len, 0, outer + depth,
+                                  False))
+                else:
+                    stack.append((thunk.term, thunk.env, ctx_len, 0, outer + depth, False))
+            case AbsNode(orig_name, body):
+                if visited:
+                    results.append(AbsNode(orig_name, results.pop()))
+                else:
+                    stack.append((node, env, ctx_len, depth, outer, True))
+                    stack.append((body, env, ctx_len + 1, depth + 1, outer, False))
+            case AppNode(c1, c2):
+                if visited:
+                    arg = results.pop()
+                    results.append(AppNode(results.pop(), arg))
+                else:
+                    stack.append((node, env, ctx_len, depth, outer, True))
+                    stack.append((c2, env, ctx_len, depth, outer, False))
+                    stack.append((c1, env, ctx_len, depth, outer, False))
+            case _:
+                raise Exception("Unreachable")
+    return results.pop()
+
+
+def eval_need(node: Node, bindings: list, share=True, stats: Optional[Stats] = None) -> Node:
+    """Evaluate node lazily to weak head normal form
+
+    share: Write the values of evaluated thunks back, giving call-by-need.
+        Without it, each use evaluates the argument again (call-by-name).
+    stats: Collects the number of reductions, if given
+    """
+    if stats is None:
+        stats = Stats()
+    ctx_len = len(bindings)
+    term, env = node, None
+    stack: list[ArgFrame | UpdateFrame] = []
+    while True:
+        # evaluate term in env
+        match term:
+            case AppNode(c1, c2):
+                stack.append(ArgFrame(Thunk(c2, env)))
+                term = c1
+                continue
+            case VarNode(idx):
+                thunk, _ = lookup(env, idx)
+                if thunk is None:
+                    break  # free variable, no rule applies
+                if thunk.value is not None:
+                    stats.thunks_reused += 1
+                    val = thunk.value
+                else:
+                    stats.thunks_forced += 1
+                    if share:
+                        stack.append(UpdateFrame(thunk))
+                    term, env = thunk.term, thunk.env
+                    continue
+            case AbsNode():
+                val = Closure(term, env)
+            case _:
+                raise Exception("Unreachable")
+
+        # continue with val
+        while stack and isinstance(stack[-1], UpdateFrame):
+            stack.pop().thunk.value = val
+        if not stack:
+            return read_back(val.abs, val.env, ctx_len)
+        stats.betas += 1
+        arg = stack.pop().arg
+        term, env = val.abs.body, Env(arg, val.env)
+
+    # stuck: plug the stuck term back into its continuation
+    result = read_back(term, env, ctx_len)
+    for frame in reversed(stack):
+        if isinstance(frame, ArgFrame):
+            result = AppNode(result, read_back(frame.arg.term, frame.arg.env, ctx_len))
+    return result
+
+
+def sharing_report(node: Node, bindings: list) -> dict[str, int]:
+    """Number of beta reductions needed for node by call-by-need, call-by-name
+    and call-by-value, and the reductions saved by sharing
+    """
+    from run import NoRuleApplies, eval_
+
+    need, name = Stats(), Stats()
+    eval_need(node, bindings, share=True, stats=need)
+    eval_need(node, bindings, share=False, stats=name)
+    value = 0
+    while True:
+        try:
+            node = eval_(node, bindings)
+        except NoRuleApplies:
+            break
+        value += 1
+    return {"need": need.betas, "name": name.betas, "value": value,
+            "saved": name.betas - need.betas}
+
+
+def main():
+    from run import pprint_tree
+
+    inp = """
+        w/;
+        (lambda x. x x x) ((lambda y. y) (lambda z. z));
+        (lambda n. n n n n) ((lambda f. lambda x. f (f x)) (lambda g. g));
+        (lambda x. w x x) ((lambda y. y) (lambda z. z));
+    """
+    bindings = []
+    for cmd in parse(inp):
+        if isinstance(cmd, BindNode):
+            bindings.append(cmd.name)
+            continue
+        pprint_tree(eval_need(cmd, bindings), bindings, end="\n")
+        print(sharing_report(cmd, bindings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+"""Experimental optimal reduction of untyped terms with interaction nets.
+
+This is Lamping's abstract algorithm, without the bookkeeping oracle: a term
+is translated to a net of binary nodes, where abstractions and applications
+are the same kind of node, and every extra use of a variable adds a fan with a
+fresh label. Sharing is never undone, so work on a duplicated term is done
+once for all of its copies.
+
+Without the oracle, fans that should be told apart by their level can meet
+and annihilate wrongly, so the normal form is only guaranteed for terms in
+the elementary affine subset, which includes Church arithmetic. Outside of
+it, like for the self-application `2 2` of a Church numeral, reading back may
+not find a consistent path, which raises `ReadBackError`, or loop until the
+budget is exhausted. All active pairs are reduced, so terms that aren't
+strongly normalizing also run until the interaction budget is exhausted.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+from parser import AbsNode, AppNode, Node, VarNode
+
+# kinds of nodes, fans have their label as kind, starting from 1
+CON, FREE, ERA, ROOT = 0, -1, -2, -3
+
+
+@dataclass
+class Stats:
+    betas: int = 0
+    annihilations: int = 0
+    commutations: int = 0
+    erasures: int = 0
+    # fans crossed while reading back
+    crossings: int = 0
+
+    @property
+    def interactions(self):
+        return self.betas + self.annihilations + self.commutations + self.erasures
+
+
+class OutOfBudget(Exception):
+    """Raised when reduction takes more interactions than the budget"""
+
+    def __init__(self, stats: Stats) -> None:
+        super().__init__(f"Out of budget after {stats.interactions} interactions")
+        self.stats = stats
+
+
+class ReadBackError(Exception):
+    """Raised when a path leaves a fan through its principal port without
+    having entered it, which can happen for terms that need the oracle"""
+
+
+class Net:
+    """Nodes with three ports each, stored in flat lists
+
+    Port p is slot p % 3 of node p // 3, and slot 0 is the principal port.
+    For a CON node used as an abstraction, slot 1 is the variable and slot 2
+    the body. As an application, slot 0 is the function, 1 the argument and 2
+    the result.
+
+    kind: Kind of each node
+    ports: Port that each port is linked to
+    data: Name of an abstraction, or level of a free variable
+    """
+
+    def __init__(self) -> None:
+        self.kind: list[int] = []
+        self.ports: list[int] = []
+        self.data: list = []
+        self.free: list[int] = []
+        self.active: list[tuple[int, int]] = []
+        self.labels = 0
+
+    def new(self, kind: int, data=None) -> int:
+        if self.free:
+            node = self.free.pop()
+            self.kind[node] = kind
+            self.data[node] = data
+        else:
+            node = len(self.kind)
+            self.kind.append(kind)
+            self.data.append(data)
+            self.ports.extend((-1, -1, -1))
+        return node
+
+    def new_fan(self) -> int:
+        self.labels += 1
+        return self.new(self.labels)
+
+    def link(self, a: int, b: int) -> None:
+        ports = self.ports
+        ports[a] = b
+        ports[b] = a
+        if a % 3 == 0 and b % 3 == 0:
+            ka, kb = self.kind[a // 3], self.kind[b // 3]
+            # a free variable in function position is stuck
+            if not (ka == FREE and kb == CON or ka == CON and kb == FREE):
+                self.active.append((a // 3, b // 3))
+
+    def encode(self, node: Node, ctx_len: int) -> int:
+        """Translate node, returning the port for its value
+
+        Uses an explicit stack instead of recursion, so the depth of node is
+        not limited by the recursion limit. Nodes are allocated in the same
+        order as a recursive walk, first the parent and then its children from
+        left to right, and a frame is revisited after each of its children
+        to link the child's port, which is on `results`.
+        """
+        binders: list[int] = []
+        results: list[int] = []
+        stack: list[tuple[Node, int, int]] = [(node, 0, -1)]
+        while stack:
+            node, stage, con = stack.pop()
+            match node:
+                case VarNode(idx) if idx >= len(binders):
+                    results.append(self.new(FREE, ctx_len - 1 - (idx - len(binders))) * 3)
+                case VarNode(idx):
+                    var = binders[~idx] * 3 + 1
+                    prev = self.ports[var]
+                    if self.kind[prev // 3] == ERA:
+                        # first use replaces the eraser
+                        self.free.append(prev // 3)
+                        results.append(var)
+                        continue
+                    # each further use adds a fan, with the other uses on slot 1
+                    fan = self.new_fan()
+                    self.link(fan * 3 + 1, prev)
+                    self.link(fan * 3, var)
+                    results.append(fan * 3 + 2)
+                case AbsNode(orig_name, body) if stage == 0:
+                    lam = self.new(CON, orig_name)
+                    self.link(lam * 3 + 1, self.new(ERA) * 3)
+                    binders.append(lam)
+                    stack.append((node, 1, lam))
+                    stack.append((body, 0, -1))
+                case AbsNode():
+                    self.link(con * 3 + 2, results.pop())
+                    binders.pop()
+                    results.append(con * 3)
+                case AppNode(c1, c2):
+                    if stage == 0:
+                        con = self.new(CON)
+                        stack.append((node, 1, con))
+                        stack.append((c1, 0, -1))
+                    elif stage == 1:
+                        self.link(con * 3, results.pop())
+                        stack.append((node, 2, con))
+                        stack.append((c2, 0, -1))
+                    else:
+                        self.link(con * 3 + 1, results.pop())
+                        results.append(con * 3 + 2)
+                case _:
+                    raise Exception("Unreachable")
+        return results.pop()
+
+    def reduce(self, budget: int, stats: Stats) -> None:
+        """Rewrite active pairs until there are none left"""
+        kind, ports, link = self.kind, self.ports, self.link
+        while self.active:
+            if stats.interactions >= budget:
+                raise OutOfBudget(stats)
+            a, b = self.active.pop()
+            ka, kb = kind[a], kind[b]
+            if ka == ERA or kb == ERA or ka == FREE or kb == FREE:
+                if kb in (ERA, FREE):
+                    a, b, ka, kb = b, a, kb, ka
+                stats.erasures += 1
+                if kb >= 0:
+                    # erase or copy the free variable into both aux ports
+                    for slot in (1, 2):
+                        link(self.new(ka, self.data[a]) * 3, ports[b * 3 + slot])
+                self.free.extend((a, b))
+            elif ka == kb:
+                if ka == CON:
+                    stats.betas += 1
+                else:
+                    stats.annihilations += 1
+                link(ports[a * 3 + 1], ports[b * 3 + 1])
+                link(ports[a * 3 + 2], ports[b * 3 + 2])
+                self.free.extend((a, b))
+            else:
+                stats.commutations += 1
+                a1, a2 = self.new(ka, self.data[a]), self.new(ka, self.data[a])
+                b1, b2 = self.new(kb, self.data[b]), self.new(kb, self.data[b])
+                link(a1 * 3, ports[b * 3 + 1])
+                link(a2 * 3, ports[b * 3 + 2])
+                link(b1 * 3, ports[a * 3 + 1])
+                link(b2 * 3, ports[a * 3 + 2])
+                link(a1 * 3 + 1, b1 * 3 + 1)
+                link(a1 * 3 + 2, b2 * 3 + 1)
+                link(a2 * 3 + 1, b1 * 3 + 2)
+                link(a2 * 3 + 2, b2 * 3 + 2)
+                self.free.extend((a, b))
+
+    def read_back(self, port: int, ctx_len: int, budget: int, stats: Stats) -> Node:
+        """Read back the term linked to port
+
+        Entering a fan through slot 1 or 2 records the slot, and leaving a fan
+        through its principal port takes the last recorded slot. Every fan
+        crossed counts towards the budget.
+
+        Uses an explicit stack instead of recursion, following the paths in
+        the same order as a recursive walk. A frame with a `built` node makes
+        the abstraction (slot 0) or application (slot 2) of that node from its
+        children on `results`.
+        """
+        ports, kind = self.ports, self.kind
+        depths: dict[int, int] = {}
+        results: list[Node] = []
+        stack: list[tuple[int, Optional[tuple], int, Optional[int]]] = [(port, None, 0, None)]
+        while stack:
+            port, exits, depth, built = stack.pop()
+            if built is not None:
+                if port == 0:
+                    results.append(AbsNode(self.data[built], results.pop()))
+                else:
+                    arg = results.pop()
+                    results.append(AppNode(results.pop(), arg))
+                continue
+            while True:
+                node, slot = divmod(ports[port], 3)
+                k = kind[node]
+                if k <= 0:
+                    break
+                stats.crossings += 1
+                if stats.interactions + stats.crossings >= budget:
+                    raise OutOfBudget(stats)
+                if slot == 0:
+                    if exits is None:
+                        raise ReadBackError(f"No entry recorded for fan {node}")
+                    slot, exits = exits
+                    port = node * 3 + slot
+                else:
+                    exits = (slot, exits)
+                    port = node * 3
+            if k == FREE:
+                results.append(VarNode(ctx_len + depth - 1 - self.data[node], ctx_len + depth))
+            elif slot == 0:
+                depths[node] = depth
+                stack.append((0, None, depth, node))
+                stack.append((node * 3 + 2, exits, depth + 1, None))
+            elif slot == 1:
+                results.append(VarNode(depth - 1 - depths[node], ctx_len + depth))
+            else:
+                stack.append((2, None, depth, node))
+                stack.append((node * 3 + 1, exits, depth, None))
+                stack.append((node * 3, exits, depth, None))
+        return results.pop()
+
+
+def eval_optimal(node: Node, bindings: list, budget: int = 10_000_000,
+                 stats: Optional[Stats] = None) -> Node:
+    """Full beta normal form of node by optimal reduction
+
+    budget: Maximum number of interactions and fan crossings while reading
+        back, after which OutOfBudget is raised
+    stats: Counts the interactions of each kind
+    """
+    if stats is None:
+        stats = Stats()
+    net = Net()
+    ctx_len = len(bindings)
+    root = net.new(ROOT)
+    net.link(root * 3 + 1, net.encode(node, ctx_len))
+    net.reduce(budget, stats)
+    return net.read_back(root * 3 + 1, ctx_len, budget, stats)
+
+
+def main():
+    """Compare the interactions with the reductions of the substitution
+    evaluator, which are counted by the CEK machine"""
+    import time
+
+    from bench import church, program
+    from cek import Stats as CEKStats
+    from cek import eval_cek
+    from parser import parse
+
+    families = [
+        # applying id 2^n times, which sharing turns into n compositions
+        ("exp id", lambda n: f"(((exp {church(2)}) {church(n)}) id) tru", [4, 8, 12, 16]),
+        ("tower id", lambda n: f"(((exp {church(2)}) ((exp {church(2)}) {church(n)})) id) tru",
+         [1, 2, 3, 4]),
+        # no duplicated work to share
+        ("mul", lambda n: f"parity ((times {church(n)}) {church(n)})", [10, 30]),
+    ]
+    print(f"{'family':>10} {'n':>4} {'betas':>8} {'interactions':>12} {'secs':>8} "
+          f"{'subst':>10} {'secs':>8}")
+    for name, make, sizes in families:
+        for n in sizes:
+            (cmd,) = parse(program(make(n)))
+            stats = Stats()
+            start = time.perf_counter()
+            eval_optimal(cmd, [], stats=stats)
+            secs = time.perf_counter() - start
+            cek_stats = CEKStats()
+            start = time.perf_counter()
+            eval_cek(cmd, [], cek_stats)
+            print(f"{name:>10} {n:>4} {stats.betas:>8} {stats.interactions:>12} {secs:>8.3f} "
+                  f"{cek_stats.betas:>10} {time.perf_counter() - start:>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
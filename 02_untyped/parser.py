@@ -44,7 +44,11 @@ def find_binding(bindings: list[Token], name: Token):
     raise ValueError
 
 
-def parse_tree(tree: str | Tree, bindings: list[Token]) -> Node:
+def parse_tree(tree: str | Tree, bindings: list[Token], table=None) -> Node:
+    """Convert the lark tree to nodes
+
+    table: Optional `HashConsTable` to build interned nodes with
+    """
     match tree:
         case Tree(data="bind", children=[var_name]):
             var_name = cast(Token, var_name)
@@ -56,16 +60,18 @@ def parse_tree(tree: str | Tree, bindings: list[Token]) -> Node:
             # new_bindings = [name, *bindings]
             new_bindings = bindings.copy()
             new_bindings.append(name)
-            return AbsNode(name, parse_tree(body, new_bindings))
+            body = parse_tree(body, new_bindings, table)
+            return AbsNode(name, body) if table is None else table.abs(name, body)
         case Tree(data="app", children=[c1, c2]):
-            return AppNode(parse_tree(c1, bindings), parse_tree(c2, bindings))
+            c1, c2 = parse_tree(c1, bindings, table), parse_tree(c2, bindings, table)
+            return AppNode(c1, c2) if table is None else table.app(c1, c2)
         case Tree(data="var", children=[var_name]):
             var_name = cast(Token, var_name)
             try:
                 idx = find_binding(bindings, var_name)
             except ValueError:
                 raise Exception(f"Unbound variable {var_name}")
-            return VarNode(idx, len(bindings))
+            return VarNode(idx, len(bindings)) if table is None else table.var(idx)
 
     raise Exception("Unmatched", tree)
 
@@ -73,10 +79,10 @@ def parse_tree(tree: str | Tree, bindings: list[Token]) -> Node:
 p = Lark(grammar, propagate_positions=True)
 
 
-def parse(data: str):
+def parse(data: str, table=None):
     tree = p.parse(data, )
     bindings = []
-    return [parse_tree(child, bindings) for child in tree.children]
+    return [parse_tree(child, bindings, table) for child in tree.children]
 
 
 if __name__ == '__main__':
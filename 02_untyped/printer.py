@@ -0,0 +1,28 @@
+"""Printer for untyped terms, on the shared engine in `pytapl.printer`"""
+from typing import Optional
+
+from pytapl.printer import POP, Printer
+
+from parser import AbsNode, AppNode, Node, VarNode
+
+
+def _visit(p: Printer, node: Node, depth: int) -> None:
+    depth += 1
+    match node:
+        case AbsNode(orig_name, body):
+            p.write(f"(lambda {p.bind(orig_name)}. ")
+            p.work.extend((")", POP, (body, depth)))
+        case AppNode(c1, c2):
+            p.write("(")
+            p.work.extend((")", (c2, depth), " ", (c1, depth)))
+        case VarNode(idx, cnt):
+            if cnt != len(p.names):
+                p.write("ERROR\n")
+            else:
+                p.write(p.var(idx))
+
+
+def pprint_term(node: Node, bindings: list, max_width: Optional[int] = None,
+                max_depth: Optional[int] = None, max_nodes: Optional[int] = None) -> str:
+    """Text of node in the context bindings, see `Printer` for the limits"""
+    return Printer(bindings, max_width, max_depth, max_nodes).run(node, _visit)
@@ -1,23 +1,63 @@
 from parser import AbsNode, AppNode, BindNode, Node, VarNode, parse
+from typing import Callable
+
+from accel import normalize_church
+from cek import eval_cek
+from closures import eval_compiled
+from hashcons import eval_hashcons
+from nbe import normalize
+from need import eval_need
+from printer import pprint_term
+from ski import eval_ski
 
 
 class NoRuleApplies(Exception):
     pass
 
 
+def node_map(on_var: Callable[[int, int, int], Node], node: Node, c: int):
+    """Map over the node tree, calling `on_var` for VarNode.
+
+    Uses an explicit stack instead of recursion, so the depth of node is not
+    limited by the recursion limit.
+
+    c: Cutoff param
+    """
+    results: list[Node] = []
+    stack: list[tuple[Node, int, bool]] = [(node, c, False)]
+    while stack:
+        node, c, visited = stack.pop()
+        match node:
+            case VarNode():
+                results.append(on_var(c, node.idx, node.ctx_len))
+            case AbsNode():
+                if visited:
+                    results.append(AbsNode(node.orig_name, results.pop()))
+                else:
+                    stack.append((node, c, True))
+                    stack.append((node.body, c + 1, False))
+            case AppNode():
+                if visited:
+                    c2 = results.pop()
+                    results.append(AppNode(results.pop(), c2))
+                else:
+                    stack.append((node, c, True))
+                    stack.append((node.child2, c, False))
+                    stack.append((node.child1, c, False))
+            case _:
+                raise Exception("Unreachable")
+    return results.pop()
+
+
 def shift(node: Node, d: int, c: int = 0):
     """Shift the terms in node by d
     d: Shift value
     c: Cutoff param
     """
-    match node:
-        case VarNode(idx, ctx_len):
-            return VarNode(idx + (d if idx >= c else 0), ctx_len + d)
-        case AbsNode(orig_name, body):
-            return AbsNode(orig_name, shift(body, d, c + 1))
-        case AppNode(c1, c2):
-            return AppNode(shift(c1, d, c), shift(c2, d, c))
-    raise Exception("Unreachable")
+    def shift_var(c: int, idx: int, ctx_len: int) -> Node:
+        return VarNode(idx + (d if idx >= c else 0), ctx_len + d)
+
+    return node_map(shift_var, node, c)
 
 
 def subst(node: Node, j: int, s: Node, c: int = 0):
@@ -26,14 +66,10 @@ def subst(node: Node, j: int, s: Node, c: int = 0):
     s: Substitution
     c: Cutoff param
     """
-    match node:
-        case VarNode(idx, ctx_len):
-            return shift(s, c) if idx == j + c else VarNode(idx, ctx_len)
-        case AbsNode(orig_name, body):
-            return AbsNode(orig_name, subst(body, j, s, c + 1))
-        case AppNode(c1, c2):
-            return AppNode(subst(c1, j, s, c), subst(c2, j, s, c))
-    raise Exception("Unreachable")
+    def subst_var(c: int, idx: int, ctx_len: int) -> Node:
+        return shift(s, c) if idx == j + c else VarNode(idx, ctx_len)
+
+    return node_map(subst_var, node, c)
 
 
 def substTop(s: Node, node: Node):
@@ -45,50 +81,77 @@ def is_val(node: Node):
 
 
 def eval_(node: Node, bindings: list):
-    match node:
-        case AppNode(AbsNode(_, body), c2) if is_val(c2):
-            return substTop(c2, body)
-        case AppNode(c1, c2) if is_val(c1):
-            return AppNode(c1, eval_(c2, bindings))
-        case AppNode(c1, c2):
-            return AppNode(eval_(c1, bindings), c2)
-        case _: raise NoRuleApplies
-
-
-def pprint_tree(tree: Node, bindings: list, end=""):
-    # print(tree)
-    match tree:
-        case AbsNode(orig_name, body):
-            while orig_name in bindings:
-                orig_name += "'"
-            print(f"(lambda {orig_name}. ", end="")
-            bindings.append(orig_name)
-            pprint_tree(body, bindings)
-            bindings.pop()
-            print(")", end="")
-        case AppNode(c1, c2):
-            print("(", end="")
-            pprint_tree(c1, bindings, end=" ")
-            pprint_tree(c2, bindings)
-            print(")", end="")
-        case VarNode(idx, cnt):
-            if cnt != len(bindings):
-                print("ERROR")
-            else:
-                print(bindings[~idx], end="")
-    print("", end=end)
-
-
-def run(cmd, bindings):
+    """Single step of evaluation.
+
+    Walks down to the redex iteratively, then rebuilds the applications on the
+    path to it.
+    """
+    path: list[AppNode] = []
+    while True:
+        match node:
+            case AppNode(AbsNode(_, body), c2) if is_val(c2):
+                node = substTop(c2, body)
+                break
+            case AppNode(c1, c2):
+                path.append(node)
+                node = c2 if is_val(c1) else c1
+            case _: raise NoRuleApplies
+    for parent in reversed(path):
+        if is_val(parent.child1):
+            node = AppNode(parent.child1, node)
+        else:
+            node = AppNode(node, parent.child2)
+    return node
+
+
+def eval_node(node: Node, bindings: list):
+    while True:
+        try:
+            node = eval_(node, bindings)
+        except NoRuleApplies:
+            return node
+
+
+def pprint_tree(tree: Node, bindings: list, end="", **limits):
+    """Print tree in the context bindings
+
+    limits: max_width, max_depth and max_nodes for `pytapl.printer.Printer`
+    """
+    print(pprint_term(tree, bindings, **limits), end=end)
+
+
+def run(cmd, bindings, mode="eval"):
+    """Evaluate cmd and print the result
+
+    mode: "eval" for substitution based stepping, "cek" for the CEK machine,
+        "need" for lazy evaluation with sharing, "hashcons" for substitution on
+        hash-consed terms, "compile" for evaluation by compiling to closures,
+        "nbe" for the full beta normal form, "church" for the same with Church
+        numerals and booleans computed natively, "ski" for the normal form (up to
+        eta) by combinator graph reduction
+    """
     if isinstance(cmd, BindNode):
         bindings.append(cmd.name)
         print(cmd.name)
         return
-    while True:
-        try:
-            cmd = eval_(cmd, bindings)
-        except NoRuleApplies:
-            break
+    if mode == "eval":
+        cmd = eval_node(cmd, bindings)
+    elif mode == "cek":
+        cmd = eval_cek(cmd, bindings)
+    elif mode == "need":
+        cmd = eval_need(cmd, bindings)
+    elif mode == "hashcons":
+        cmd = eval_hashcons(cmd, bindings)
+    elif mode == "compile":
+        cmd = eval_compiled(cmd, bindings)
+    elif mode == "nbe":
+        cmd = normalize(cmd, bindings)
+    elif mode == "church":
+        cmd = normalize_church(cmd, bindings)
+    elif mode == "ski":
+        cmd = eval_ski(cmd, bindings)
+    else:
+        raise ValueError(f"Unknown mode {mode}")
     pprint_tree(cmd, bindings, end="\n")
 
 
@@ -0,0 +1,315 @@
+"""Shared memory program store and process pool runner for untyped terms.
+
+Programs are encoded once, in the pre-order array form of `ArrayTerm`, into a
+block of `multiprocessing.shared_memory`. Worker processes map the block when
+they start, so a task is just a range of program numbers. In the default
+"array" mode, a worker evaluates its programs in place with `eval_in_place`,
+a CEK machine whose terms are node numbers in the shared block. The other
+modes decode each program into a `Node` for one of the tree evaluators.
+
+Results are written by the workers into a second shared block, the result
+arena, and only their offsets are sent back. A result that doesn't fit in the
+arena is marked with offset -1 and evaluated again in the parent.
+"""
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from arrays import TAG_ABS, TAG_APP, TAG_VAR, ArrayTerm
+from cek import eval_cek
+from closures import eval_compiled
+from parser import Node
+from run import eval_node
+
+evaluators = {"array": eval_cek, "eval": eval_node, "cek": eval_cek, "compile": eval_compiled}
+
+# rows of an arena: tag, left, right, idx (name number for abstractions), depth
+ROWS = 5
+
+
+class Arena:
+    """Nodes of many terms in one shared memory block
+
+    The block starts with the number of nodes used so far, followed by ROWS
+    rows of capacity entries each. Offsets of children are relative to the
+    root of their term.
+    """
+
+    def __init__(self, capacity: int, name: Optional[str] = None) -> None:
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(name, create=name is None,
+                                              size=8 * (1 + ROWS * max(capacity, 1)))
+        buf = np.ndarray((1 + ROWS * capacity,), dtype=np.int64, buffer=self.shm.buf)
+        self.used = buf[:1]
+        self.rows = buf[1:].reshape(ROWS, capacity)
+        # the same block as Python ints, which are much faster to read one by one
+        self.words = self.shm.buf.cast("q")
+        if name is None:
+            self.used[0] = 0
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def alloc(self, size: int) -> int:
+        """Reserve size nodes, returning their offset, or -1 if they don't fit
+
+        This isn't atomic, so concurrent writers need a lock around it.
+        """
+        start = int(self.used[0])
+        if start + size > self.capacity:
+            return -1
+        self.used[0] = start + size
+        return start
+
+    def write(self, term: ArrayTerm, name_ids: dict[str, int], start: int) -> None:
+        """Copy term to the reserved space at start"""
+        idx = term.idx.copy()
+        abs_mask = term.tag == TAG_ABS
+        idx[abs_mask] = [name_ids[name] for name in np.array(term.names, dtype=object)[abs_mask]]
+        self.write_rows((term.tag, term.left, term.right, idx, term.depth), start)
+
+    def write_rows(self, rows: tuple, start: int) -> None:
+        """Copy the ROWS rows of a term, with name numbers in idx, to start"""
+        self.rows[:, start:start + len(rows[0])] = rows
+
+    def read(self, start: int, size: int, ctx_len: int, names: list[str]) -> Node:
+        """Decode the term at start, using names for the binders"""
+        tag, left, right, idx, depth = self.rows[:, start:start + size]
+        binders = [names[i] if t == TAG_ABS else None
+                   for t, i in zip(tag.tolist(), idx.tolist())]
+        return ArrayTerm(tag, left, right, idx, depth, binders, ctx_len).to_node()
+
+    def close(self) -> None:
+        # the views have to be gone before the buffer can be released
+        del self.used, self.rows
+        self.words.release()
+        self.shm.close()
+
+
+class Handle(NamedTuple):
+    """Everything a worker needs to map a store, cheap to pickle"""
+    arena: str
+    capacity: int
+    table: str
+    count: int
+    names: list[str]
+
+
+class ProgramStore:
+    """Programs as (node, ctx_len) pairs, encoded into shared memory
+
+    table: Start, size and ctx_len of each program
+    """
+
+    def __init__(self, programs: list[tuple[Node, int]]) -> None:
+        terms = [ArrayTerm.from_node(node, ctx_len) for node, ctx_len in programs]
+        self.names = sorted({name for term in terms for name in term.names if name is not None})
+        self.name_ids = {name: i for i, name in enumerate(self.names)}
+        self.arena = Arena(sum(map(len, terms)))
+        self._table_shm = shared_memory.SharedMemory(create=True, size=8 * 3 * max(len(terms), 1))
+        self.table = np.ndarray((len(terms), 3), dtype=np.int64, buffer=self._table_shm.buf)
+        for i, term in enumerate(terms):
+            start = self.arena.alloc(len(term))
+            self.arena.write(term, self.name_ids, start)
+            self.table[i] = start, len(term), term.ctx_len
+
+    def __len__(self):
+        return len(self.table)
+
+    def handle(self) -> Handle:
+        return Handle(self.arena.name, self.arena.capacity, self._table_shm.name,
+                      len(self.table), self.names)
+
+    def close(self) -> None:
+        del self.table
+        self.arena.close()
+        self._table_shm.close()
+        self.arena.shm.unlink()
+        self._table_shm.unlink()
+
+
+def eval_in_place(arena: Arena, start: int) -> tuple:
+    """Evaluate the term at start to the same result as `eval_cek`, reading
+    its nodes from the arena without decoding them
+
+    Terms are node numbers in the arena, and closures are (abstraction,
+    environment) pairs like in `cek`. The result is read back by
+    substituting the environments, straight into the ROWS rows of a new term,
+    returned as lists.
+    """
+    words, cap = arena.words, arena.capacity
+    tag_at, left_at, right_at, idx_at = 1, 1 + cap, 1 + 2 * cap, 1 + 3 * cap
+    term, env = start, None
+    # (True, term, env) evaluates the argument term next, (False, closure)
+    # applies the closure to the value being computed
+    stack: list[tuple] = []
+    while True:
+        # evaluate term in env
+        tag = words[tag_at + term]
+        if tag == TAG_APP:
+            stack.append((True, start + words[right_at + term], env))
+            term = start + words[left_at + term]
+            continue
+        if tag == TAG_ABS:
+            val = (term, env)
+        else:
+            val, idx = env, words[idx_at + term]
+            while val is not None and idx > 0:
+                idx -= 1
+                val = val[1]
+            if val is None:
+                break  # free variable, no rule applies
+            val = val[0]
+
+        # continue with val
+        if not stack:
+            return _read_back(words, cap, start, val[0], val[1], [])
+        frame = stack.pop()
+        if frame[0]:
+            stack.append((False, val))
+            term, env = frame[1], frame[2]
+        else:
+            fun = frame[1]
+            term, env = start + words[left_at + fun[0]], (val, fun[1])
+
+    # stuck: plug the stuck term back into its continuation
+    stack.append((True, term, env))
+    return _read_back(words, cap, start, -1, None, stack)
+
+
+def _read_back(words, cap: int, start: int, node: int, env, frames: list) -> tuple:
+    """Rows of node with the values from env substituted, like `cek.read_back`
+
+    A node of -1 - k plugs the stuck term, the last of frames, into frames k
+    onwards, outermost first.
+    """
+    tag_at, left_at, right_at, idx_at = 1, 1 + cap, 1 + 2 * cap, 1 + 3 * cap
+    tags: list[int] = []
+    lefts: list[int] = []
+    rights: list[int] = []
+    idxs: list[int] = []
+    depths: list[int] = []
+    # (node, env, depth, outer, parent, row of parent to link), where depth
+    # and outer are as in `cek.read_back`
+    stack: list[tuple] = [(node, env, 0, 0, -1, lefts)]
+    while stack:
+        node, env, depth, outer, parent, slot = stack.pop()
+        if node < 0:
+            k = -1 - node
+            if k == len(frames) - 1:
+                _, node, env = frames[k]
+                stack.append((node, env, 0, 0, parent, slot))
+                continue
+            tag, idx = TAG_APP, 0
+        else:
+            tag, idx = words[tag_at + node], words[idx_at + node]
+        if tag == TAG_VAR and idx >= depth:
+            idx -= depth
+            while env is not None and idx > 0:
+                idx -= 1
+                env = env[1]
+            if env is not None:
+                # values are abstractions, read back in place of the variable
+                abs_, abs_env = env[0]
+                stack.append((abs_, abs_env, 0, outer + depth, parent, slot))
+                continue
+            idx += depth + outer
+        i = len(tags)
+        if parent >= 0:
+            slot[parent] = i
+        tags.append(tag)
+        lefts.append(-1)
+        rights.append(-1)
+        idxs.append(idx)
+        depths.append(depth + outer)
+        if node < 0:
+            frame = frames[-1 - node]
+            if frame[0]:
+                stack.append((frame[1], frame[2], 0, 0, i, rights))
+                stack.append((node - 1, None, 0, 0, i, lefts))
+            else:
+                stack.append((node - 1, None, 0, 0, i, rights))
+                stack.append((frame[1][0], frame[1][1], 0, 0, i, lefts))
+        elif tag == TAG_APP:
+            stack.append((start + words[right_at + node], env, depth, outer, i, rights))
+            stack.append((start + words[left_at + node], env, depth, outer, i, lefts))
+        elif tag == TAG_ABS:
+            stack.append((start + words[left_at + node], env, depth + 1, outer, i, lefts))
+    return tags, lefts, rights, idxs, depths
+
+
+# state of a worker process, set up once by _init_worker
+_worker: dict = {}
+
+
+def _init_worker(handle: Handle, result_name: str, result_capacity: int, lock, mode: str):
+    table_shm = shared_memory.SharedMemory(handle.table)
+    _worker.update(
+        programs=Arena(handle.capacity, handle.arena),
+        table_shm=table_shm,
+        table=np.ndarray((handle.count, 3), dtype=np.int64, buffer=table_shm.buf),
+        results=Arena(result_capacity, result_name),
+        names=handle.names,
+        name_ids={name: i for i, name in enumerate(handle.names)},
+        lock=lock,
+        evaluate=evaluators[mode],
+        in_place=mode == "array",
+    )
+
+
+def _eval_range(start: int, stop: int) -> list[tuple[int, int]]:
+    """Evaluate programs start to stop, returning the offset and size of each result"""
+    w = _worker
+    spans = []
+    for offset, size, ctx_len in w["table"][start:stop].tolist():
+        if w["in_place"]:
+            rows = eval_in_place(w["programs"], offset)
+        else:
+            node = w["programs"].read(offset, size, ctx_len, w["names"])
+            res = ArrayTerm.from_node(w["evaluate"](node, [None] * ctx_len), ctx_len)
+            idx = res.idx.copy()
+            abs_mask = res.tag == TAG_ABS
+            idx[abs_mask] = [w["name_ids"][name]
+                             for name in np.array(res.names, dtype=object)[abs_mask]]
+            rows = (res.tag, res.left, res.right, idx, res.depth)
+        with w["lock"]:
+            offset = w["results"].alloc(len(rows[0]))
+        if offset >= 0:
+            w["results"].write_rows(rows, offset)
+        spans.append((offset, len(rows[0])))
+    return spans
+
+
+def run_pool(programs: list[tuple[Node, int]], mode="array", workers: Optional[int] = None,
+             chunk: int = 64, result_capacity: Optional[int] = None) -> list[Node]:
+    """Evaluate independent programs on a process pool
+
+    programs: Pairs of a term and the length of its context
+    mode: One of `evaluators`
+    chunk: Number of programs per task
+    result_capacity: Number of nodes in the result arena, by default four
+        times the size of the programs
+    """
+    evaluate = evaluators[mode]
+    store = ProgramStore(programs)
+    results = Arena(result_capacity or 4 * store.arena.capacity)
+    try:
+        lock = mp.Lock()
+        with mp.Pool(workers, _init_worker,
+                     (store.handle(), results.name, results.capacity, lock, mode)) as pool:
+            tasks = [(i, min(i + chunk, len(store))) for i in range(0, len(store), chunk)]
+            spans = [span for res in pool.starmap(_eval_range, tasks) for span in res]
+        out = []
+        for (node, ctx_len), (offset, size) in zip(programs, spans):
+            if offset < 0:
+                out.append(evaluate(node, [None] * ctx_len))
+            else:
+                out.append(results.read(offset, size, ctx_len, store.names))
+        return out
+    finally:
+        results.close()
+        results.shm.unlink()
+        store.close()
@@ -0,0 +1,225 @@
+"""Combinator graph reduction for untyped terms.
+
+Terms are compiled to the S, K, I, B and C combinators by bracket abstraction,
+which removes all bound variables, so no substitution or shifting is needed.
+The result is reduced as a graph: every rule overwrites the root of its redex
+in place, so a shared subterm is only ever reduced once. The root of a redex
+whose result is an existing node becomes an indirection `I x`, which is
+skipped when walking down the spine.
+
+Reduction is lazy and goes to weak head normal form. A value that is still a
+function is decompiled by applying it to a fresh variable, so reading back a
+result gives its full beta normal form, like `nbe.normalize`, except that
+bracket abstraction eta-reduces some of the abstractions. Binder names
+don't survive the compilation, so decompiled binders are named after their
+de Bruijn level.
+"""
+from collections import Counter
+from typing import Optional, Union
+
+from parser import AbsNode, AppNode, Node, VarNode
+
+
+class Comb:
+    __slots__ = ("name", "arity")
+
+    def __init__(self, name: str, arity: int) -> None:
+        self.name = name
+        self.arity = arity
+
+    def __repr__(self):
+        return self.name
+
+
+S, K, I, B, C = Comb("S", 3), Comb("K", 2), Comb("I", 1), Comb("B", 3), Comb("C", 3)
+
+
+class Var:
+    """Variable, by its de Bruijn level
+
+    Bound variables only exist while compiling, the ones left after that are
+    free in the whole term.
+    """
+    __slots__ = ("lvl", "vars")
+
+    def __init__(self, lvl: int) -> None:
+        self.lvl = lvl
+        self.vars = 1 << lvl
+
+
+class Ap:
+    """Application node of the graph, updated in place by reduction
+
+    vars: Bitmask of the levels of the variables in the node, only valid until
+        the node is reduced
+    """
+    __slots__ = ("fun", "arg", "vars")
+
+    def __init__(self, fun: "Term", arg: "Term") -> None:
+        self.fun = fun
+        self.arg = arg
+        self.vars = _vars(fun) | _vars(arg)
+
+    def __repr__(self):
+        return f"({self.fun!r} {self.arg!r})"
+
+
+Term = Union[Comb, Var, Ap]
+
+
+def _vars(term: Term) -> int:
+    return 0 if isinstance(term, Comb) else term.vars
+
+
+def abstract(term: Term, lvl: int) -> Term:
+    """Bracket abstraction of the variable at level lvl out of term
+
+    Uses K for terms without the variable, eta reduction, and B and C when
+    only one side of an application has the variable. Uses an explicit stack
+    instead of recursion, so the depth of term is not limited by the
+    recursion limit.
+    """
+    bit = 1 << lvl
+    results: list[Term] = []
+    stack: list[tuple[Term, bool]] = [(term, False)]
+    while stack:
+        term, visited = stack.pop()
+        if not _vars(term) & bit:
+            results.append(Ap(K, term))
+            continue
+        if isinstance(term, Var):
+            results.append(I)
+            continue
+        assert isinstance(term, Ap)
+        fun, arg = term.fun, term.arg
+        in_fun, in_arg = _vars(fun) & bit, _vars(arg) & bit
+        if not in_fun and isinstance(arg, Var):
+            results.append(fun)
+        elif not visited:
+            stack.append((term, True))
+            if in_arg:
+                stack.append((arg, False))
+            if in_fun:
+                stack.append((fun, False))
+        elif in_fun and in_arg:
+            arg = results.pop()
+            results.append(Ap(Ap(S, results.pop()), arg))
+        elif in_fun:
+            results.append(Ap(Ap(C, results.pop()), arg))
+        else:
+            results.append(Ap(Ap(B, fun), results.pop()))
+    return results.pop()
+
+
+def compile_node(node: Node, level: int) -> Term:
+    """Compile node to combinators
+
+    Uses an explicit stack instead of recursion, so the depth of node is not
+    limited by the recursion limit.
+
+    level: Number of variables in scope, including the context
+    """
+    results: list[Term] = []
+    stack: list[tuple[Node, int, bool]] = [(node, level, False)]
+    while stack:
+        node, level, visited = stack.pop()
+        match node:
+            case VarNode(idx):
+                results.append(Var(level - 1 - idx))
+            case AbsNode(_, body):
+                if visited:
+                    results.append(abstract(results.pop(), level))
+                else:
+                    stack.append((node, level, True))
+                    stack.append((body, level + 1, False))
+            case AppNode(c1, c2):
+                if visited:
+                    arg = results.pop()
+                    results.append(Ap(results.pop(), arg))
+                else:
+                    stack.append((node, level, True))
+                    stack.append((c2, level, False))
+                    stack.append((c1, level, False))
+            case _:
+                raise Exception("Unreachable")
+    return results.pop()
+
+
+def whnf(term: Term, stats: Optional[Counter] = None) -> tuple[Term, list[Ap]]:
+    """Reduce term to weak head normal form in place
+
+    Returns the head and the spine of applications above it, outermost first.
+    """
+    spine: list[Ap] = []
+    while True:
+        while isinstance(term, Ap):
+            if term.fun is I:
+                term = term.arg
+            else:
+                spine.append(term)
+                term = term.fun
+        if not isinstance(term, Comb) or len(spine) < term.arity:
+            return term, spine
+        if stats is not None:
+            stats[term.name] += 1
+        root = spine[-term.arity]
+        x = spine[-1].arg
+        if term is I or term is K:
+            root.fun, root.arg = I, x
+        else:
+            y, z = spine[-2].arg, root.arg
+            if term is S:
+                root.fun, root.arg = Ap(x, z), Ap(y, z)
+            elif term is B:
+                root.fun, root.arg = x, Ap(y, z)
+            else:  # C
+                root.fun, root.arg = Ap(x, z), y
+        del spine[-term.arity:]
+        term = root
+
+
+def read_back(term: Term, level: int, stats: Optional[Counter] = None) -> Node:
+    """Decompile the beta normal form of term
+
+    Uses an explicit stack of work instead of recursion, which reduces the
+    subterms in the same order as reading them back recursively would.
+
+    level: Number of variables in scope, including the context
+    """
+    results: list[Node] = []
+    # ("eval", term, level) reads back term, ("abs", level) wraps the last
+    # result in a binder, and ("app", node, n) applies node to the last n
+    stack: list[tuple] = [("eval", term, level)]
+    while stack:
+        match stack.pop():
+            case ("eval", term, level):
+                head, spine = whnf(term, stats)
+                if isinstance(head, Comb):
+                    # a partial application is a function, so apply it to a fresh variable
+                    root = spine[0] if spine else head
+                    stack.append(("abs", level))
+                    stack.append(("eval", Ap(root, Var(level)), level + 1))
+                    continue
+                assert isinstance(head, Var)
+                stack.append(("app", VarNode(level - 1 - head.lvl, level), len(spine)))
+                # the innermost argument is read back first
+                stack.extend(("eval", app.arg, level) for app in spine)
+            case ("abs", level):
+                results.append(AbsNode(f"x{level}", results.pop()))
+            case ("app", node, n):
+                if n:
+                    args = results[-n:]
+                    del results[-n:]
+                    for arg in args:
+                        node = AppNode(node, arg)
+                results.append(node)
+    return results.pop()
+
+
+def eval_ski(node: Node, bindings: list, stats: Optional[Counter] = None) -> Node:
+    """Full beta normal form of node, by combinator graph reduction
+
+    stats: Counts the reductions of each combinator
+    """
+    ctx_len = len(bindings)
+    return read_back(compile_node(node, ctx_len), ctx_len, stats)
@@ -0,0 +1,263 @@
+from parser import AbsNode, AppNode, BindNode, VarNode, parse
+from run import eval_node, shift
+
+import bench
+from accel import normalize_church
+from arrays import ArrayTerm
+from bench_deep import church_numeral, left_spine
+from cek import eval_cek
+from closures import eval_compiled
+from hashcons import MAX_SHIFTS, HashConsTable, eval_hashcons
+from nbe import nf_equal, normalize
+from need import Stats, eval_need, sharing_report
+from optimal import OutOfBudget, ReadBackError, eval_optimal
+from printer import pprint_term
+from shared import run_pool
+from ski import eval_ski
+
+church = """
+    w/;
+    id = lambda x. x;
+    zero = lambda f. lambda x. x;
+    succ = lambda n. lambda f. lambda x. f ((n f) x);
+    plus = lambda m. lambda n. lambda f. lambda x. (m f) ((n f) x);
+    times = lambda m. lambda n. lambda f. m (n f);
+    tru = lambda t. lambda f. t;
+    fls = lambda t. lambda f. f;
+"""
+
+
+def expand(prog: str):
+    """Inline the `name = term;` definitions of prog into the later commands"""
+    defs: list[tuple[str, str]] = []
+    cmds = []
+    for line in prog.split(";"):
+        line = line.strip()
+        if not line:
+            continue
+        if "=" in line and "/" not in line:
+            name, term = map(str.strip, line.split("=", 1))
+            defs.append((name, term))
+            continue
+        for name, term in reversed(defs):
+            line = f"(lambda {name}. {line}) ({term})"
+        cmds.append(line + ";")
+    return "\n".join(cmds)
+
+
+def check_same(prog: str, *evaluators):
+    bindings = []
+    for cmd in parse(expand(prog)):
+        if isinstance(cmd, BindNode):
+            bindings.append(cmd.name)
+            continue
+        expected = eval_node(cmd, bindings)
+        for evaluator in evaluators:
+            got = evaluator(cmd, bindings)
+            if got != expected:
+                raise AssertionError(f"{evaluator.__name__}: {got} != {expected}")
+
+
+programs = [
+    "x/; x; w/; w (lambda x. x); (lambda x. lambda x. x);",
+    "w/; lambda x. (lambda y. y x) (x w);",
+    "w/; (lambda x. x) w; (lambda x. lambda y. x) (lambda z. z) ((lambda a. a) w);",
+    "w/; (lambda x. x x) (lambda y. y); (w (lambda x. x)) ((lambda x. x) (lambda y. y));",
+    "w/; ((lambda x. lambda y. y) w) (lambda z. z); (((lambda x. x) (lambda y. y)) w) w;",
+    church + "succ (succ zero);",
+    church + "(plus (succ zero)) (succ (succ zero));",
+    church + "(((times (succ (succ zero))) (succ (succ (succ zero)))) (lambda b. (b fls) tru)) tru;",
+    church + "(((plus (succ zero)) zero) w) w;",
+]
+
+for prog in programs:
+    check_same(prog, eval_cek)
+# reading back a normal form far deeper than the recursion limit
+deep_nf = AppNode(church_numeral(20000, 1), AbsNode("z", VarNode(0, 2)))
+expected_nf = pprint_term(eval_node(deep_nf, ["w"]), ["w"])
+assert pprint_term(eval_cek(deep_nf, ["w"]), ["w"]) == expected_nf
+print("cek: ok")
+
+for prog in programs:
+    check_same(prog, eval_compiled)
+# both far deeper than the recursion limit, to compile and to run
+(cmd,) = parse(bench.program(f"parity (to_church (({bench.church(20000)} ssucc) szero))"))
+assert pprint_term(eval_compiled(cmd, []), []) == "(lambda t. (lambda f. t))"
+deep = AppNode(church_numeral(20000, 1), VarNode(0, 1))
+assert pprint_term(eval_compiled(deep, ["w"]), ["w"]) == pprint_term(eval_node(deep, ["w"]), ["w"])
+print("compile: ok")
+
+for prog in programs:
+    check_same(prog, eval_hashcons)
+table = HashConsTable()
+cmds = parse("w/; lambda x. (lambda y. y) ((lambda y. y) x); (lambda z. w) (lambda y. y);", table)
+_, t1, t2 = cmds
+assert t1.body.child1 is t1.body.child2.child1 is t2.child2
+assert t1.free == 0 and t2.free == 1
+assert table.shift(t1, 3) is t1
+assert table.shift(t2, 2) is table.shift(t2, 2) is table.intern(
+    parse("a/; b/; w/; (lambda z. a) (lambda y. y);")[3])
+for d in range(1, 3 * MAX_SHIFTS):
+    table.shift(t2, d)
+assert len(t2.shifts) <= MAX_SHIFTS
+# far deeper than the recursion limit
+deep = AppNode(church_numeral(5000, 1), AbsNode("z", VarNode(0, 2)))
+assert pprint_term(eval_hashcons(deep, ["w"]), ["w"]) == pprint_term(eval_node(deep, ["w"]), ["w"])
+spine = left_spine(5000, 1)
+assert table.shift(table.intern(spine), 1) is table.intern(shift(spine, 1))
+print("hashcons: ok")
+
+
+def eval_one(prog: str, evaluator, **kwargs):
+    bindings = []
+    for cmd in parse(expand(prog)):
+        if isinstance(cmd, BindNode):
+            bindings.append(cmd.name)
+        else:
+            return evaluator(cmd, bindings, **kwargs)
+
+
+omega = "(lambda x. x x) (lambda x. x x)"
+prog = f"(lambda x. lambda y. y) ({omega});"
+print(prog)
+assert eval_one(prog, eval_need) == eval_one("lambda y. y;", eval_node)
+
+prog = "(lambda x. lambda y. x) ((lambda z. z) (lambda z. z));"
+print(prog)
+assert eval_one(prog, eval_need) == eval_one("lambda y. (lambda z. z) (lambda z. z);", eval_node)
+
+prog = "(lambda x. x x x) ((lambda y. y) (lambda z. z));"
+print(prog)
+need, name = Stats(), Stats()
+eval_one(prog, eval_need, stats=need)
+eval_one(prog, eval_need, share=False, stats=name)
+assert name.betas - need.betas == 2
+assert eval_one(prog, sharing_report) == {"need": 4, "name": 6, "value": 4, "saved": 2}
+# both evaluated and unevaluated thunks far deeper than the recursion limit
+assert pprint_term(eval_need(deep_nf, ["w"]), ["w"]) == expected_nf
+lazy = AppNode(AbsNode("x", AbsNode("y", VarNode(1, 3))), church_numeral(20000, 1))
+assert pprint_term(eval_need(lazy, ["w"]), ["w"]) == pprint_term(eval_node(lazy, ["w"]), ["w"])
+print("need: ok")
+
+
+def church_num(n: int):
+    return "lambda f. lambda x. " + "f (" * n + "x" + ")" * n + ";"
+
+
+for prog, n in [("(plus (succ zero)) (succ (succ zero));", 3),
+                ("(times (succ (succ zero))) (succ (succ (succ zero)));", 6)]:
+    print(prog)
+    (cmd,) = parse(expand(church + prog))[1:]
+    (num,) = parse("w/;" + church_num(n))[1:]
+    assert nf_equal(cmd, num, ["w"])
+    assert not nf_equal(cmd, parse("w/;" + church_num(n + 1))[1], ["w"])
+    assert normalize(cmd, ["w"]) == num
+
+for prog in programs:
+    bindings = []
+    for cmd in parse(expand(prog)):
+        if isinstance(cmd, BindNode):
+            bindings.append(cmd.name)
+        else:
+            assert nf_equal(cmd, eval_node(cmd, bindings), bindings)
+
+_, eta1, eta2, eta3 = parse("w/; lambda x. w x; lambda y. lambda z. (w y) z; w;")
+assert not nf_equal(eta1, eta3, ["w"])
+assert nf_equal(eta1, eta3, ["w"], eta=True) and nf_equal(eta2, eta3, ["w"], eta=True)
+assert normalize(eta2, ["w"], eta=True) == eta3
+# both far deeper than the recursion limit, which isn't raised
+(cmd,) = parse(bench.program(f"parity (to_church (({bench.church(20000)} ssucc) szero))"))
+assert pprint_term(normalize(cmd, []), []) == "(lambda t. (lambda f. t))"
+deep = AppNode(church_numeral(20000, 1), VarNode(0, 1))
+assert pprint_term(normalize(deep, ["w"]), ["w"]) == "(lambda x. " + "(w " * 20000 + "x" + ")" * 20001
+print("nbe: ok")
+
+for prog in programs:
+    bindings = []
+    for cmd in parse(expand(prog)):
+        if isinstance(cmd, BindNode):
+            bindings.append(cmd.name)
+            continue
+        arr = ArrayTerm.from_node(cmd, len(bindings))
+        assert arr.to_node() == cmd
+        for d, c in [(2, 0), (1, 1), (3, 2)]:
+            assert arr.shift(d, c).to_node() == shift(cmd, d, c)
+        assert arr.is_closed() == (len(arr.free_vars()) == 0)
+print("arrays: ok")
+
+pool_programs = []
+for prog in programs:
+    bindings = []
+    for cmd in parse(expand(prog)):
+        if isinstance(cmd, BindNode):
+            bindings.append(cmd.name)
+        else:
+            pool_programs.append((cmd, len(bindings)))
+expected = [eval_node(cmd, [None] * ctx_len) for cmd, ctx_len in pool_programs]
+assert run_pool(pool_programs, workers=2, chunk=2) == expected
+assert run_pool(pool_programs, "eval", workers=2, chunk=2) == expected
+# results that don't fit in the arena are evaluated again in the parent
+assert run_pool(pool_programs, "compile", workers=2, chunk=2, result_capacity=8) == expected
+print("shared: ok")
+
+for prog in programs:
+    bindings = []
+    for cmd in parse(expand(prog)):
+        if isinstance(cmd, BindNode):
+            bindings.append(cmd.name)
+        else:
+            assert nf_equal(eval_ski(cmd, bindings), normalize(cmd, bindings), bindings, eta=True)
+
+# the plain Y combinator works, since reduction is lazy
+y_fact = """((lambda f. (lambda x. f (x x)) (lambda x. f (x x)))
+    (lambda fact. lambda n. ((iszero n) (succ zero)) ((times n) (fact (pred n))))) """
+(cmd,) = parse(bench.program(f"parity ({y_fact} {bench.church(3)})"))
+assert nf_equal(eval_ski(cmd, []), parse("lambda t. lambda f. t;")[0], [], eta=True)
+(cmd,) = parse(bench.program(f"parity (to_church (({bench.church(5000)} ssucc) szero))"))
+assert nf_equal(eval_ski(cmd, []), parse("lambda t. lambda f. t;")[0], [], eta=True)
+print("ski: ok")
+
+for prog, n in [("(plus (succ zero)) (succ (succ zero));", 3),
+                ("(times (succ (succ zero))) (succ (succ (succ zero)));", 6),
+                ("(lambda n. (plus n) n) (succ (succ zero));", 4)]:
+    (cmd,) = parse(expand(church + prog))[1:]
+    assert eval_optimal(cmd, ["w"]) == normalize(cmd, ["w"])
+for prog in ["(lambda x. x x) (lambda x. x x);",
+             "(lambda x. x x) (lambda f. lambda y. f (f y));"]:
+    try:
+        eval_optimal(parse(prog)[0], [], budget=10_000)
+    except (OutOfBudget, ReadBackError):
+        pass
+    else:
+        raise AssertionError(prog)
+deep = AppNode(church_numeral(20000, 1), VarNode(0, 1))
+assert pprint_term(eval_optimal(deep, ["w"]), ["w"]) == pprint_term(normalize(deep, ["w"]), ["w"])
+print("optimal: ok")
+
+# the argument of times that doesn't terminate is never forced
+for prefix, body in [("", "(plus (succ (succ zero))) ((times (succ (succ zero))) (succ (succ (succ zero))))"),
+                     ("", "(exp (succ (succ zero))) (succ (succ (succ zero)))"),
+                     ("", "(exp (succ (succ zero))) zero"),
+                     ("", "iszero ((times zero) ((lambda x. x x) (lambda x. x x)))"),
+                     ("", "lambda n. (plus n) (succ zero)"),
+                     ("w/;", "(plus w) (succ zero)")]:
+    cmds = parse(prefix + bench.program(body))
+    bindings = [cmd.name for cmd in cmds if isinstance(cmd, BindNode)]
+    assert normalize_church(cmds[-1], bindings) == normalize(cmds[-1], bindings)
+# numerals far larger than the recursion limit, applied natively or not
+for body in [f"parity ((plus {bench.church(3000)}) {bench.church(3001)})",
+             f"({bench.church(2000)} (lambda y. y)) (lambda z. z)",
+             f"parity (({bench.church(3000)} succ) zero)",
+             f"parity (({bench.church(3000)} (lambda b. not b)) tru)",
+             f"({bench.church(2000)} (lambda n. (plus n) {bench.church(1)})) zero",
+             f"(times {bench.church(50)}) {bench.church(60)}"]:
+    (cmd,) = parse(bench.program(body))
+    assert pprint_term(normalize_church(cmd, []), []) == pprint_term(normalize(cmd, []), [])
+print("church: ok")
+
+_, term = parse("x/; (lambda x. lambda x. x) (lambda x. x);")
+assert pprint_term(term, ["x"]) == "((lambda x'. (lambda x''. x'')) (lambda x'. x'))"
+assert pprint_term(term, ["x"], max_depth=2) == "((lambda x'. (lambda x''. ...)) (lambda x'. x'))"
+assert pprint_term(term, ["x"], max_nodes=3) == "((lambda x'. (lambda x''. ...)) ...)"
+assert pprint_term(term, ["x"], max_width=10) == "((lambda x..."
+print("printer: ok")
@@ -0,0 +1,88 @@
+"""Benchmark of type checking deeply nested abstractions.
+
+`typeof` clones the context for every abstraction, which copied the whole
+context when it was a plain list. Compares that with the persistent
+`Context`, on nests that are thousands of abstractions deep:
+
+    python bench_context.py [depths...]
+"""
+import sys
+import time
+import tracemalloc
+
+from context import Context, _ContextElem
+from nodes import AbsNode, AppNode, ArrowTy, BoolTy, IfNode, Node, VarBinding, VarNode
+from printer import pprint_term
+from run import typeof
+
+
+class ListContext(Context):
+    """Context backed by a list, which clone copies"""
+
+    def __init__(self) -> None:
+        self.items: list[_ContextElem] = []
+
+    def clone(self):
+        ctx = ListContext()
+        ctx.items = self.items.copy()
+        return ctx
+
+    def add_binding(self, name, binding):
+        self.items.append(_ContextElem(name, binding))
+
+    def get_binding(self, idx):
+        return self.items[~idx]
+
+    def __len__(self):
+        return len(self.items)
+
+
+def nest(depth: int) -> Node:
+    """lambda x0:Bool. lambda f1:Bool->Bool. lambda x2:Bool. ... body
+
+    body applies every f to an `if` on variables from the outermost, the
+    middle and the innermost levels, so there are lookups at all depths.
+    """
+    def var(level: int) -> VarNode:
+        return VarNode(depth - 1 - level, depth + 1)
+
+    evens = range(0, depth, 2)
+    body: Node = IfNode(var(evens[0]), var(evens[-1]), var(evens[len(evens) // 2]))
+    for level in range(1, depth, 2):
+        body = AppNode(var(level), body)
+    for level in reversed(range(depth)):
+        if level % 2:
+            body = AbsNode(f"f{level}", ArrowTy(BoolTy(), BoolTy()), body)
+        else:
+            body = AbsNode(f"x{level}", BoolTy(), body)
+    return body
+
+
+def measure(node: Node, ctx: Context) -> tuple[float, int]:
+    start = time.perf_counter()
+    ty = typeof(node, ctx)
+    secs = time.perf_counter() - start
+    tracemalloc.start()
+    # types as deep as node are compared as text, since == on them recurses
+    assert pprint_term(typeof(node, ctx.clone()), Context()) == pprint_term(ty, Context())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return secs, peak
+
+
+def main(*depths: int):
+    depths = depths or (1000, 2000, 4000, 8000)
+    ctx = Context()
+    ctx.add_binding("w", VarBinding(BoolTy()))
+    print(f"{'depth':>6} {'list secs':>10} {'list KiB':>10} {'secs':>8} {'KiB':>8}")
+    for depth in depths:
+        node = nest(depth)
+        old = ListContext()
+        old.add_binding("w", VarBinding(BoolTy()))
+        old_secs, old_peak = measure(node, old)
+        secs, peak = measure(node, ctx)
+        print(f"{depth:>6} {old_secs:>10.3f} {old_peak // 1024:>10} {secs:>8.3f} {peak // 1024:>8}")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
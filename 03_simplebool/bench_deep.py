@@ -0,0 +1,91 @@
+"""Benchmark of parsing and type checking very deep terms.
+
+All of these are far deeper than the recursion limit, so they only work with
+the explicit-stack `parse_tree` and `typeof`. The parse trees are built
+directly, since the Earley parser is slow on inputs this large:
+
+    python bench_deep.py [depth]
+"""
+import sys
+import time
+
+from lark.lexer import Token
+from lark.tree import Tree
+
+from context import Context
+from nodes import AbsNode, AppNode, ArrowTy, BoolTy, IfNode, Node, TrueNode, VarBinding, VarNode
+from parser import parse_tree
+from run import typeof
+
+
+def app_spine(depth: int) -> Node:
+    """f (f (... (f true)))"""
+    node: Node = TrueNode()
+    for _ in range(depth):
+        node = AppNode(VarNode(0, 1), node)
+    return node
+
+
+def if_chain(depth: int) -> Node:
+    """if (if (... ) then w else w) then w else (if ... then w else (...))"""
+    cond: Node = VarNode(1, 2)
+    else_: Node = VarNode(1, 2)
+    for _ in range(depth):
+        cond = IfNode(cond, VarNode(1, 2), VarNode(1, 2))
+        else_ = IfNode(TrueNode(), VarNode(1, 2), else_)
+    return IfNode(cond, VarNode(1, 2), else_)
+
+
+def let_chain(depth: int) -> Node:
+    """(lambda x:Bool. (lambda x:Bool. (... x) x) x) w"""
+    node: Node = VarNode(0, depth + 3)
+    for level in reversed(range(depth)):
+        node = AppNode(AbsNode("x", BoolTy(), node), VarNode(0, level + 3))
+    return AppNode(AbsNode("x", BoolTy(), node), VarNode(1, 2))
+
+
+def tree_spine(depth: int) -> Tree:
+    """The parse tree of f (f (... (if f true then true else false)))"""
+    f = Tree("var", [Token("CNAME", "f")])
+    tree = Tree("if_stmt", [Tree("app", [f, Tree("true", [])]), Tree("true", []), Tree("false", [])])
+    for _ in range(depth):
+        tree = Tree("app", [f, tree])
+    return tree
+
+
+def tree_abs(depth: int) -> Tree:
+    """The parse tree of lambda x:Bool. lambda x:Bool. ... x"""
+    tree = Tree("var", [Token("CNAME", "x")])
+    for _ in range(depth):
+        tree = Tree("abs", [Token("CNAME", "x"), BoolTy(), tree])
+    return tree
+
+
+def timed(name: str, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    print(f"{name:>30}: {time.perf_counter() - start:8.3f}s")
+    return result
+
+
+def main(depth=100_000):
+    print(f"depth {depth}, recursion limit {sys.getrecursionlimit()}")
+    ctx = Context()
+    ctx.add_binding("w", VarBinding(BoolTy()))
+    ctx.add_binding("f", VarBinding(ArrowTy(BoolTy(), BoolTy())))
+
+    assert timed("typeof application spine", typeof, app_spine(depth), ctx) == BoolTy()
+    assert timed("typeof if chain", typeof, if_chain(depth), ctx) == BoolTy()
+    assert timed("typeof let chain", typeof, let_chain(depth), ctx) == BoolTy()
+
+    node = timed("parse_tree application spine", parse_tree, tree_spine(depth), ctx)
+    assert timed("typeof parsed spine", typeof, node, ctx) == BoolTy()
+    node = timed("parse_tree abstractions", parse_tree, tree_abs(depth), ctx)
+    for _ in range(depth - 1):
+        assert isinstance(node, AbsNode)
+        node = node.body
+    assert node == AbsNode("x", BoolTy(), VarNode(0, depth + 2))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,257 @@
+"""Closure compiler for well typed simplebool terms.
+
+`compile_node` erases the types of a term and compiles it once: `true` and
+`false` become Python bools, and variables and abstractions become closures
+that read the environment or build a callable `Fun`. Applications and `if`
+become `App` and `If` records, which `run_code` evaluates on an explicit
+continuation stack, so neither compiling nor running a term is limited by the
+recursion limit.
+
+A closed well typed term always evaluates to a value, so the compiled code
+has no checks for stuck terms at all. A term with free variables from the
+context can get stuck on them, so it is rejected when compiling with
+`OpenTerm`. The evaluation order is the same call-by-value order as `eval_`.
+"""
+from typing import Callable, Optional, Union
+
+from nodes import AbsNode, AppNode, FalseNode, IfNode, Node, TrueNode, VarNode
+
+# environments are linked tuples (innermost value, rest)
+Env = Optional[tuple["Value", "Env"]]
+Value = Union[bool, "Fun"]
+Code = Union[Callable[[Env], Value], "App", "If"]
+
+
+class Fun:
+    """Value of an abstraction: its node, environment and compiled body"""
+    __slots__ = ("abs", "env", "body")
+
+    def __init__(self, abs: AbsNode, env: Env, body: Code) -> None:
+        self.abs = abs
+        self.env = env
+        self.body = body
+
+    def __call__(self, arg: Value) -> Value:
+        body = self.body
+        if _is_leaf(body):
+            return body((arg, self.env))  # type: ignore
+        return run_code(body, (arg, self.env))
+
+
+class OpenTerm(Exception):
+    """Raised when compiling a term that has free variables"""
+
+
+def _is_leaf(code: Code) -> bool:
+    return type(code) is not App and type(code) is not If
+
+
+class App:
+    """Compiled application, whose operands are evaluated by `run_code`
+
+    direct: Both operands are closures, which are called without a frame
+    """
+    __slots__ = ("fun", "arg", "direct")
+
+    def __init__(self, fun: Code, arg: Code) -> None:
+        self.fun = fun
+        self.arg = arg
+        self.direct = _is_leaf(fun) and _is_leaf(arg)
+
+
+class If:
+    """Compiled conditional, whose branches are evaluated by `run_code`
+
+    direct: The condition is a closure, which is called without a frame
+    """
+    __slots__ = ("cond", "then", "else_", "direct")
+
+    def __init__(self, cond: Code, then: Code, else_: Code) -> None:
+        self.cond = cond
+        self.then = then
+        self.else_ = else_
+        self.direct = _is_leaf(cond)
+
+
+def read_back(val: Value, ctx_len: int) -> Node:
+    """Node for val, with the values from the environment substituted
+
+    Uses an explicit stack instead of recursion, so the depth of the result
+    is not limited by the recursion limit.
+    """
+    results: list[Node] = []
+    # a frame with a node substitutes env into it, one with None reads back val
+    stack: list[tuple] = [(None, val, ctx_len, 0, False)]
+    while stack:
+        node, env, ctx_len, depth, visited = stack.pop()
+        match node:
+            case None if env is True:
+                results.append(TrueNode())
+            case None if env is False:
+                results.append(FalseNode())
+            case None:
+                stack.append((env.abs, env.env, ctx_len, 0, False))
+            case VarNode(idx, _) if idx < depth:
+                results.append(VarNode(idx, ctx_len))
+            case VarNode(idx, _):
+                # values are closed, so they don't need to be shifted
+                for _ in range(idx - depth):
+                    env = env[1]
+                stack.append((None, env[0], ctx_len, 0, False))
+            case TrueNode() | FalseNode():
+                results.append(node)
+            case _ if visited:
+                match node:
+                    case AbsNode(orig_name, ty):
+                        results.append(AbsNode(orig_name, ty, results.pop()))
+                    case AppNode():
+                        c2 = results.pop()
+                        results.append(AppNode(results.pop(), c2))
+                    case IfNode():
+                        else_, then = results.pop(), results.pop()
+                        results.append(IfNode(results.pop(), then, else_))
+            case AbsNode(_, _, body):
+                stack.append((node, env, ctx_len, depth, True))
+                stack.append((body, env, ctx_len + 1, depth + 1, False))
+            case AppNode(c1, c2):
+                stack.append((node, env, ctx_len, depth, True))
+                stack.append((c2, env, ctx_len, depth, False))
+                stack.append((c1, env, ctx_len, depth, False))
+            case IfNode(cond, then, else_):
+                stack.append((node, env, ctx_len, depth, True))
+                stack.append((else_, env, ctx_len, depth, False))
+                stack.append((then, env, ctx_len, depth, False))
+                stack.append((cond, env, ctx_len, depth, False))
+            case _:
+                raise Exception(f"Unreachable {node}")
+    return results.pop()
+
+
+def _compile_var(idx: int, depth: int) -> Code:
+    if idx >= depth:
+        raise OpenTerm(f"Free variable {idx - depth}")
+    if idx == 0:
+        return lambda env: env[0]  # type: ignore
+    if idx == 1:
+        return lambda env: env[1][0]  # type: ignore
+
+    def var(env: Env) -> Value:
+        for _ in range(idx):
+            env = env[1]  # type: ignore
+        return env[0]  # type: ignore
+    return var
+
+
+def _compile_abs(node: AbsNode, body_code: Code) -> Code:
+    return lambda env: Fun(node, env, body_code)
+
+
+# height up to which conditionals of closures are compiled to a closure too,
+# which bounds the Python stack it uses, as it can't call any function
+_MAX_INLINE_IF = 32
+
+
+def _compile_if(cond: Code, then: Code, else_: Code, height: int) -> Code:
+    if height <= _MAX_INLINE_IF and _is_leaf(cond) and _is_leaf(then) and _is_leaf(else_):
+        return lambda env: then(env) if cond(env) else else_(env)  # type: ignore
+    return If(cond, then, else_)
+
+
+def compile_node(node: Node, depth: int = 0) -> Code:
+    """Compile the well typed node into code computing its value from its
+    environment, for `run_code`
+
+    Uses an explicit stack instead of recursion, so the depth of node is not
+    limited by the recursion limit.
+
+    depth: Number of binders around node, which the environment will hold
+    """
+    # compiled code of each finished node, with its height
+    codes: list[tuple[Code, int]] = []
+    stack: list[tuple[Node, int, bool]] = [(node, depth, False)]
+    while stack:
+        node, depth, visited = stack.pop()
+        match node:
+            case TrueNode():
+                codes.append((lambda env: True, 0))
+            case FalseNode():
+                codes.append((lambda env: False, 0))
+            case VarNode(idx, _):
+                codes.append((_compile_var(idx, depth), 0))
+            case _ if visited:
+                match node:
+                    case AbsNode():
+                        codes.append((_compile_abs(node, codes.pop()[0]), 0))
+                    case AppNode():
+                        arg, _ = codes.pop()
+                        codes.append((App(codes.pop()[0], arg), 0))
+                    case IfNode():
+                        (else_, h3), (then, h2), (cond, h1) = codes.pop(), codes.pop(), codes.pop()
+                        height = max(h1, h2, h3) + 1
+                        codes.append((_compile_if(cond, then, else_, height), height))
+            case AbsNode(_, _, body):
+                stack.append((node, depth, True))
+                stack.append((body, depth + 1, False))
+            case AppNode(c1, c2):
+                stack.append((node, depth, True))
+                stack.append((c2, depth, False))
+                stack.append((c1, depth, False))
+            case IfNode(cond, then, else_):
+                stack.append((node, depth, True))
+                stack.append((else_, depth, False))
+                stack.append((then, depth, False))
+                stack.append((cond, depth, False))
+            case _:
+                raise Exception(f"Unreachable {node}")
+    return codes.pop()[0]
+
+
+def run_code(code: Code, env: Env = None) -> Value:
+    """Value of code in env
+
+    The pending applications and conditionals are kept on an explicit stack
+    of (code, env, fun) frames. For an `App`, fun is None while its operator
+    is being evaluated, and its value while the operand is. An `If` waits for
+    its condition, and then continues with one of its branches in its place,
+    like applying a function does, so the stack only grows with the nesting of
+    pending operands and conditions. Records marked `direct` need no frame.
+    """
+    stack: list[tuple[App | If, Env, Optional[Fun]]] = []
+    push, pop = stack.append, stack.pop
+    while True:
+        while True:
+            kind = type(code)
+            if kind is App:
+                if code.direct:  # type: ignore
+                    fun = code.fun(env)  # type: ignore
+                    code, env = fun.body, (code.arg(env), fun.env)  # type: ignore
+                else:
+                    push((code, env, None))  # type: ignore
+                    code = code.fun  # type: ignore
+            elif kind is If:
+                if code.direct:  # type: ignore
+                    code = code.then if code.cond(env) else code.else_  # type: ignore
+                else:
+                    push((code, env, None))  # type: ignore
+                    code = code.cond  # type: ignore
+            else:
+                break
+        val = code(env)  # type: ignore
+        if not stack:
+            return val
+        frame, env, fun = pop()
+        if type(frame) is If:
+            code = frame.then if val else frame.else_
+        elif fun is None:
+            push((frame, env, val))  # type: ignore
+            code = frame.arg
+        else:
+            code, env = fun.body, (val, fun.env)
+
+
+def eval_compiled(node: Node, ctx_len: int) -> Node:
+    """Evaluate the closed, well typed node to the same value as `eval_node`
+
+    ctx_len: Length of the context node is in
+    """
+    return read_back(run_code(compile_node(node)), ctx_len)
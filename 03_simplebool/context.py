@@ -1,4 +1,4 @@
-from typing import NamedTuple
+from typing import Iterator, NamedTuple, Optional
 from lark.lexer import Token
 from nodes import Binding, VarBinding
 
@@ -8,26 +8,91 @@ class _ContextElem(NamedTuple):
     binding: Binding
 
 
+# A skew binary random access list, as in Okasaki's "Purely Functional Data
+# Structures". The spine is a cons list of (size, tree, rest) with complete
+# binary trees of (elem, left, right), where the trees are in pre-order from the
+# most recent binding. Cells are never modified, so contexts can share them.
+_Tree = tuple
+_Spine = Optional[tuple]
+
+
+def _cons(elem: _ContextElem, spine: _Spine) -> _Spine:
+    if spine is not None and spine[2] is not None and spine[0] == spine[2][0]:
+        _, left, (size, right, rest) = spine
+        return (2 * size + 1, (elem, left, right), rest)
+    return (1, (elem, None, None), spine)
+
+
+def _tail(spine: tuple) -> _Spine:
+    size, (_, left, right), rest = spine
+    if size == 1:
+        return rest
+    size //= 2
+    return (size, left, (size, right, rest))
+
+
+def _lookup(spine: _Spine, idx: int) -> _ContextElem:
+    while spine is not None and idx >= spine[0]:
+        idx -= spine[0]
+        spine = spine[2]
+    if spine is None or idx < 0:
+        raise IndexError(idx)
+    size, tree = spine[0], spine[1]
+    while idx:
+        size //= 2
+        if idx <= size:
+            tree = tree[1]
+            idx -= 1
+        else:
+            tree = tree[2]
+            idx -= 1 + size
+    return tree[0]
+
+
+def _iter(spine: _Spine) -> Iterator[_ContextElem]:
+    while spine is not None:
+        stack: list[_Tree] = [spine[1]]
+        while stack:
+            elem, left, right = stack.pop()
+            yield elem
+            if left is not None:
+                stack.extend((right, left))
+        spine = spine[2]
+
+
 class Context:
+    """Persistent context, so clone and add_binding take constant time, and
+    looking up a binding by index takes logarithmic time"""
+
     def __init__(self) -> None:
-        self.data: list[_ContextElem] = []
+        self.spine: _Spine = None
+        self.size = 0
 
     def clone(self):
         ctx = Context()
-        ctx.data = self.data.copy()
+        ctx.spine = self.spine
+        ctx.size = self.size
         return ctx
 
+    @property
+    def data(self) -> list[_ContextElem]:
+        """Bindings, oldest first"""
+        data = list(_iter(self.spine))
+        data.reverse()
+        return data
+
     def add_binding(self, name, binding: Binding):
-        self.data.append(_ContextElem(name, binding))
+        self.spine = _cons(_ContextElem(name, binding), self.spine)
+        self.size += 1
 
     def find_binding(self, name):
-        for i, binding in enumerate(reversed(self.data)):
+        for i, binding in enumerate(_iter(self.spine)):
             if binding.name == name:
                 return i, binding
         raise ValueError
 
     def get_binding(self, idx):
-        return self.data[~idx]
+        return _lookup(self.spine, idx)
 
     def get_name(self, idx):
         return self.get_binding(idx).name
@@ -39,13 +104,15 @@ class Context:
         raise ValueError(f"Wrong binding for var {self.get_name(idx)} at {idx}")
 
     def pop_binding(self):
-        self.data.pop()
+        if self.spine is None:
+            raise IndexError("pop from empty context")
+        self.spine = _tail(self.spine)
+        self.size -= 1
 
     @property
     def top(self):
         """Return most recent binding"""
-        return self.data[-1]
+        return self.get_binding(0)
 
     def __len__(self):
-        return len(self.data)
-
+        return self.size
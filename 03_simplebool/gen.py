@@ -0,0 +1,229 @@
+"""Seeded generator of random well typed simplebool terms.
+
+`generate` builds `Node` trees of a target type directly, guided by the type
+so that every term it returns type checks. The size is split between the
+children of every node, so the result has about the requested number of
+nodes, and the depth is limited by max_depth. `Mix` sets how often each kind
+of node is chosen.
+
+Binders are named after their de Bruijn level, so `pprint_term` prints the
+terms without renaming, as source text that the parser accepts. The same text
+is also valid rcdsub source.
+"""
+import gc
+import random
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+from context import Context
+from nodes import (AbsNode, AppNode, ArrowTy, BoolTy, FalseNode, IfNode, Node,
+                   TrueNode, Ty, VarBinding, VarNode)
+
+
+@dataclass
+class Mix:
+    """Relative weights of the kinds of nodes"""
+    abs: float = 1.0
+    app: float = 1.0
+    if_: float = 1.0
+    # at the leaves, variables of the right type against true and false
+    var: float = 1.0
+    const: float = 1.0
+
+
+def random_type(rng: random.Random, depth: int = 2) -> Ty:
+    """Bool half of the time, otherwise an arrow of at most depth levels"""
+    return _ty(_random_key(rng, depth))
+
+
+# Types are handled as keys while generating: () for Bool and (key1, key2)
+# for an arrow. Unlike the type dataclasses they are hashable, and cheap to
+# build and compare.
+BOOL = ()
+
+
+def _random_key(rng: random.Random, depth: int) -> tuple:
+    if depth == 0 or rng.random() < 0.5:
+        return BOOL
+    return (_random_key(rng, depth - 1), _random_key(rng, depth - 1))
+
+
+def _key(ty: Ty) -> tuple:
+    if isinstance(ty, ArrowTy):
+        return (_key(ty.ty1), _key(ty.ty2))
+    return BOOL
+
+
+@lru_cache(maxsize=None)
+def _ty(key: tuple) -> Ty:
+    """Type for key, shared between the nodes it annotates"""
+    if key == BOOL:
+        return BoolTy()
+    return ArrowTy(_ty(key[0]), _ty(key[1]))
+
+
+# tasks of `Generator.gen`
+_GEN, _ABS, _APP, _IF = range(4)
+
+
+class Generator:
+    """State for generating one term
+
+    scope: Levels of the variables in scope, for the key of each type
+    keys: Keys of the types of the variables in scope by level, None for names
+        without a type
+    """
+
+    def __init__(self, rng: random.Random, mix: Mix, max_depth: int, context: Context) -> None:
+        self.rng = rng
+        self.random = rng.random
+        self.mix = mix
+        self.max_depth = max_depth
+        self.level = 0
+        self.scope: dict[Optional[tuple], list[int]] = {}
+        self.keys: list[Optional[tuple]] = []
+        for elem in context.data:
+            match elem.binding:
+                case VarBinding(ty):
+                    self._push(_key(ty))
+                case _:
+                    self._push(None)
+        total = mix.abs + mix.app + mix.if_
+        # thresholds for choosing an abstraction, then an application, from
+        # one random number. Only arrow types can be abstractions.
+        self.arrow = (mix.abs / total, (mix.abs + mix.app) / total) if total > 0 else None
+        total -= mix.abs
+        self.bool = (0.0, mix.app / total) if total > 0 else None
+        total = mix.var + mix.const
+        self.var_share = mix.var / total if total > 0 else 0.0
+
+    def _push(self, key: Optional[tuple]) -> None:
+        self.scope.setdefault(key, []).append(self.level)
+        self.keys.append(key)
+        self.level += 1
+
+    def _pop(self) -> None:
+        self.level -= 1
+        self.scope[self.keys.pop()].pop()
+
+    def var(self, key: tuple) -> Optional[VarNode]:
+        levels = self.scope.get(key)
+        if not levels:
+            return None
+        level = levels[int(self.random() * len(levels))]
+        return VarNode(self.level - 1 - level, self.level)
+
+    def gen(self, key: tuple, size: int, depth: int) -> Node:
+        """Random term of the type of key with about size nodes
+
+        Uses an explicit stack of tasks instead of recursion, which draws the
+        random numbers in the same order as generating the children from left
+        to right recursively would. A `_GEN` task generates a term of a type,
+        and the others build a node from the last results.
+        """
+        random = self.random
+        results: list[Node] = []
+        stack: list[tuple] = [(_GEN, key, size, depth)]
+        push, pop = stack.append, stack.pop
+        while stack:
+            task = pop()
+            op = task[0]
+            if op == _ABS:
+                self._pop()
+                results.append(AbsNode(f"x{self.level}", _ty(task[1][0]), results.pop()))
+                continue
+            if op == _APP:
+                arg = results.pop()
+                results.append(AppNode(results.pop(), arg))
+                continue
+            if op == _IF:
+                else_, then = results.pop(), results.pop()
+                results.append(IfNode(results.pop(), then, else_))
+                continue
+            _, key, size, depth = task
+            thresholds = self.bool if key == BOOL else self.arrow
+            if size <= 1 or depth >= self.max_depth or thresholds is None:
+                # smallest term of the type that is easy to find
+                if random() < self.var_share:
+                    var = self.var(key)
+                    if var is not None:
+                        results.append(var)
+                        continue
+                if key == BOOL:
+                    results.append(TrueNode() if random() < 0.5 else FalseNode())
+                    continue
+                size = 1  # an abstraction with a leaf as body
+            elif (choice := random()) >= thresholds[0]:
+                # sizes of the children are cut at random points of size - 1
+                size -= 1
+                if choice < thresholds[1]:
+                    arg_key = _random_key(self.rng, 2)
+                    fun = 1 + int(random() * (size - 1)) if size > 1 else 1
+                    push((_APP,))
+                    push((_GEN, arg_key, size - fun, depth + 1))
+                    push((_GEN, (arg_key, key), fun, depth + 1))
+                else:
+                    cut1, cut2 = sorted((int(random() * (size + 1)), int(random() * (size + 1))))
+                    push((_IF,))
+                    push((_GEN, key, size - cut2, depth + 1))
+                    push((_GEN, key, cut2 - cut1, depth + 1))
+                    push((_GEN, BOOL, cut1, depth + 1))
+                continue
+            self._push(key[0])
+            push((_ABS, key))
+            push((_GEN, key[1], size - 1, depth + 1))
+        return results.pop()
+
+
+def generate(ty: Ty, size: int, max_depth: int = 64, seed: int = 0,
+             mix: Optional[Mix] = None, context: Optional[Context] = None) -> Node:
+    """Random term of type ty with about size nodes
+
+    Leaves of arrow types that no variable has are abstractions, so the term
+    can have more nodes than size, especially with many applications.
+
+    max_depth: Depth below which only leaves are generated
+    mix: Weights of the kinds of nodes, all 1 by default
+    context: Context whose variables the term may use
+    """
+    gen = Generator(random.Random(seed), mix or Mix(), max_depth, context or Context())
+    # the nodes have no cycles, and collecting while allocating millions of
+    # them takes longer than generating
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return gen.gen(_key(ty), size, 0)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def main(size=1_000_000, source_size=5_000):
+    """Generate big terms, type check them, and time printing and parsing"""
+    import time
+
+    from optimize import size as count
+    from parser import parse
+    from printer import pprint_term
+    from run import typeof
+
+    ty = ArrowTy(BoolTy(), BoolTy())
+    for mix in (Mix(), Mix(abs=4, app=1, if_=1), Mix(abs=1, app=1, if_=4)):
+        start = time.perf_counter()
+        node = generate(ty, size, mix=mix)
+        secs = time.perf_counter() - start
+        assert typeof(node, Context()) == ty
+        print(f"{mix}: {count(node)} nodes in {secs:.2f}s")
+
+    node = generate(ty, source_size, seed=1)
+    source = pprint_term(node, Context()) + ";"
+    start = time.perf_counter()
+    (parsed,) = parse(source)
+    secs = time.perf_counter() - start
+    assert parsed == node
+    print(f"parsed {count(node)} nodes, {len(source)} characters, in {secs:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
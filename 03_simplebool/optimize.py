@@ -0,0 +1,130 @@
+"""Partial evaluation of well typed simplebool terms.
+
+`optimize` runs between type checking and evaluation, with the rules below
+on the shared engine in `pytapl.optimize`:
+
+* `if true then t else e` and `if false then t else e` are folded to a branch
+* a redex `(lambda x:T. body) v`, where v is a value, is inlined if x is used
+  at most once, or all copies of v fit in the budget
+
+All of these are evaluation steps, so the type of the term is preserved. Each
+one is a step that evaluation doesn't need to take anymore, or would have
+taken every time the abstraction around it is applied.
+"""
+from typing import Optional
+
+from pytapl import optimize as engine
+from pytapl.optimize import BUDGET, Stats
+
+from nodes import AbsNode, AppNode, FalseNode, IfNode, Node, TrueNode, VarNode
+from run import is_val, subst_top
+
+
+class _Rules(engine.Rules[Node]):
+    def children(self, node: Node) -> tuple[Node, ...]:
+        # called for every node and every walk, so it avoids the slower match
+        kind = type(node)
+        if kind is AppNode:
+            return (node.child1, node.child2)  # type: ignore
+        if kind is AbsNode:
+            return (node.body,)  # type: ignore
+        if kind is IfNode:
+            return (node.cond, node.then, node.else_)  # type: ignore
+        return ()
+
+    def rebuild(self, node: Node, children: list[Node]) -> Node:
+        match node:
+            case AbsNode(orig_name, ty):
+                return AbsNode(orig_name, ty, *children)
+            case AppNode():
+                return AppNode(*children)
+        return IfNode(*children)
+
+    def binds(self, node: Node) -> bool:
+        return type(node) is AbsNode
+
+    def var_idx(self, node: Node) -> Optional[int]:
+        return node.idx if type(node) is VarNode else None  # type: ignore
+
+    def reduce(self, node: Node, children: list[Node], depth: int,
+               budget: int, stats: Stats) -> Optional[tuple[Node, bool]]:
+        match node, children:
+            case IfNode(_, then, else_), [TrueNode()]:
+                stats.folded += 1
+                return then, True
+            case IfNode(_, then, else_), [FalseNode()]:
+                stats.folded += 1
+                return else_, True
+            case AppNode(), [AbsNode(_, _, body), t2] if is_val(t2):
+                count = uses(body)
+                if count <= 1 or count * size(t2) <= budget:
+                    stats.inlined += 1
+                    # the substituted copies can make new redexes
+                    return subst_top(t2, body), True
+        return None
+
+
+_rules = _Rules()
+
+
+def size(node: Node) -> int:
+    return engine.size(node, _rules)
+
+
+def uses(node: Node, idx: int = 0) -> int:
+    """Number of occurrences of the variable idx in node"""
+    return engine.uses(node, _rules, idx)
+
+
+def optimize(node: Node, budget: int = BUDGET,
+             stats: Optional[Stats] = None) -> tuple[Node, Stats]:
+    """Partially evaluate the well typed node
+
+    budget: Most nodes that the copies of an inlined argument may add
+    stats: Counts the reductions that were done
+    """
+    return engine.optimize(node, _rules, budget, stats)
+
+
+def main():
+    """Count the evaluation steps with and without optimizing"""
+    from context import Context
+    from parser import parse
+    from printer import pprint_term
+    from run import NoRuleApplies, eval_, typeof
+
+    def steps(node: Node, ctx: Context) -> int:
+        count = 0
+        while True:
+            try:
+                node = eval_(node, ctx)
+            except NoRuleApplies:
+                return count
+            count += 1
+
+    # the flags are known ahead of time, like in generated code, but the input y
+    # isn't. Application is right associative, so it needs parentheses.
+    prog = """
+        ((lambda debug:Bool. lambda fast:Bool.
+            ((lambda not:Bool->Bool. lambda and:Bool->Bool->Bool.
+                (lambda check:Bool->Bool. lambda y:Bool. check (check (check (check y))))
+                (lambda x:Bool. if debug then not x else (if fast then ((and x) true) else x)))
+             (lambda b:Bool. if b then false else true))
+             (lambda a:Bool. lambda b:Bool. if a then b else false))
+        false) true;
+    """
+    ctx = Context()
+    (cmd,) = parse(prog)
+    ty = typeof(cmd, ctx)
+    opt, stats = optimize(cmd)
+    assert typeof(opt, ctx) == ty
+    print(f"{stats.folded} conditionals folded, {stats.inlined} arguments inlined, "
+          f"size {stats.size_before} -> {stats.size_after}")
+    print(pprint_term(opt, ctx))
+    for arg in (TrueNode(), FalseNode()):
+        print(f"evaluation steps on {pprint_term(arg, ctx)}: "
+              f"{steps(AppNode(cmd, arg), ctx)} -> {steps(AppNode(opt, arg), ctx)}")
+
+
+if __name__ == '__main__':
+    main()
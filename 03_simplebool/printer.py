@@ -0,0 +1,44 @@
+"""Printer for simplebool terms and types, on the shared engine in `pytapl.printer`"""
+from typing import Optional
+
+from pytapl.printer import POP, Bind, Printer
+
+from context import Context
+from nodes import (AbsNode, AppNode, ArrowTy, BoolTy, FalseNode, IfNode, Node,
+                   TrueNode, Ty, VarNode)
+
+
+def _visit(p: Printer, node: "Node | Ty", depth: int) -> None:
+    depth += 1
+    match node:
+        case TrueNode():
+            p.write("true")
+        case FalseNode():
+            p.write("false")
+        case VarNode(idx, _):
+            p.write(p.var(idx))
+        case AbsNode(orig_name, ty, body):
+            p.write("(lambda ")
+            p.work.extend((")", POP, (body, depth), ". ", (ty, depth), ":", Bind(orig_name)))
+        case AppNode(c1, c2):
+            p.write("(")
+            p.work.extend((")", (c2, depth), " ", (c1, depth)))
+        case IfNode(cond, then, else_):
+            p.write("(if ")
+            p.work.extend((")", (else_, depth), " else ", (then, depth), " then ", (cond, depth)))
+        case BoolTy():
+            p.write("Bool")
+        case ArrowTy(ArrowTy() as ty1, ty2):
+            p.write("(")
+            p.work.extend(((ty2, depth), ")->", (ty1, depth)))
+        case ArrowTy(ty1, ty2):
+            p.work.extend(((ty2, depth), "->", (ty1, depth)))
+        case _:
+            raise Exception(f"Unknown node {node}")
+
+
+def pprint_term(node: "Node | Ty", context: Context, max_width: Optional[int] = None,
+                max_depth: Optional[int] = None, max_nodes: Optional[int] = None) -> str:
+    """Text of a term or type in context, see `Printer` for the limits"""
+    names = [elem.name for elem in context.data]
+    return Printer(names, max_width, max_depth, max_nodes).run(node, _visit)
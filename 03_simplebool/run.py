@@ -1,9 +1,11 @@
 from parser import parse
 from typing import Callable, cast
 
+from closures import OpenTerm, eval_compiled
 from context import Context
 from nodes import (AbsNode, AppNode, ArrowTy, BindNode, BoolTy, FalseNode,
-                   IfNode, Node, TrueNode, VarBinding, VarNode)
+                   IfNode, Node, TrueNode, Ty, VarBinding, VarNode)
+from printer import pprint_term
 
 
 class NoRuleApplies(Exception):
@@ -11,24 +13,47 @@ class NoRuleApplies(Exception):
 
 
 def node_map(on_var: Callable[[int, int, int], VarNode], node: Node, c: int):
-    """Map over the node tree recursively, calling `on_var` for VarNode.
+    """Map over the node tree, calling `on_var` for VarNode.
+
+    Uses an explicit stack instead of recursion, so the depth of node is not
+    limited by the recursion limit.
 
     c: Cutoff param
     """
-    match node:
-        case VarNode(idx, ctx_len):
-            return on_var(c, idx, ctx_len)
-        case AbsNode(orig_name, ty, body):
-            return AbsNode(orig_name, ty, node_map(on_var, body, c + 1))
-        case AppNode(t1, t2):
-            return AppNode(node_map(on_var, t1, c), node_map(on_var, t2, c))
-        case IfNode(cond, then, else_):
-            return IfNode(node_map(on_var, cond, c),
-                          node_map(on_var, then, c),
-                          node_map(on_var, else_, c))
-        case TrueNode() | FalseNode():
-            return node
-    raise Exception(f"Unreachable {node}")
+    results: list[Node] = []
+    stack: list[tuple[Node, int, bool]] = [(node, c, False)]
+    while stack:
+        node, c, visited = stack.pop()
+        match node:
+            case VarNode(idx, ctx_len):
+                results.append(on_var(c, idx, ctx_len))
+            case TrueNode() | FalseNode():
+                results.append(node)
+            case _ if visited:
+                match node:
+                    case AbsNode(orig_name, ty):
+                        results.append(AbsNode(orig_name, ty, results.pop()))
+                    case AppNode():
+                        t2 = results.pop()
+                        results.append(AppNode(results.pop(), t2))
+                    case IfNode():
+                        else_, then = results.pop(), results.pop()
+                        results.append(IfNode(results.pop(), then, else_))
+            case AbsNode(_, _, body):
+                stack.append((node, c, True))
+                stack.append((body, c + 1, False))
+            case AppNode(t1, t2):
+                stack.append((node, c, True))
+                stack.append((t2, c, False))
+                stack.append((t1, c, False))
+            case IfNode(cond, then, else_):
+                stack.append((node, c, True))
+                stack.append((else_, c, False))
+                stack.append((then, c, False))
+                stack.append((cond, c, False))
+            case _:
+                raise Exception(f"Unreachable {node}")
+    return results.pop()
 
 
 def shift(node: Node, d: int):
@@ -86,43 +111,91 @@ def eval_node(node: Node, context: Context):
 
 
 def typeof(node: Node, context: Context):
-    match node:
-        case TrueNode() | FalseNode(): return BoolTy()
-        case IfNode(cond, then, else_):
-            if typeof(cond, context) == BoolTy():
-                ret_ty = typeof(then, context)
-                if ret_ty == typeof(else_, context):
-                    return ret_ty
+    """Type of node in context
+
+    Uses an explicit stack instead of recursion, so the depth of node is not
+    limited by the recursion limit. Each frame has a stage, for the checks
+    that are done after some of its children are typed.
+    """
+    types: list[Ty] = []
+    stack: list[tuple[Node, Context, int]] = [(node, context, 0)]
+    while stack:
+        node, context, stage = stack.pop()
+        match node:
+            case TrueNode() | FalseNode():
+                types.append(BoolTy())
+            case IfNode(cond, then, else_):
+                if stage == 0:
+                    stack.append((node, context, 1))
+                    stack.append((cond, context, 0))
+                elif stage == 1:
+                    if types.pop() != BoolTy():
+                        raise TypeError("If condition should be bool")
+                    stack.append((node, context, 2))
+                    stack.append((else_, context, 0))
+                    stack.append((then, context, 0))
                 else:
-                    raise TypeError("Mismatched types of if-arms")
-            else:
-                raise TypeError("If condition should be bool")
-        case VarNode(idx, _):
-            return context.get_type(idx)
-        case AbsNode(var_name, ty, body):
-            new_context = context.clone()
-            new_context.add_binding(var_name, VarBinding(ty))
-            ret_ty = typeof(body, new_context)
-            return ArrowTy(ty, ret_ty)
-        case AppNode(t1, t2):
-            ty1, ty2 = typeof(t1, context), typeof(t2, context)
-            match ty1:
-                case ArrowTy(ty11, ty12):
-                    if ty11 == ty2:
-                        return ty12
-                    else:
-                        raise TypeError("Parameter type mismatch")
-                case _: raise TypeError("First term of abstraction should be arrow type")
+                    else_ty = types.pop()
+                    if types[-1] != else_ty:
+                        raise TypeError("Mismatched types of if-arms")
+            case VarNode(idx, _):
+                types.append(context.get_type(idx))
+            case AbsNode(var_name, ty, body):
+                if stage == 0:
+                    new_context = context.clone()
+                    new_context.add_binding(var_name, VarBinding(ty))
+                    stack.append((node, context, 1))
+                    stack.append((body, new_context, 0))
+                else:
+                    types.append(ArrowTy(ty, types.pop()))
+            case AppNode(t1, t2):
+                if stage == 0:
+                    stack.append((node, context, 1))
+                    stack.append((t2, context, 0))
+                    stack.append((t1, context, 0))
+                    continue
+                ty2, ty1 = types.pop(), types.pop()
+                match ty1:
+                    case ArrowTy(ty11, ty12):
+                        if ty11 == ty2:
+                            types.append(ty12)
+                        else:
+                            raise TypeError("Parameter type mismatch")
+                    case _: raise TypeError("First term of abstraction should be arrow type")
+            case _:
+                raise Exception(f"Unknown node {node}")
+    return types.pop()
 
 
 def run(cmd, context, mode="eval"):
+    """Evaluate or type check cmd and print the result
+
+    mode: "eval" for stepping on the tree, "type" for the type, "compile" to
+        type check and then evaluate by compiling to closures. Terms with free
+        variables from the context are stepped on the tree. "optimize" to type
+        check, partially evaluate with `optimize.optimize` and then step.
+    """
     if isinstance(cmd, BindNode):
         context.add_binding(cmd.name, cmd.binding)
         print(cmd.name)
     elif mode == "eval":
-        print(eval_node(cmd, context))
+        print(pprint_term(eval_node(cmd, context), context))
     elif mode == "type":
-        print(typeof(cmd, context))
+        print(pprint_term(typeof(cmd, context), context))
+    elif mode == "compile":
+        typeof(cmd, context)
+        try:
+            val = eval_compiled(cmd, len(context))
+        except OpenTerm:
+            val = eval_node(cmd, context)
+        print(pprint_term(val, context))
+    elif mode == "optimize":
+        from optimize import optimize
+        typeof(cmd, context)
+        cmd, _ = optimize(cmd)
+        print(pprint_term(eval_node(cmd, context), context))
+    else:
+        raise ValueError(f"Unknown mode {mode}")
 
 
 def main():
@@ -0,0 +1,330 @@
+import io
+import random
+
+import numpy as np
+from contextlib import redirect_stdout
+
+from bench_context import nest
+from bench_deep import app_spine, if_chain, let_chain, tree_abs, tree_spine
+from closures import OpenTerm, eval_compiled
+from context import Context, _ContextElem
+from gen import Mix, generate, random_type
+from optimize import optimize, size
+from nodes import (AbsNode, AppNode, ArrowTy, BoolTy, FalseNode, IfNode, TrueNode,
+                   VarBinding, VarNode)
+from parser import parse, parse_tree
+from printer import pprint_term
+from run import eval_node, run, typeof
+from truth import MAX_ARITY, BoolFunction
+
+
+class ListContext(Context):
+    """The context as it was before it was persistent, backed by a list"""
+
+    def __init__(self) -> None:
+        self.items: list[_ContextElem] = []
+
+    def clone(self):
+        ctx = ListContext()
+        ctx.items = self.items.copy()
+        return ctx
+
+    @property
+    def data(self):
+        return self.items
+
+    def add_binding(self, name, binding):
+        self.items.append(_ContextElem(name, binding))
+
+    def find_binding(self, name):
+        for i, binding in enumerate(reversed(self.items)):
+            if binding.name == name:
+                return i, binding
+        raise ValueError
+
+    def get_binding(self, idx):
+        return self.items[~idx]
+
+    def pop_binding(self):
+        self.items.pop()
+
+    def __len__(self):
+        return len(self.items)
+
+
+def same_context(ctx: Context, old: ListContext):
+    assert len(ctx) == len(old) and ctx.data == old.data
+    for idx in range(len(old)):
+        assert ctx.get_binding(idx) == old.get_binding(idx)
+        assert ctx.get_type(idx) == old.get_type(idx)
+    for name in "abcdz":
+        try:
+            expected = old.find_binding(name)
+        except ValueError:
+            expected = None
+        try:
+            assert ctx.find_binding(name) == expected
+        except ValueError:
+            assert expected is None
+    if len(old):
+        assert ctx.top == old.top
+    for idx in (len(old), len(old) + 7):
+        try:
+            ctx.get_binding(idx)
+        except IndexError:
+            pass
+        else:
+            raise AssertionError(idx)
+
+
+rng = random.Random(0)
+tys = [BoolTy(), ArrowTy(BoolTy(), BoolTy())]
+contexts = [(Context(), ListContext())]
+for _ in range(3000):
+    ctx, old = rng.choice(contexts)
+    op = rng.random()
+    if op < 0.55:
+        name, ty = rng.choice("abcd"), rng.choice(tys)
+        ctx.add_binding(name, VarBinding(ty))
+        old.add_binding(name, VarBinding(ty))
+    elif op < 0.8 and len(old):
+        ctx.pop_binding()
+        old.pop_binding()
+    elif op < 0.9:
+        # the clones share cells, which must not change under the original
+        contexts.append((ctx.clone(), old.clone()))
+    same_context(ctx, old)
+for ctx, old in contexts:
+    same_context(ctx, old)
+try:
+    Context().pop_binding()
+except IndexError:
+    pass
+else:
+    raise AssertionError("pop from empty context")
+
+# typing in either context gives the same types and errors
+for depth in (1, 2, 5, 64, 301):
+    ctx, old = Context(), ListContext()
+    ctx.add_binding("w", VarBinding(BoolTy()))
+    old.add_binding("w", VarBinding(BoolTy()))
+    node = nest(depth)
+    assert pprint_term(typeof(node, ctx), ctx) == pprint_term(typeof(node, old), old)
+for source in ["lambda x:Bool. lambda f:Bool->Bool. f x;", "lambda x:Bool. x x;",
+               "lambda x:Bool. lambda y:Bool->Bool. if y then x else x;",
+               "lambda x:Bool. lambda y:Bool->Bool. if x then x else y;"]:
+    (node,) = parse(source)
+    results = []
+    for ctx in (Context(), ListContext()):
+        try:
+            results.append(pprint_term(typeof(node, ctx), ctx))
+        except TypeError as e:
+            results.append(str(e))
+    assert results[0] == results[1], results
+print("context: ok")
+
+# compiled closures give the same values as stepping on the tree
+for seed in range(300):
+    ty = [BoolTy(), ArrowTy(BoolTy(), BoolTy()), ArrowTy(ArrowTy(BoolTy(), BoolTy()), BoolTy())][seed % 3]
+    mix = [Mix(), Mix(abs=1, app=4, if_=1), Mix(abs=1, app=1, if_=4)][seed // 3 % 3]
+    node = generate(ty, 40, seed=seed, mix=mix)
+    assert typeof(node, Context()) == ty
+    assert eval_compiled(node, 0) == eval_node(node, Context())
+ctx = Context()
+ctx.add_binding("w", VarBinding(BoolTy()))
+try:
+    eval_compiled(AppNode(AbsNode("x", BoolTy(), VarNode(0, 2)), VarNode(0, 1)), 1)
+except OpenTerm:
+    pass
+else:
+    raise AssertionError("free variable")
+# far deeper than the recursion limit, to compile and to run
+deep = TrueNode()
+for _ in range(100_000):
+    deep = AppNode(AbsNode("x", BoolTy(), VarNode(0, 1)), deep)
+assert eval_compiled(deep, 0) == TrueNode()
+
+
+def output(source: str, mode: str) -> str:
+    ctx, out = Context(), io.StringIO()
+    with redirect_stdout(out):
+        for cmd in parse(source):
+            run(cmd, ctx, mode)
+    return out.getvalue()
+
+
+source = """
+    y: Bool;
+    if y then true else false;
+    (lambda x:Bool. x) y;
+    (lambda x:Bool->Bool. if x false then true else false) (lambda x:Bool. if x then false else true);
+    (lambda f:Bool->Bool. lambda x:Bool. f (f x)) (lambda x:Bool. x);
+"""
+assert output(source, "compile") == output(source, "eval")
+print("compile: ok")
+
+# tables give the same results as applying the compiled closures
+xor = "lambda a:Bool. lambda b:Bool. if a then (if b then false else true) else b"
+for arity in (1, 3, 10, MAX_ARITY + 1):
+    body = "x0"
+    for i in range(1, arity):
+        body = f"(({xor}) ({body})) x{i}"
+    (node,) = parse("".join(f"lambda x{i}:Bool. " for i in range(arity)) + body + ";")
+    fn = BoolFunction(node, typeof(node, Context()))
+    assert (fn.table is None) == (arity > MAX_ARITY)
+    inputs = np.random.default_rng(arity).integers(0, 2, size=(500, arity)).astype(bool)
+    results = fn.apply(inputs)
+    assert results.tolist() == [fn._apply(row) for row in inputs.tolist()]
+    assert results.tolist() == (inputs.sum(axis=1) % 2 == 1).tolist()
+(node,) = parse("lambda f:Bool->Bool. lambda x:Bool. f (f x);")
+higher = BoolFunction(node, typeof(node, Context()))
+args = parse("lambda y:Bool. if y then false else true; true; lambda y:Bool. false; false;")
+assert higher.table is None
+assert higher.apply([args[:2], args[2:]]).tolist() == [True, False]
+print("truth: ok")
+
+# optimizing keeps the type and the value of closed terms
+for seed in range(200):
+    ty = [BoolTy(), ArrowTy(BoolTy(), BoolTy())][seed % 2]
+    mix = [Mix(), Mix(abs=1, app=4, if_=1), Mix(abs=1, app=1, if_=4)][seed // 2 % 3]
+    node = generate(ty, 60, seed=seed, mix=mix)
+    opt, stats = optimize(node)
+    assert typeof(opt, Context()) == ty
+    assert stats.size_before == size(node) and stats.size_after == size(opt)
+    for arg in ([None] if ty == BoolTy() else [TrueNode(), FalseNode()]):
+        applied = (lambda t: t) if arg is None else (lambda t: AppNode(t, arg))
+        assert eval_node(applied(opt), Context()) == eval_node(applied(node), Context())
+# only values are inlined, a bound variable isn't one
+(node,) = parse("lambda y:Bool. (lambda x:Bool. if x then x else false) y;")
+assert optimize(node) == (node, optimize(node)[1]) and optimize(node)[1].removed == 0
+(node,) = parse("lambda y:Bool. (lambda x:Bool. if x then x else false) true;")
+opt, stats = optimize(node)
+assert pprint_term(opt, Context()) == "(lambda y:Bool. true)" and stats.removed == 2
+# far deeper than the recursion limit
+deep = TrueNode()
+for _ in range(100_000):
+    deep = IfNode(TrueNode(), AppNode(AbsNode("x", BoolTy(), VarNode(0, 2)), deep), FalseNode())
+opt, stats = optimize(AbsNode("y", BoolTy(), deep))
+assert opt == AbsNode("y", BoolTy(), TrueNode()) and stats.removed == 200_000
+print("optimize: ok")
+
+# generated terms have the requested type, and the seed fixes them
+ctx = Context()
+ctx.add_binding("p", VarBinding(BoolTy()))
+ctx.add_binding("f", VarBinding(ArrowTy(BoolTy(), BoolTy())))
+for seed in range(100):
+    rng = random.Random(seed)
+    ty = random_type(rng, 3)
+    mix = Mix(*(rng.choice((0.0, 1.0, 4.0)) for _ in range(5)))
+    node = generate(ty, rng.randrange(1, 300), max_depth=rng.randrange(1, 20),
+                    seed=seed, mix=mix, context=ctx)
+    assert typeof(node, ctx) == ty
+    assert generate(ty, size(node), seed=seed + 1) == generate(ty, size(node), seed=seed + 1)
+    if seed % 10 == 0:
+        # printed as source text that parses back to the same term
+        source = "p: Bool; f: Bool->Bool; " + pprint_term(node, ctx) + ";"
+        assert parse(source)[-1] == node
+# only leaves, and those only constants without variables
+node = generate(BoolTy(), 1000, mix=Mix(abs=0, app=0, if_=0, var=1, const=0))
+assert node in (TrueNode(), FalseNode())
+node = generate(ArrowTy(BoolTy(), BoolTy()), 1000, mix=Mix(abs=0, app=0, if_=0))
+assert isinstance(node, AbsNode) and size(node) == 2
+# about the requested size, and far deeper than the recursion limit
+node = generate(BoolTy(), 50_000, max_depth=10**6, mix=Mix(abs=0, app=0, if_=1, var=0))
+assert size(node) >= 50_000 and typeof(node, Context()) == BoolTy()
+deep = generate(BoolTy(), 200_000, max_depth=10**6, seed=3, mix=Mix(abs=1, app=1, if_=0))
+assert typeof(deep, Context()) == BoolTy()
+print("gen: ok")
+
+
+def recursive_typeof(node, context):
+    """typeof as it was before it used an explicit stack"""
+    match node:
+        case TrueNode() | FalseNode(): return BoolTy()
+        case IfNode(cond, then, else_):
+            if recursive_typeof(cond, context) == BoolTy():
+                ret_ty = recursive_typeof(then, context)
+                if ret_ty == recursive_typeof(else_, context):
+                    return ret_ty
+                else:
+                    raise TypeError("Mismatched types of if-arms")
+            else:
+                raise TypeError("If condition should be bool")
+        case VarNode(idx, _):
+            return context.get_type(idx)
+        case AbsNode(var_name, ty, body):
+            new_context = context.clone()
+            new_context.add_binding(var_name, VarBinding(ty))
+            ret_ty = recursive_typeof(body, new_context)
+            return ArrowTy(ty, ret_ty)
+        case AppNode(t1, t2):
+            ty1, ty2 = recursive_typeof(t1, context), recursive_typeof(t2, context)
+            match ty1:
+                case ArrowTy(ty11, ty12):
+                    if ty11 == ty2:
+                        return ty12
+                    else:
+                        raise TypeError("Parameter type mismatch")
+                case _: raise TypeError("First term of abstraction should be arrow type")
+
+
+def random_term(rng: random.Random, depth: int, level: int):
+    """Random term that is mostly ill typed, with level variables in scope"""
+    choice = rng.randrange(6 if depth else 3)
+    if choice == 0:
+        return TrueNode()
+    if choice == 1:
+        return FalseNode()
+    if choice == 2:
+        return VarNode(rng.randrange(level), level) if level else TrueNode()
+    if choice == 3:
+        return AbsNode("x", random_type(rng, 2), random_term(rng, depth - 1, level + 1))
+    if choice == 4:
+        return AppNode(random_term(rng, depth - 1, level), random_term(rng, depth - 1, level))
+    return IfNode(*(random_term(rng, depth - 1, level) for _ in range(3)))
+
+
+def type_or_error(typeof, node, ctx):
+    try:
+        return typeof(node, ctx)
+    except TypeError as e:
+        return str(e)
+
+
+# the explicit stack gives the same types and the same first error
+ctx = Context()
+ctx.add_binding("w", VarBinding(BoolTy()))
+ctx.add_binding("f", VarBinding(ArrowTy(BoolTy(), BoolTy())))
+rng = random.Random(1)
+results = set()
+for _ in range(3000):
+    node = random_term(rng, rng.randrange(1, 7), 2)
+    expected = type_or_error(recursive_typeof, node, ctx)
+    assert type_or_error(typeof, node, ctx) == expected
+    results.add(expected if isinstance(expected, str) else type(expected))
+assert len(results) == 6, results
+for make in (app_spine, if_chain, let_chain):
+    assert typeof(make(30_000), ctx) == BoolTy()
+deep = AppNode(VarNode(1, 2), app_spine(30_000))
+assert type_or_error(typeof, deep, ctx) == "First term of abstraction should be arrow type"
+deep = IfNode(app_spine(30_000), TrueNode(), AbsNode("x", BoolTy(), TrueNode()))
+assert type_or_error(typeof, deep, ctx) == "Mismatched types of if-arms"
+# parsing builds the same nodes, at any depth
+node = parse_tree(tree_spine(30_000), ctx.clone())
+for _ in range(30_000):
+    assert node.child1 == VarNode(0, 2)
+    node = node.child2
+assert node == IfNode(AppNode(VarNode(0, 2), TrueNode()), TrueNode(), FalseNode())
+node = parse_tree(tree_abs(30_000), ctx.clone())
+for _ in range(30_000 - 1):
+    node = node.body
+assert node == AbsNode("x", BoolTy(), VarNode(0, 30_002))
+(node,) = parse("lambda x:Bool->(Bool->Bool)->Bool. x;")
+assert node.ty == ArrowTy(BoolTy(), ArrowTy(ArrowTy(BoolTy(), BoolTy()), BoolTy()))
+try:
+    parse("lambda x:Bool. y;")
+except Exception as e:
+    assert str(e) == "Unbound variable y"
+else:
+    raise AssertionError("unbound variable")
+print("typeof: ok")
@@ -0,0 +1,130 @@
+"""Truth tables of closed Boolean functions, applied to batches with NumPy.
+
+A closed, well typed term of type `Bool->...->Bool` with n arguments is a
+function on n bits, so it is evaluated on all 2^n inputs once, and the results
+are packed into a bitmask. Applying it to a batch of inputs is then a
+vectorized lookup, independent of the size of the term.
+
+Terms with higher-order arguments, or too many arguments for a table, are
+applied to each input by evaluating their compiled closures instead.
+"""
+import numpy as np
+
+from closures import Value, compile_node, run_code
+from nodes import ArrowTy, BoolTy, Node, Ty
+
+# largest arity for which a table is built. Building it evaluates the
+# function 2^n times and needs 2^n bytes, and the packed table is 2^n / 8 bytes
+MAX_ARITY = 16
+
+
+def signature(ty: Ty) -> tuple[list[Ty], Ty]:
+    """Argument types and result type of ty"""
+    args = []
+    while isinstance(ty, ArrowTy):
+        args.append(ty.ty1)
+        ty = ty.ty2
+    return args, ty
+
+
+def truth_table(fun: Value, arity: int) -> np.ndarray:
+    """Results of fun on all inputs, packed into bits
+
+    Bit i of an input is its argument i, counting from the first. Partial
+    applications are shared between inputs with the same prefix.
+    """
+    results = np.zeros(1 << arity, dtype=bool)
+    stack = [(fun, 0, 0)]
+    while stack:
+        val, applied, idx = stack.pop()
+        if applied == arity:
+            results[idx] = val
+            continue
+        stack.append((val(False), applied + 1, idx))  # type: ignore
+        stack.append((val(True), applied + 1, idx | 1 << applied))  # type: ignore
+    return np.packbits(results, bitorder="little")
+
+
+class BoolFunction:
+    """Closed, well typed term whose type ends in Bool, for applying to batches
+
+    table: Packed truth table, or None if an argument isn't Bool or there are
+        more than MAX_ARITY arguments
+    """
+
+    def __init__(self, node: Node, ty: Ty) -> None:
+        args, res = signature(ty)
+        if not isinstance(res, BoolTy):
+            raise TypeError(f"Result should be Bool, not {res}")
+        self.arity = len(args)
+        self.first_order = all(isinstance(arg, BoolTy) for arg in args)
+        self.fun = run_code(compile_node(node))
+        self.table = None
+        if self.first_order and self.arity <= MAX_ARITY:
+            self.table = truth_table(self.fun, self.arity)
+
+    def _apply(self, args) -> bool:
+        val = self.fun
+        for arg in args:
+            val = val(arg)  # type: ignore
+        return val  # type: ignore
+
+    def apply(self, inputs) -> np.ndarray:
+        """Results for a batch of inputs
+
+        inputs: For a first-order function, an array with a row of n bools per
+            input. Otherwise, rows of n closed, well typed argument nodes.
+        """
+        if self.table is None:
+            if self.first_order:
+                rows = np.asarray(inputs, dtype=bool).tolist()
+            else:
+                rows = [[run_code(compile_node(arg)) for arg in row] for row in inputs]
+            return np.fromiter((self._apply(row) for row in rows), dtype=bool, count=len(rows))
+        inputs = np.asarray(inputs, dtype=bool).reshape(len(inputs), self.arity)
+        idx = inputs.astype(np.int64) @ (np.int64(1) << np.arange(self.arity, dtype=np.int64))
+        return (self.table[idx >> 3] >> (idx & 7) & 1).astype(bool)
+
+
+def main():
+    """Compare with evaluating the compiled term on each input"""
+    import time
+
+    from context import Context
+    from parser import parse
+    from run import typeof
+
+    # majority of the first three arguments, xor'ed with the rest
+    xor = "lambda a:Bool. lambda b:Bool. if a then (if b then false else true) else b"
+    maj = "lambda a:Bool. lambda b:Bool. lambda c:Bool. if a then (if b then true else c) else (if b then c else false)"
+    names = [f"x{i}" for i in range(8)]
+    # application is right associative, so it needs parentheses
+    body = f"((({maj}) x0) x1) x2"
+    for name in names[3:]:
+        body = f"(({xor}) ({body})) {name}"
+    source = "".join(f"lambda {name}:Bool. " for name in names) + body + ";"
+    (node,) = parse(source)
+    fn = BoolFunction(node, typeof(node, Context()))
+
+    rng = np.random.default_rng(0)
+    inputs = rng.integers(0, 2, size=(200_000, len(names))).astype(bool)
+    start = time.perf_counter()
+    table = fn.apply(inputs)
+    vectorized = time.perf_counter() - start
+    start = time.perf_counter()
+    plain = np.array([fn._apply(row) for row in inputs.tolist()])
+    per_input = time.perf_counter() - start
+    assert (table == plain).all()
+    print(f"{len(inputs)} inputs of arity {fn.arity}: "
+          f"{per_input:.3f}s evaluating each, {vectorized:.3f}s by table")
+
+    # higher-order argument, so there is no table
+    (apply_twice,) = parse("lambda f:Bool->Bool. lambda x:Bool. f (f x);")
+    higher = BoolFunction(apply_twice, typeof(apply_twice, Context()))
+    args = parse("lambda y:Bool. if y then false else true; true; lambda y:Bool. false; false;")
+    assert higher.table is None
+    assert higher.apply([args[:2], args[2:]]).tolist() == [True, False]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Benchmark of parsing and type checking very deep terms.
+
+All of these are far deeper than the recursion limit, so they only work with
+the explicit-stack `parse_tree` and `typeof`. The parse trees are built
+directly, since the Earley parser is slow on inputs this large:
+
+    python bench_deep.py [depth]
+"""
+import sys
+import time
+
+from lark.lexer import Token
+from lark.tree import Tree
+
+from context import Context
+from nodes import (AbsNode, AppNode, ArrowTy, BoolTy, IfNode, Node, ProjNode, RecordNode,
+                   TopTy, TrueNode, VarBinding, VarNode)
+from parser import parse_tree
+from run import typeof
+
+
+def app_spine(depth: int) -> Node:
+    """f (f (... (f true)))"""
+    node: Node = TrueNode()
+    for _ in range(depth):
+        node = AppNode(VarNode(0, 1), node)
+    return node
+
+
+def if_chain(depth: int) -> Node:
+    """if w then {a=w} else if w then {a=w, b=w} else ... {a=w}
+
+    Every arm is a record, so every level joins two record types.
+    """
+    node: Node = RecordNode.of({"a": VarNode(1, 2)})
+    for level in range(depth):
+        arm = RecordNode.of({"a": VarNode(1, 2), "b": VarNode(1, 2)} if level % 2 else {"a": VarNode(1, 2)})
+        node = IfNode(VarNode(1, 2), arm, node)
+    return node
+
+
+def record_nest(depth: int) -> Node:
+    """{a={a=... {a=w} ...}, b=w}.a.a ... .a"""
+    node: Node = VarNode(1, 2)
+    for _ in range(depth):
+        node = RecordNode.of({"a": node, "b": VarNode(1, 2)})
+    for _ in range(depth):
+        node = ProjNode(node, "a")
+    return node
+
+
+def tree_spine(depth: int) -> Tree:
+    """The parse tree of f (f (... (f {a=true}.a)))"""
+    f = Tree("var", [Token("CNAME", "f")])
+    rcd = Tree("record", [Tree("rcd_field", [Token("CNAME", "a"), Tree("true", [])])])
+    tree = Tree("proj", [rcd, Token("CNAME", "a")])
+    for _ in range(depth):
+        tree = Tree("app", [f, tree])
+    return tree
+
+
+def tree_abs(depth: int) -> Tree:
+    """The parse tree of lambda x:Top. lambda x:Top. ... x"""
+    tree = Tree("var", [Token("CNAME", "x")])
+    for _ in range(depth):
+        tree = Tree("abs", [Token("CNAME", "x"), TopTy(), tree])
+    return tree
+
+
+def timed(name: str, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    print(f"{name:>30}: {time.perf_counter() - start:8.3f}s")
+    return result
+
+
+def main(depth=100_000):
+    print(f"depth {depth}, recursion limit {sys.getrecursionlimit()}")
+    ctx = Context()
+    ctx.add_binding("w", VarBinding(BoolTy()))
+    ctx.add_binding("f", VarBinding(ArrowTy(TopTy(), BoolTy())))
+
+    assert timed("typeof application spine", typeof, app_spine(depth), ctx) == BoolTy()
+    ty = timed("typeof if chain", typeof, if_chain(depth), ctx)
+    assert ty.shape.labels == ("a",)
+    assert timed("typeof record nest", typeof, record_nest(depth), ctx) == BoolTy()
+
+    node = timed("parse_tree application spine", parse_tree, tree_spine(depth), ctx)
+    assert timed("typeof parsed spine", typeof, node, ctx) == BoolTy()
+    node = timed("parse_tree abstractions", parse_tree, tree_abs(depth), ctx)
+    for _ in range(depth - 1):
+        assert isinstance(node, AbsNode)
+        node = node.body
+    assert node == AbsNode("x", TopTy(), VarNode(0, depth + 2))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,72 @@
+"""Benchmark of type checking long if chains whose arms are wide records.
+
+Every arm has the same `width` labels, some with Bool and some with Top
+fields, plus a label of its own, so the join of the chain keeps `width`
+labels and has to join the types of each of them. Type checking should take
+about the same time per field for all sizes:
+
+    python bench_join.py [arms] [width]
+"""
+import sys
+import time
+
+from context import Context
+from nodes import BoolTy, IfNode, Node, RecordNode, RecordTy, TopTy, VarBinding, VarNode
+from run import _fold, clear_caches, join, join_all, typeof
+
+
+def chain(arms: int, width: int) -> Node:
+    """if w then {l0=w, ..., own0=w} else if w then {l0=t, ..., own1=w} else ..."""
+    w, t = VarNode(1, 2), VarNode(0, 2)
+
+    def arm(i: int) -> Node:
+        fields: dict[str, Node] = {f"l{j}": t if i % 2 and j % 3 == 0 else w for j in range(width)}
+        fields[f"own{i}"] = w
+        return RecordNode.of(fields)
+
+    node = arm(arms - 1)
+    for i in reversed(range(arms - 1)):
+        node = IfNode(w, arm(i), node)
+    return node
+
+
+def arms_of(node: Node) -> list[Node]:
+    arms = []
+    while isinstance(node, IfNode):
+        arms.append(node.then)
+        node = node.else_
+    return arms + [node]
+
+
+def main(*sizes: int):
+    """Scales the number of arms with 100 fields each, then the fields of 100 arms"""
+    ctx = Context()
+    ctx.add_binding("w", VarBinding(BoolTy()))
+    ctx.add_binding("t", VarBinding(TopTy()))
+    sizes = sizes or (100, 200, 400, 800)
+    print(f"{'arms':>6} {'width':>6} {'fields':>8} {'secs':>8} {'us/field':>9} {'join_all':>9} {'pairwise':>9}")
+    for arms, width in [(n, 100) for n in sizes] + [(100, n) for n in sizes]:
+        node = chain(arms, width)
+        clear_caches()
+        start = time.perf_counter()
+        ty = typeof(node, ctx)
+        secs = time.perf_counter() - start
+        assert isinstance(ty, RecordTy) and len(ty.shape) == width
+
+        # just the join of the arms, at once and two records at a time
+        tys = [typeof(arm, ctx) for arm in arms_of(node)]
+        clear_caches()
+        start = time.perf_counter()
+        assert join_all(tys) is ty
+        at_once = time.perf_counter() - start
+        clear_caches()
+        start = time.perf_counter()
+        assert _fold(join, tys) is ty
+        pairwise = time.perf_counter() - start
+        fields = arms * (width + 1)
+        print(f"{arms:>6} {width:>6} {fields:>8} {secs:>8.3f} {secs / fields * 1e6:>9.2f} "
+              f"{at_once:>9.3f} {pairwise:>9.3f}")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,80 @@
+"""Benchmark of evaluating records with many fields that aren't values yet.
+
+The record is the argument of an abstraction that projects one of its
+fields, so it is evaluated and then checked with `is_val` before the
+substitution. Compares `eval_node` with a small step rule, which steps the
+first field that isn't a value once per step of the record and checks all
+the fields again every time:
+
+    python bench_record_eval.py [widths...]
+"""
+import sys
+import time
+
+from context import Context
+from nodes import (AbsNode, AppNode, BoolTy, FalseNode, IfNode, Node, ProjNode, RecordNode,
+                   RecordTy, TrueNode, VarNode)
+from run import NoRuleApplies, eval_, eval_node, typeof
+
+
+def program(width: int) -> Node:
+    """(lambda r:{l0:Bool, ...}. r.l<last>) {l0=if true then false else true, ...}"""
+    redex = IfNode(TrueNode(), FalseNode(), TrueNode())
+    labels = [f"l{i}" for i in range(width)]
+    rcd = RecordNode.of({lab: redex for lab in labels})
+    ty = RecordTy.of({lab: BoolTy() for lab in labels})
+    return AppNode(AbsNode("r", ty, ProjNode(VarNode(0, 1), labels[-1])), rcd)
+
+
+def small_step(node: Node, context: Context) -> Node:
+    """One step of node, where records step like `if` conditions"""
+    def is_val(node: Node):
+        if isinstance(node, RecordNode):
+            return all(is_val(value) for value in node.values)
+        return isinstance(node, (AbsNode, TrueNode, FalseNode))
+
+    match node:
+        case AppNode(AbsNode() as t1, t2) if not is_val(t2):
+            return AppNode(t1, small_step(t2, context))
+        case RecordNode(shape, values, _, order):
+            for i in node.source_slots:
+                if not is_val(values[i]):
+                    return RecordNode(shape, (*values[:i], eval_(values[i], context), *values[i + 1:]),
+                                      0, order)
+            raise NoRuleApplies
+    return eval_(node, context)
+
+
+def eval_small_step(node: Node, context: Context) -> Node:
+    while True:
+        try:
+            node = small_step(node, context)
+        except NoRuleApplies:
+            return node
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    res = fn(*args)
+    return res, time.perf_counter() - start
+
+
+def main(*widths: int, small_step_max=2000):
+    widths = widths or (500, 1000, 2000, 10_000)
+    ctx = Context()
+    print(f"{'width':>6} {'small step secs':>16} {'secs':>8}")
+    for width in widths:
+        node = program(width)
+        assert typeof(node, ctx) == BoolTy()
+        res, secs = timed(eval_node, node, ctx)
+        assert res == FalseNode()
+        old_secs = "-"
+        if width <= small_step_max:
+            old, old_time = timed(eval_small_step, node, ctx)
+            assert old == res
+            old_secs = f"{old_time:.3f}"
+        print(f"{width:>6} {old_secs:>16} {secs:>8.3f}")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
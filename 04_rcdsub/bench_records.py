@@ -0,0 +1,73 @@
+"""Benchmark of the memory of records with the same fields.
+
+Compares records that share a `Shape` and keep their fields in a tuple with
+records that each have a dict of their fields, which is how they used to be
+stored, and times projecting every field out of them, by label and by the
+slots that `typeof` resolves:
+
+    python bench_records.py [count] [width]
+"""
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+from nodes import Node, ProjNode, RecordNode, TrueNode
+
+
+@dataclass
+class DictRecordNode(Node):
+    fields: dict[str, Node]
+
+
+def measure(make, count: int):
+    """Peak memory in bytes per record of making count records"""
+    tracemalloc.start()
+    records = [make(i) for i in range(count)]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return records, peak / count
+
+
+def main(count=100_000, width=8):
+    labels = [f"label{i}" for i in range(width)]
+    values = [TrueNode() for _ in range(count)]
+    print(f"{count} records of {width} fields")
+
+    def dict_node(i: int):
+        return DictRecordNode({lab: values[i] for lab in labels})
+
+    def shape_node(i: int):
+        return RecordNode.of({lab: values[i] for lab in labels})
+
+    old, old_bytes = measure(dict_node, count)
+    new, new_bytes = measure(shape_node, count)
+    print(f"{'bytes':>12}: {old_bytes:8.1f} dict {new_bytes:8.1f} shape")
+    assert all(rcd.shape is new[0].shape for rcd in new)
+
+    projs = [ProjNode(None, lab) for lab in labels]  # type: ignore
+    start = time.perf_counter()
+    for rcd in old:
+        for proj in projs:
+            rcd.fields[proj.label]
+    old_secs = time.perf_counter() - start
+    start = time.perf_counter()
+    for rcd in new:
+        slots = rcd.shape.slots
+        for proj in projs:
+            rcd.values[slots[proj.label]]
+    label_secs = time.perf_counter() - start
+    shape = new[0].shape
+    projs = [ProjNode(None, lab, shape, shape.slots[lab]) for lab in labels]  # type: ignore
+    start = time.perf_counter()
+    for rcd in new:
+        for proj in projs:
+            # as in `eval_`
+            if proj.shape is rcd.shape:
+                rcd.values[proj.slot]
+    print(f"{'projection':>12}: {old_secs:7.3f}s dict {label_secs:7.3f}s label "
+          f"{time.perf_counter() - start:7.3f}s slot")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,46 @@
+"""Benchmark of the subtype, join and meet caches on a record heavy program.
+
+Every level applies a function on records to an `if` whose arms are records
+of the same few shapes, so the same type pairs come up over and over:
+
+    python bench_subtype.py [levels] [width]
+"""
+import sys
+import time
+
+from context import Context
+from nodes import AppNode, ArrowTy, BoolTy, IfNode, Node, RecordNode, RecordTy, VarBinding, VarNode
+from run import cache_stats, clear_caches, typeof
+
+
+def program(levels: int, width: int) -> Node:
+    """f (if w then {l0=w, ...} else {l0=f (...), ...}) ..."""
+    def record(n: int, last: Node) -> Node:
+        fields: dict[str, Node] = {f"l{i}": VarNode(1, 2) for i in range(n)}
+        fields["l0"] = last
+        return RecordNode.of(fields)
+
+    node: Node = VarNode(1, 2)
+    for level in range(levels):
+        arm = record(width + level % 3, VarNode(1, 2))
+        node = AppNode(VarNode(0, 2), IfNode(VarNode(1, 2), arm, record(width, node)))
+    return node
+
+
+def main(levels=2000, width=20):
+    ctx = Context()
+    ctx.add_binding("w", VarBinding(BoolTy()))
+    param = RecordTy.of({f"l{i}": BoolTy() for i in range(width)})
+    ctx.add_binding("f", VarBinding(ArrowTy(param, BoolTy())))
+    node = program(levels, width)
+
+    clear_caches()
+    start = time.perf_counter()
+    assert typeof(node, ctx) == BoolTy()
+    print(f"{levels} levels of {width} fields: {time.perf_counter() - start:.3f}s")
+    for name, stats in cache_stats().items():
+        print(f"{name:>8}: {stats.hits:>6} hits {stats.misses:>6} misses {stats.hit_rate:6.1%}")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
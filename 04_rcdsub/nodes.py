@@ -1,9 +1,77 @@
 import abc
-from dataclasses import dataclass
+import sys
+import weakref
+from dataclasses import dataclass, field
+from typing import Iterable, Mapping, Optional, Sequence
 
 from lark.lexer import Token
 
 
+class Shape:
+    """Sorted labels of a record, shared by all records with those labels
+
+    Shapes are interned, like types, so there is one per set of labels and
+    they are compared by identity. The fields of a record are a tuple in the
+    order of its shape's labels, and `slots` maps each label to its index.
+    The sorted order is only how the fields are stored: record literals keep
+    the order they were written in, see `RecordNode.order`.
+    """
+    _table: "weakref.WeakValueDictionary[tuple[str, ...], Shape]" = weakref.WeakValueDictionary()
+
+    def __init__(self, labels: tuple[str, ...]) -> None:
+        self.labels = labels
+        self.slots = {lab: i for i, lab in enumerate(labels)}
+        # the slots in self of the labels of other shapes, by other shape. The
+        # keys are weak, so that the entries go away with the other shapes
+        self._embeddings: "weakref.WeakKeyDictionary[Shape, Optional[tuple[int, ...]]]" = \
+            weakref.WeakKeyDictionary()
+        # the orders of the labels in records of this shape, each kept once
+        # for all the records that list the labels in that order
+        self._orders: dict[tuple[int, ...], tuple[int, ...]] = {}
+
+    @staticmethod
+    def of(labels: Iterable[str]) -> "Shape":
+        return Shape.of_sorted(tuple(sorted({sys.intern(str(lab)) for lab in labels})))
+
+    @staticmethod
+    def of_sorted(labels: tuple[str, ...]) -> "Shape":
+        """Shape of labels that are already sorted, distinct and interned"""
+        shape = Shape._table.get(labels)
+        if shape is None:
+            shape = Shape._table[labels] = Shape(labels)
+        return shape
+
+    def embedding(self, other: "Shape") -> Optional[tuple[int, ...]]:
+        """Slots in self of the labels of other, None if self lacks one
+
+        Records of shape self have all the fields of records of shape other
+        if this isn't None. The result is cached per pair of live shapes.
+        """
+        try:
+            return self._embeddings[other]
+        except KeyError:
+            pass
+        slots = self.slots
+        res = None
+        if all(lab in slots for lab in other.labels):
+            res = tuple(slots[lab] for lab in other.labels)
+        self._embeddings[other] = res
+        return res
+
+    def order(self, labels: Iterable[str]) -> Optional[tuple[int, ...]]:
+        """Slots of labels in the order given, None if it is the sorted one"""
+        order = tuple(self.slots[lab] for lab in labels)
+        if order == tuple(range(len(order))):
+            return None
+        return self._orders.setdefault(order, order)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __repr__(self):
+        return f"Shape{self.labels}"
+
+
 @dataclass
 class Node(abc.ABC):
     pass
@@ -27,13 +95,48 @@ class VarNode(Node):
 
 @dataclass
 class RecordNode(Node):
-    fields: dict[Token, Node]
+    """Record, with the fields in the order of the labels of shape
+
+    first_nonval: Number of fields in source order that are known to be
+        values. `is_val` moves it forward.
+    order: Slots of the fields in the order they were written in, None if
+        that is the order of the labels. The fields are typed, evaluated and
+        printed in this order.
+    """
+    shape: Shape
+    values: tuple[Node, ...]
+    first_nonval: int = field(default=0, compare=False, repr=False)
+    order: Optional[tuple[int, ...]] = field(default=None, compare=False, repr=False)
+
+    @staticmethod
+    def of(fields: Mapping[str, Node]) -> "RecordNode":
+        shape = Shape.of(fields)
+        return RecordNode(shape, tuple(fields[lab] for lab in shape.labels), 0, shape.order(fields))
+
+    @property
+    def source_slots(self) -> Sequence[int]:
+        """Slots of the fields in source order"""
+        return range(len(self.values)) if self.order is None else self.order
+
+    @property
+    def fields(self) -> dict[str, Node]:
+        """A new dict of the fields, by label in source order"""
+        labels, values = self.shape.labels, self.values
+        return {labels[i]: values[i] for i in self.source_slots}
 
 
 @dataclass
 class ProjNode(Node):
+    """Projection of the field label out of rcd
+
+    shape, slot: Shape of the record type of rcd and the slot of label in it,
+        set by `typeof`. Evaluating a record of that shape loads the field at
+        slot directly, without looking up label.
+    """
     rcd: Node
     label: Token
+    shape: Optional[Shape] = field(default=None, compare=False, repr=False)
+    slot: int = field(default=0, compare=False, repr=False)
 
 
 @dataclass
@@ -62,33 +165,70 @@ class BindNode(Node):
     binding: "Binding"
 
 
-@dataclass
-class Ty:
-    pass
+class _Interned(type):
+    """Metaclass that interns types
 
+    Constructing a type that is equal to a live one returns the live one, so
+    equal types are the same object, and are compared and hashed by identity.
+    The table only holds weak references, like `HashConsTable` in untyped.
+    """
+    _table: "weakref.WeakValueDictionary[tuple, Ty]" = weakref.WeakValueDictionary()
 
-@dataclass
+    def __call__(cls, *args, **kwargs):
+        ty = super().__call__(*args, **kwargs)
+        return _Interned._table.setdefault(ty._key(), ty)
+
+
+@dataclass(frozen=True, eq=False)
+class Ty(metaclass=_Interned):
+    def _key(self) -> tuple:
+        # children are interned before their parents, so their ids are stable
+        # for as long as the parent is alive
+        return (type(self), *map(id, vars(self).values()))
+
+
+@dataclass(frozen=True, eq=False)
 class BoolTy(Ty):
     pass
 
 
-@dataclass
+@dataclass(frozen=True, eq=False)
 class RecordTy(Ty):
-    fields: dict[Token, Ty]
+    """Record type, with the field types in the order of the labels of shape
 
+    Unlike record literals, types always list their fields in that order, so
+    equal types, which are the same object, print the same whichever order
+    their labels were written in.
+    """
+    shape: Shape
+    tys: tuple[Ty, ...]
 
-@dataclass
+    @staticmethod
+    def of(fields: Mapping[str, Ty]) -> "RecordTy":
+        shape = Shape.of(fields)
+        return RecordTy(shape, tuple(fields[lab] for lab in shape.labels))
+
+    def _key(self) -> tuple:
+        return (RecordTy, self.shape, *map(id, self.tys))
+
+    @property
+    def fields(self) -> dict[str, Ty]:
+        """A new dict of the fields, by label"""
+        return dict(zip(self.shape.labels, self.tys))
+
+
+@dataclass(frozen=True, eq=False)
 class ArrowTy(Ty):
     ty1: Ty
     ty2: Ty
 
 
-@dataclass
+@dataclass(frozen=True, eq=False)
 class TopTy(Ty):
     pass
 
 
-@dataclass
+@dataclass(frozen=True, eq=False)
 class BotTy(Ty):
     pass
 
@@ -0,0 +1,154 @@
+"""Partial evaluation of well typed rcdsub terms.
+
+`optimize` runs between type checking and evaluation, with the rules below
+on the shared engine in `pytapl.optimize`:
+
+* `if true then t else e` and `if false then t else e` are folded to a branch
+* a redex `(lambda x:T. body) v`, where v is a value, is inlined if x is used
+  at most once, or all copies of v fit in the budget
+* a projection `{l1=t1, ...}.li` out of a record literal is replaced by ti
+
+All of these are evaluation steps, so like evaluation, they preserve the type
+of the term up to subtyping: the new type is a subtype of the old one. Each
+one is a step that evaluation doesn't need to take anymore, or would have
+taken every time the abstraction around it is applied.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+from pytapl import optimize as engine
+from pytapl.optimize import BUDGET
+
+from nodes import (AbsNode, AppNode, FalseNode, IfNode, Node, ProjNode, RecordNode,
+                   TrueNode, VarNode)
+from run import is_val, subst_top
+
+
+@dataclass
+class Stats(engine.Stats):
+    projected: int = 0
+
+    @property
+    def removed(self):
+        """Number of reductions that were done ahead of time"""
+        return self.folded + self.inlined + self.projected
+
+
+class _Rules(engine.Rules[Node]):
+    def children(self, node: Node) -> tuple[Node, ...]:
+        # called for every node and every walk, so it avoids the slower match
+        kind = type(node)
+        if kind is AppNode:
+            return (node.child1, node.child2)  # type: ignore
+        if kind is AbsNode:
+            return (node.body,)  # type: ignore
+        if kind is IfNode:
+            return (node.cond, node.then, node.else_)  # type: ignore
+        if kind is RecordNode:
+            return node.values  # type: ignore
+        if kind is ProjNode:
+            return (node.rcd,)  # type: ignore
+        return ()
+
+    def rebuild(self, node: Node, children: list[Node]) -> Node:
+        match node:
+            case AbsNode(orig_name, ty):
+                return AbsNode(orig_name, ty, *children)
+            case AppNode():
+                return AppNode(*children)
+            case IfNode():
+                return IfNode(*children)
+            case RecordNode(shape, _, _, order):
+                return RecordNode(shape, tuple(children), 0, order)
+            case ProjNode(_, label, shape, slot):
+                return ProjNode(*children, label, shape, slot)
+        raise Exception(f"Unreachable {node}")
+
+    def binds(self, node: Node) -> bool:
+        return type(node) is AbsNode
+
+    def var_idx(self, node: Node) -> Optional[int]:
+        return node.idx if type(node) is VarNode else None  # type: ignore
+
+    def reduce(self, node: Node, children: list[Node], depth: int,
+               budget: int, stats: Stats) -> Optional[tuple[Node, bool]]:  # type: ignore
+        match node, children:
+            case IfNode(_, then, else_), [TrueNode()]:
+                stats.folded += 1
+                return then, True
+            case IfNode(_, then, else_), [FalseNode()]:
+                stats.folded += 1
+                return else_, True
+            case AppNode(), [AbsNode(_, _, body), t2] if is_val(t2):
+                count = uses(body)
+                if count <= 1 or count * size(t2) <= budget:
+                    stats.inlined += 1
+                    # the substituted copies can make new redexes
+                    return subst_top(t2, body), True
+            case ProjNode(_, label), [RecordNode(shape, values)] if label in shape.slots:
+                stats.projected += 1
+                return values[shape.slots[label]], False
+        return None
+
+
+_rules = _Rules()
+
+
+def size(node: Node) -> int:
+    return engine.size(node, _rules)
+
+
+def uses(node: Node, idx: int = 0) -> int:
+    """Number of occurrences of the variable idx in node"""
+    return engine.uses(node, _rules, idx)
+
+
+def optimize(node: Node, budget: int = BUDGET,
+             stats: Optional[Stats] = None) -> tuple[Node, Stats]:
+    """Partially evaluate the well typed node
+
+    budget: Most nodes that the copies of an inlined argument may add
+    stats: Counts the reductions that were done
+    """
+    return engine.optimize(node, _rules, budget, Stats() if stats is None else stats)  # type: ignore
+
+
+def main():
+    """Count the evaluation steps with and without optimizing"""
+    from context import Context
+    from parser import parse
+    from printer import pprint_term
+    from run import NoRuleApplies, eval_, subtype, typeof
+
+    def steps(node: Node, ctx: Context) -> int:
+        count = 0
+        while True:
+            try:
+                node = eval_(node, ctx)
+            except NoRuleApplies:
+                return count
+            count += 1
+
+    # a configuration record that is known ahead of time, like in generated code
+    prog = """
+        (lambda cfg:{debug:Bool, not:Bool->Bool}.
+            (lambda check:Bool->{value:Bool}.
+                lambda y:Bool. {first=check y, second=check (cfg.not y)}.second.value)
+            (lambda x:Bool. if cfg.debug then {value=x, trace=true} else {value=x}))
+        {debug=false, not=lambda b:Bool. if b then false else true, unused={}};
+    """
+    ctx = Context()
+    (cmd,) = parse(prog)
+    ty = typeof(cmd, ctx)
+    opt, stats = optimize(cmd)
+    assert subtype(typeof(opt, ctx), ty)
+    print(f"{stats.folded} conditionals folded, {stats.inlined} arguments inlined, "
+          f"{stats.projected} projections resolved, size {stats.size_before} -> {stats.size_after}")
+    print(pprint_term(opt, ctx))
+    for arg in (TrueNode(), FalseNode()):
+        print(f"evaluation steps on {pprint_term(arg, ctx)}: "
+              f"{steps(AppNode(cmd, arg), ctx)} -> {steps(AppNode(opt, arg), ctx)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,7 @@ from context import Context
 from lark import Lark
 from lark.lexer import Token
 from lark.tree import Tree
-from lark.visitors import Transformer
+from lark.visitors import Transformer_NonRecursive
 from nodes import (AbsNode, AppNode, ArrowTy, BindNode, BoolTy, FalseNode, ProjNode,
                    IfNode, Node, RecordNode, RecordTy, TopTy, BotTy, TrueNode, Ty,
                    VarBinding, VarNode)
@@ -13,7 +13,7 @@ with open("grammar.lark") as f:
     grammar = f.read()
 
 
-class TypeTransformer(Transformer):
+class TypeTransformer(Transformer_NonRecursive):
     def top_ty(self, _):
         return TopTy()
 
@@ -31,58 +31,94 @@ class TypeTransformer(Transformer):
                     field_types[label] = ty
                 case _ as unknown:
                     raise Exception(f"Expected field_ty instead of {unknown}")
-        return RecordTy(field_types)
+        return RecordTy.of(field_types)
 
     def arr_ty(self, children):
         return ArrowTy(children[0], children[1])
 
 
 def parse_tree(tree: str | Tree, context: Context) -> Node:
-    match tree:
-        case Tree(data="true"):
-            return TrueNode()
-        case Tree(data="false"):
-            return FalseNode()
-        case Tree(data="bind", children=[var_name, ty]):
-            var_name = cast(Token, var_name)
-            ty = cast(Ty, ty)
-            context.add_binding(var_name, VarBinding(ty))
-            return BindNode(var_name, context.top.binding)
-        case Tree(data="abs", children=[name, ty, body]):
-            name = cast(Token, name)
-            ty = cast(Ty, ty)
-            new_context = context.clone()
-            new_context.add_binding(name, VarBinding(ty))
-            return AbsNode(name, ty, parse_tree(body, new_context))
-        case Tree(data="app", children=[c1, c2]):
-            return AppNode(parse_tree(c1, context), parse_tree(c2, context))
-        case Tree(data="var", children=[var_name]):
-            var_name = cast(Token, var_name)
-            try:
-                idx, _ = context.find_binding(var_name)
-            except ValueError:
-                raise Exception(f"Unbound variable {var_name}")
-            return VarNode(idx, len(context))
-        case Tree(data="if_stmt", children=[cond, then, else_]):
-            return IfNode(parse_tree(cond, context),
-                          parse_tree(then, context),
-                          parse_tree(else_, context))
-        case Tree(data="record", children=fields):
-            subnodes: dict[Token, Node] = {}
-            for field in fields:
-                match field:
-                    case Tree(data="rcd_field", children=[label, value]):
-                        parsed = parse_tree(value, context)
-                        assert isinstance(label, Token)
-                        subnodes[label] = parsed
-                    case _:
-                        raise Exception("Unmatched", field)
-            return RecordNode(subnodes)
-        case Tree(data="proj", children=[rcd, label]):
-            assert isinstance(label, Token)
-            return ProjNode(parse_tree(rcd, context), label)
-
-    raise Exception("Unmatched", tree)
+    """Node for tree in context
+
+    Uses an explicit stack instead of recursion, so the depth of tree is not
+    limited by the recursion limit.
+    """
+    nodes: list[Node] = []
+    stack: list[tuple[str | Tree, Context, bool]] = [(tree, context, False)]
+    while stack:
+        tree, context, visited = stack.pop()
+        match tree:
+            case Tree(data="true"):
+                nodes.append(TrueNode())
+            case Tree(data="false"):
+                nodes.append(FalseNode())
+            case Tree(data="bind", children=[var_name, ty]):
+                var_name = cast(Token, var_name)
+                ty = cast(Ty, ty)
+                context.add_binding(var_name, VarBinding(ty))
+                nodes.append(BindNode(var_name, context.top.binding))
+            case Tree(data="abs", children=[name, ty, body]):
+                name = cast(Token, name)
+                ty = cast(Ty, ty)
+                if visited:
+                    nodes.append(AbsNode(name, ty, nodes.pop()))
+                else:
+                    new_context = context.clone()
+                    new_context.add_binding(name, VarBinding(ty))
+                    stack.append((tree, context, True))
+                    stack.append((body, new_context, False))
+            case Tree(data="app", children=[c1, c2]):
+                if visited:
+                    node2 = nodes.pop()
+                    nodes.append(AppNode(nodes.pop(), node2))
+                else:
+                    stack.append((tree, context, True))
+                    stack.append((c2, context, False))
+                    stack.append((c1, context, False))
+            case Tree(data="var", children=[var_name]):
+                var_name = cast(Token, var_name)
+                try:
+                    idx, _ = context.find_binding(var_name)
+                except ValueError:
+                    raise Exception(f"Unbound variable {var_name}")
+                nodes.append(VarNode(idx, len(context)))
+            case Tree(data="if_stmt", children=[cond, then, else_]):
+                if visited:
+                    else_node, then_node = nodes.pop(), nodes.pop()
+                    nodes.append(IfNode(nodes.pop(), then_node, else_node))
+                else:
+                    stack.append((tree, context, True))
+                    stack.append((else_, context, False))
+                    stack.append((then, context, False))
+                    stack.append((cond, context, False))
+            case Tree(data="record", children=fields):
+                labels: list[Token] = []
+                values: list[str | Tree] = []
+                for field in fields:
+                    match field:
+                        case Tree(data="rcd_field", children=[label, value]):
+                            assert isinstance(label, Token)
+                            labels.append(label)
+                            values.append(value)
+                        case _:
+                            raise Exception("Unmatched", field)
+                if visited:
+                    subnodes = nodes[len(nodes) - len(values):]
+                    del nodes[len(nodes) - len(values):]
+                    nodes.append(RecordNode.of(dict(zip(labels, subnodes))))
+                else:
+                    stack.append((tree, context, True))
+                    stack.extend((value, context, False) for value in reversed(values))
+            case Tree(data="proj", children=[rcd, label]):
+                assert isinstance(label, Token)
+                if visited:
+                    nodes.append(ProjNode(nodes.pop(), label))
+                else:
+                    stack.append((tree, context, True))
+                    stack.append((rcd, context, False))
+            case _:
+                raise Exception("Unmatched", tree)
+    return nodes.pop()
 
 
 p = Lark(grammar, propagate_positions=True)
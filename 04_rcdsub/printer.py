@@ -0,0 +1,67 @@
+"""Printer for rcdsub terms and types, on the shared engine in `pytapl.printer`"""
+from typing import Optional, Sequence
+
+from pytapl.printer import POP, Bind, Printer
+
+from context import Context
+from nodes import (AbsNode, AppNode, ArrowTy, BoolTy, BotTy, FalseNode, IfNode,
+                   Node, ProjNode, RecordNode, RecordTy, Shape, TopTy, TrueNode, Ty,
+                   VarNode)
+
+
+def _fields(p: Printer, shape: Shape, fields: tuple, slots: Sequence[int], sep: str,
+            depth: int) -> None:
+    """Push `{l1<sep>f1, l2<sep>f2, ...}`, with the fields at slots in order"""
+    items: list = ["}"]
+    for i, slot in enumerate(reversed(slots)):
+        if i:
+            items.append(", ")
+        items.extend(((fields[slot], depth), sep, str(shape.labels[slot])))
+    p.write("{")
+    p.work.extend(items)
+
+
+def _visit(p: Printer, node: "Node | Ty", depth: int) -> None:
+    depth += 1
+    match node:
+        case TrueNode():
+            p.write("true")
+        case FalseNode():
+            p.write("false")
+        case VarNode(idx, _):
+            p.write(p.var(idx))
+        case AbsNode(orig_name, ty, body):
+            p.write("(lambda ")
+            p.work.extend((")", POP, (body, depth), ". ", (ty, depth), ":", Bind(orig_name)))
+        case AppNode(c1, c2):
+            p.write("(")
+            p.work.extend((")", (c2, depth), " ", (c1, depth)))
+        case IfNode(cond, then, else_):
+            p.write("(if ")
+            p.work.extend((")", (else_, depth), " else ", (then, depth), " then ", (cond, depth)))
+        case RecordNode(shape, values):
+            _fields(p, shape, values, node.source_slots, "=", depth)
+        case ProjNode(rcd, label):
+            p.work.extend((f".{label}", (rcd, depth)))
+        case BoolTy():
+            p.write("Bool")
+        case TopTy():
+            p.write("Top")
+        case BotTy():
+            p.write("Bot")
+        case RecordTy(shape, tys):
+            _fields(p, shape, tys, range(len(tys)), ":", depth)
+        case ArrowTy(ArrowTy() | RecordTy() as ty1, ty2):
+            p.write("(")
+            p.work.extend(((ty2, depth), ")->", (ty1, depth)))
+        case ArrowTy(ty1, ty2):
+            p.work.extend(((ty2, depth), "->", (ty1, depth)))
+        case _:
+            raise Exception(f"Unknown node {node}")
+
+
+def pprint_term(node: "Node | Ty", context: Context, max_width: Optional[int] = None,
+                max_depth: Optional[int] = None, max_nodes: Optional[int] = None) -> str:
+    """Text of a term or type in context, see `Printer` for the limits"""
+    names = [elem.name for elem in context.data]
+    return Printer(names, max_width, max_depth, max_nodes).run(node, _visit)
@@ -1,10 +1,15 @@
+import heapq
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import groupby
 from parser import parse
-from typing import Callable, cast
+from typing import Callable, Optional, Sequence, cast
 
 from context import Context
 from nodes import (AbsNode, AppNode, ArrowTy, BindNode, BoolTy, BotTy, FalseNode,
-                   IfNode, Node, ProjNode, RecordNode, RecordTy, TopTy, TrueNode, Ty,
+                   IfNode, Node, ProjNode, RecordNode, RecordTy, Shape, TopTy, TrueNode, Ty,
                    VarBinding, VarNode)
+from printer import pprint_term
 
 
 class NoRuleApplies(Exception):
@@ -12,29 +17,60 @@ class NoRuleApplies(Exception):
 
 
 def node_map(on_var: Callable[[int, int, int], VarNode], node: Node, c: int):
-    """Map over the node tree recursively, calling `on_var` for VarNode.
+    """Map over the node tree, calling `on_var` for VarNode.
+
+    Uses an explicit stack instead of recursion, so the depth of node is not
+    limited by the recursion limit.
 
     c: Cutoff param
     """
-    match node:
-        case VarNode(idx, ctx_len):
-            return on_var(c, idx, ctx_len)
-        case AbsNode(orig_name, ty, body):
-            return AbsNode(orig_name, ty, node_map(on_var, body, c + 1))
-        case AppNode(t1, t2):
-            return AppNode(node_map(on_var, t1, c), node_map(on_var, t2, c))
-        case IfNode(cond, then, else_):
-            return IfNode(node_map(on_var, cond, c),
-                          node_map(on_var, then, c),
-                          node_map(on_var, else_, c))
-        case TrueNode() | FalseNode():
-            return node
-        case RecordNode(fields):
-            return RecordNode({lab: node_map(on_var, field, c)
-                               for lab, field in fields.items()})
-        case ProjNode(rcd, lab):
-            return ProjNode(node_map(on_var, rcd, c), lab)
-    raise Exception(f"Unreachable {node}")
+    results: list[Node] = []
+    stack: list[tuple[Node, int, bool]] = [(node, c, False)]
+    while stack:
+        node, c, visited = stack.pop()
+        match node:
+            case VarNode(idx, ctx_len):
+                results.append(on_var(c, idx, ctx_len))
+            case TrueNode() | FalseNode():
+                results.append(node)
+            case _ if visited:
+                match node:
+                    case AbsNode(orig_name, ty):
+                        results.append(AbsNode(orig_name, ty, results.pop()))
+                    case AppNode():
+                        t2 = results.pop()
+                        results.append(AppNode(results.pop(), t2))
+                    case IfNode():
+                        else_, then = results.pop(), results.pop()
+                        results.append(IfNode(results.pop(), then, else_))
+                    case RecordNode(shape, values, first_nonval, order):
+                        # values stay values, so the fields before first_nonval still are
+                        fields = tuple(results[len(results) - len(values):])
+                        del results[len(results) - len(values):]
+                        results.append(RecordNode(shape, fields, first_nonval, order))
+                    case ProjNode(_, lab, shape, slot):
+                        results.append(ProjNode(results.pop(), lab, shape, slot))
+            case AbsNode(_, _, body):
+                stack.append((node, c, True))
+                stack.append((body, c + 1, False))
+            case AppNode(t1, t2):
+                stack.append((node, c, True))
+                stack.append((t2, c, False))
+                stack.append((t1, c, False))
+            case IfNode(cond, then, else_):
+                stack.append((node, c, True))
+                stack.append((else_, c, False))
+                stack.append((then, c, False))
+                stack.append((cond, c, False))
+            case RecordNode(_, values):
+                stack.append((node, c, True))
+                stack.extend((value, c, False) for value in reversed(values))
+            case ProjNode(rcd):
+                stack.append((node, c, True))
+                stack.append((rcd, c, False))
+            case _:
+                raise Exception(f"Unreachable {node}")
+    return results.pop()
 
 
 def shift(node: Node, d: int):
@@ -66,10 +102,36 @@ def is_val(node: Node):
     if isinstance(node, (AbsNode, TrueNode, FalseNode)):
         return True
     if isinstance(node, RecordNode):
-        return all(is_val(field) for field in node.fields.values())
+        values, slots, i = node.values, node.source_slots, node.first_nonval
+        while i < len(values) and is_val(values[slots[i]]):
+            i += 1
+        node.first_nonval = i
+        return i == len(values)
     return False
 
 
+def eval_fields(node: RecordNode, context: Context) -> RecordNode:
+    """Evaluate the fields of node to values, in source order, from first_nonval
+
+    Each field is evaluated all the way in one go, instead of taking a step of
+    one field for every step of the record, which copies the fields each time.
+    Stops at the first field that gets stuck.
+    """
+    values = list(node.values)
+    slots = node.source_slots
+    i = node.first_nonval
+    while i < len(values):
+        slot = slots[i]
+        value = eval_node(values[slot], context)
+        if value is values[slot] and i == node.first_nonval:
+            raise NoRuleApplies
+        values[slot] = value
+        if not is_val(value):
+            break
+        i += 1
+    return RecordNode(node.shape, tuple(values), i, node.order)
+
+
 def eval_(node: Node, context: Context) -> Node:
     match node:
         case AppNode(AbsNode(_, _, body), t2) if is_val(t2):
@@ -84,13 +146,17 @@ def eval_(node: Node, context: Context) -> Node:
             return else_
         case IfNode(cond, then, else_):
             return IfNode(eval_(cond, context), then, else_)
-        case ProjNode(RecordNode(fields), label):
+        case ProjNode(RecordNode(shape, values), label):
+            if node.shape is shape:
+                return values[node.slot]
             try:
-                return fields[label]
+                return values[shape.slots[label]]
             except KeyError:
-                raise Exception(f"No {label=} in {node.rcd}")
-        case ProjNode(t1, label):
-            return ProjNode(eval_(t1, context), label)
+                raise Exception(f"No {label=} in {pprint_term(node.rcd, context)}")
+        case ProjNode(t1, label, shape, slot):
+            return ProjNode(eval_(t1, context), label, shape, slot)
+        case RecordNode() if not is_val(node):
+            return eval_fields(node, context)
     raise NoRuleApplies
 
 
@@ -102,24 +168,59 @@ def eval_node(node: Node, context: Context):
             return node
 
 
+# most type pairs that each of subtype, join and meet remember
+CACHE_SIZE = 1 << 12
+
+
+@dataclass
+class CacheStats:
+    hits: int
+    misses: int
+    size: int
+
+    @property
+    def hit_rate(self):
+        calls = self.hits + self.misses
+        return self.hits / calls if calls else 0.0
+
+
+def cache_stats() -> dict[str, CacheStats]:
+    """Statistics of the subtype, join and meet caches, by function name"""
+    return {fn.__name__: CacheStats(info.hits, info.misses, info.currsize)
+            for fn in (subtype, join, meet) for info in [fn.cache_info()]}
+
+
+def clear_caches():
+    for fn in (subtype, join, meet):
+        fn.cache_clear()
+
+
+# types are interned, so the caches are keyed on the identities of the pair
+@lru_cache(maxsize=CACHE_SIZE)
 def subtype(tyS: Ty, tyT: Ty) -> bool:
     """Returns True if tyS is a subtype of tyT"""
-    if tyS == tyT:
+    if tyS is tyT:
         return True
     match (tyS, tyT):
         case (BotTy(), _):
             return True
         case (_, TopTy()):
             return True
-        case (RecordTy(fieldsS), RecordTy(fieldsT)):
-            return all(fieldsS.get(lab) == tyT_i for lab, tyT_i in fieldsT.items())
+        case (RecordTy(shapeS, tysS), RecordTy(shapeT, tysT)):
+            slots = shapeS.embedding(shapeT)
+            return slots is not None and all(tysS[i] is tyT_i for i, tyT_i in zip(slots, tysT))
         case (ArrowTy(tyS1, tyS2), ArrowTy(tyT1, tyT2)):
             return subtype(tyT1, tyS1) and subtype(tyS2, tyT2)
 
     return False
 
 
+@lru_cache(maxsize=CACHE_SIZE)
 def join(tyS: Ty, tyT: Ty) -> Ty:
+    if tyS is tyT:
+        return tyS
+    if isinstance(tyS, RecordTy) and isinstance(tyT, RecordTy):
+        return _join_records(tyS, tyT)
     if subtype(tyS, tyT):
         return tyT
     if subtype(tyT, tyS):
@@ -131,14 +232,15 @@ def join(tyS: Ty, tyT: Ty) -> Ty:
             m1 = meet(tyS1, tyT1)
             j2 = join(tyS2, tyT2)
             return ArrowTy(m1, j2)
-        case (RecordTy(fieldsS), RecordTy(fieldsT)):
-            labels = set(fieldsS).intersection(fieldsT)
-            fields = {lab: join(fieldsS[lab], fieldsT[lab]) for lab in labels}
-            return RecordTy(fields)
         case _: return TopTy()
 
 
+@lru_cache(maxsize=CACHE_SIZE)
 def meet(tyS: Ty, tyT: Ty) -> Ty:
+    if tyS is tyT:
+        return tyS
+    if isinstance(tyS, RecordTy) and isinstance(tyT, RecordTy):
+        return _meet_records(tyS, tyT)
     if subtype(tyS, tyT):
         return tyS
     if subtype(tyT, tyS):
@@ -156,70 +258,258 @@ def meet(tyS: Ty, tyT: Ty) -> Ty:
                 return TopTy()
             j1 = join(tyS1, tyT1)
             return ArrowTy(j1, m2)
-        case (RecordTy(fieldsS), RecordTy(fieldsT)):
-            fields = fieldsS | fieldsT
-            labels = set(fieldsS).intersection(fieldsT)
-            for lab in labels:
-                m = meet(fieldsS[lab], fieldsT[lab])
-                fields[lab] = m
-            return RecordTy(fields)
         case _:
             return BotTy()
 
 
+def _merge(tyS: RecordTy, tyT: RecordTy):
+    """Merge the sorted labels of two records in a single pass
+
+    Returns the labels of both, in order, with the field types of each record
+    (None where it lacks the label), and whether tyS is a subtype of tyT and
+    tyT of tyS, which is when one has all the labels of the other with the
+    same types.
+    """
+    labS, labT = tyS.shape.labels, tyT.shape.labels
+    tysS, tysT = tyS.tys, tyT.tys
+    if labS is labT:
+        same = all(s is t for s, t in zip(tysS, tysT))
+        return [(lab, s, t) for lab, s, t in zip(labS, tysS, tysT)], same, same
+    merged: list[tuple[str, Optional[Ty], Optional[Ty]]] = []
+    s_sub = t_sub = True
+    i = j = 0
+    while i < len(labS) and j < len(labT):
+        lab = labS[i]
+        if lab is labT[j]:
+            if tysS[i] is not tysT[j]:
+                s_sub = t_sub = False
+            merged.append((lab, tysS[i], tysT[j]))
+            i += 1
+            j += 1
+        elif lab < labT[j]:
+            t_sub = False
+            merged.append((lab, tysS[i], None))
+            i += 1
+        else:
+            s_sub = False
+            merged.append((labT[j], None, tysT[j]))
+            j += 1
+    if i < len(labS):
+        t_sub = False
+        merged.extend((labS[k], tysS[k], None) for k in range(i, len(labS)))
+    if j < len(labT):
+        s_sub = False
+        merged.extend((labT[k], None, tysT[k]) for k in range(j, len(labT)))
+    return merged, s_sub, t_sub
+
+
+def _join_records(tyS: RecordTy, tyT: RecordTy) -> RecordTy:
+    """The common labels of both, with the join of their types"""
+    merged, s_sub, t_sub = _merge(tyS, tyT)
+    if s_sub:
+        return tyT
+    if t_sub:
+        return tyS
+    common = [(lab, s, t) for lab, s, t in merged if s is not None and t is not None]
+    return RecordTy(Shape.of_sorted(tuple(lab for lab, _, _ in common)),
+                    tuple(join(s, t) for _, s, t in common))  # type: ignore
+
+
+def _meet_records(tyS: RecordTy, tyT: RecordTy) -> RecordTy:
+    """The labels of either, with the meet of the types of the common ones"""
+    merged, s_sub, t_sub = _merge(tyS, tyT)
+    if s_sub:
+        return tyS
+    if t_sub:
+        return tyT
+    return RecordTy(Shape.of_sorted(tuple(lab for lab, _, _ in merged)),
+                    tuple(t if s is None else s if t is None else meet(s, t)
+                          for _, s, t in merged))  # type: ignore
+
+
+def _fold(fn: Callable[[Ty, Ty], Ty], tys: Sequence[Ty]) -> Ty:
+    """fn(tys[0], fn(tys[1], ... fn(tys[-2], tys[-1])))"""
+    ty = tys[-1]
+    for other in reversed(tys[:-1]):
+        ty = fn(other, ty)
+    return ty
+
+
+def join_all(tys: Sequence[Ty]) -> Ty:
+    """join(tys[0], join(tys[1], ... join(tys[-2], tys[-1])))
+
+    Records are joined all at once: the labels that all of them have are
+    found from the smallest one, and the types of each label are joined with
+    join_all. This is linear in the total number of fields.
+    """
+    first = tys[0]
+    if all(ty is first for ty in tys):
+        return first
+    if len(tys) == 2 or not all(isinstance(ty, RecordTy) for ty in tys):
+        return _fold(join, tys)
+    rcds = cast(Sequence[RecordTy], tys)
+    shapes = {rcd.shape for rcd in rcds}
+    smallest = min(shapes, key=len)
+    labels = tuple(lab for lab in smallest.labels
+                   if all(lab in shape.slots for shape in shapes))
+    return RecordTy(Shape.of_sorted(labels),
+                    tuple(join_all([rcd.tys[rcd.shape.slots[lab]] for rcd in rcds])
+                          for lab in labels))
+
+
+def meet_all(tys: Sequence[Ty]) -> Ty:
+    """meet(tys[0], meet(tys[1], ... meet(tys[-2], tys[-1])))
+
+    Records are met all at once: the labels of any of them are merged from
+    their sorted labels, and the types of each label are met with meet_all.
+    """
+    first = tys[0]
+    if all(ty is first for ty in tys):
+        return first
+    if len(tys) == 2 or not all(isinstance(ty, RecordTy) for ty in tys):
+        return _fold(meet, tys)
+    rcds = cast(Sequence[RecordTy], tys)
+    shapes = {rcd.shape for rcd in rcds}
+    labels = tuple(lab for lab, _ in groupby(heapq.merge(*(shape.labels for shape in shapes))))
+    return RecordTy(Shape.of_sorted(labels),
+                    tuple(meet_all([rcd.tys[rcd.shape.slots[lab]] for rcd in rcds
+                                    if lab in rcd.shape.slots])
+                          for lab in labels))
+
+
+def _warn_top(chain: list[IfNode], arms: list[Ty], context: Context) -> None:
+    """Warn about each if of chain that returns Top, the innermost first
+
+    chain[k] is typed as join(arms[k], join(arms[k + 1], ... arms[-1])), like
+    an if on its own. The join of Top with anything is Top, so once an if of
+    the chain returns Top, all the ones around it do too.
+    """
+    ty = arms[-1]
+    for k in reversed(range(len(chain))):
+        if not isinstance(ty, TopTy):
+            ty = join(arms[k], ty)
+        if isinstance(ty, TopTy):
+            print("Warning! Conditional returns Top:", pprint_term(chain[k], context, max_width=80))
+
+
 def typeof(node: Node, context: Context) -> Ty:
-    match node:
-        case TrueNode() | FalseNode(): return BoolTy()
-        case IfNode(cond, then, else_):
-            match typeof(cond, context):
-                case BotTy() | BoolTy():
-                    then_ty = typeof(then, context)
-                    else_ty = typeof(else_, context)
-                    ret_ty = join(then_ty, else_ty)
+    """Type of node in context
+
+    Uses an explicit stack instead of recursion, so the depth of node is not
+    limited by the recursion limit. Each frame has a stage, for the checks
+    that are done after some of its children are typed.
+    """
+    types: list[Ty] = []
+    stack: list[tuple[Node, Context, int]] = [(node, context, 0)]
+    while stack:
+        node, context, stage = stack.pop()
+        match node:
+            case TrueNode() | FalseNode():
+                types.append(BoolTy())
+            # An if in the else arm of another one starts at stage 3 instead of
+            # 0, and leaves the types of its arms for the outermost if of the
+            # chain, which joins the types of all the arms at once, and warns
+            # about each if of the chain that returns Top.
+            case IfNode(cond, then, else_):
+                if stage == 0 or stage == 3:
+                    stack.append((node, context, stage + 1))
+                    stack.append((cond, context, 0))
+                elif stage == 1 or stage == 4:
+                    if not isinstance(types.pop(), (BotTy, BoolTy)):
+                        raise TypeError("If condition should be bool")
+                    if stage == 1:
+                        stack.append((node, context, 2))
+                    stack.append((else_, context, 3 if isinstance(else_, IfNode) else 0))
+                    stack.append((then, context, 0))
+                else:
+                    chain = [node]
+                    while isinstance(else_, IfNode):
+                        chain.append(else_)
+                        else_ = else_.else_
+                    arms = types[len(types) - len(chain) - 1:]
+                    del types[len(types) - len(chain) - 1:]
+                    ret_ty = join_all(arms)
                     if isinstance(ret_ty, TopTy):
-                        print(f"Warning! Conditional returns Top: {node}")
-                    return ret_ty
-                case _:
-                    raise TypeError("If condition should be bool")
-        case VarNode(idx, _):
-            return context.get_type(idx)
-        case AbsNode(var_name, ty, body):
-            new_context = context.clone()
-            new_context.add_binding(var_name, VarBinding(ty))
-            ret_ty = typeof(body, new_context)
-            return ArrowTy(ty, ret_ty)
-        case AppNode(t1, t2):
-            ty1, ty2 = typeof(t1, context), typeof(t2, context)
-            match ty1:
-                case BotTy():
-                    return BotTy()
-                case ArrowTy(ty11, ty12):
-                    if subtype(ty2, ty11):
-                        return ty12
-                    else:
-                        raise TypeError("Parameter type mismatch")
-                case _: raise TypeError("First term of abstraction should be arrow type")
-        case RecordNode(fields):
-            return RecordTy({lab: typeof(field, context) for lab, field in fields.items()})
-        case ProjNode(rcd, label):
-            match typeof(rcd, context):
-                case BotTy():
-                    return BotTy()
-                case RecordTy(fields):
-                    return fields[label]
-                case _ as unknown:
-                    raise Exception(f"Expected RecordTy instead of {unknown}")
-    raise Exception(f"Unknown node {node}")
+                        _warn_top(chain, arms, context)
+                    types.append(ret_ty)
+            case VarNode(idx, _):
+                types.append(context.get_type(idx))
+            case AbsNode(var_name, ty, body):
+                if stage == 0:
+                    new_context = context.clone()
+                    new_context.add_binding(var_name, VarBinding(ty))
+                    stack.append((node, context, 1))
+                    stack.append((body, new_context, 0))
+                else:
+                    types.append(ArrowTy(ty, types.pop()))
+            case AppNode(t1, t2):
+                if stage == 0:
+                    stack.append((node, context, 1))
+                    stack.append((t2, context, 0))
+                    stack.append((t1, context, 0))
+                    continue
+                ty2, ty1 = types.pop(), types.pop()
+                match ty1:
+                    case BotTy():
+                        types.append(BotTy())
+                    case ArrowTy(ty11, ty12):
+                        if subtype(ty2, ty11):
+                            types.append(ty12)
+                        else:
+                            raise TypeError("Parameter type mismatch")
+                    case _: raise TypeError("First term of abstraction should be arrow type")
+            case RecordNode(shape, values, _, order):
+                # typed in source order, so the first error is the first one
+                # in the source
+                if stage == 0:
+                    stack.append((node, context, 1))
+                    stack.extend((values[slot], context, 0) for slot in reversed(node.source_slots))
+                    continue
+                tys = types[len(types) - len(values):]
+                del types[len(types) - len(values):]
+                if order is not None:
+                    in_order, tys = tys, tys.copy()
+                    for slot, ty in zip(order, in_order):
+                        tys[slot] = ty
+                types.append(RecordTy(shape, tuple(tys)))
+            case ProjNode(rcd, label):
+                if stage == 0:
+                    stack.append((node, context, 1))
+                    stack.append((rcd, context, 0))
+                    continue
+                match types.pop():
+                    case BotTy():
+                        types.append(BotTy())
+                    case RecordTy(shape, tys):
+                        node.shape, node.slot = shape, shape.slots[label]
+                        types.append(tys[node.slot])
+                    case _ as unknown:
+                        raise Exception(f"Expected RecordTy instead of {pprint_term(unknown, context)}")
+            case _:
+                raise Exception(f"Unknown node {node}")
+    return types.pop()
 
 
 def run(cmd, context, mode="eval"):
+    """Evaluate or type check cmd and print the result
+
+    mode: "eval" for stepping on the tree, "type" for the type, "optimize" to
+        type check, partially evaluate with `optimize.optimize` and then step
+    """
     if isinstance(cmd, BindNode):
         context.add_binding(cmd.name, cmd.binding)
         print(cmd.name)
     elif mode == "eval":
-        print(eval_node(cmd, context))
+        print(pprint_term(eval_node(cmd, context), context))
     elif mode == "type":
-        print(typeof(cmd, context))
+        print(pprint_term(typeof(cmd, context), context))
+    elif mode == "optimize":
+        from optimize import optimize
+        typeof(cmd, context)
+        cmd, _ = optimize(cmd)
+        print(pprint_term(eval_node(cmd, context), context))
+    else:
+        raise ValueError(f"Unknown mode {mode}")
 
 
 def main():
@@ -0,0 +1,436 @@
+import gc
+import io
+import random
+from contextlib import redirect_stdout
+
+from bench_deep import app_spine, if_chain, record_nest, tree_abs, tree_spine
+from context import Context, _ContextElem
+from nodes import (AbsNode, AppNode, ArrowTy, BoolTy, BotTy, FalseNode, IfNode, ProjNode,
+                   RecordNode, RecordTy, Shape, TopTy, TrueNode, VarBinding, VarNode)
+from parser import parse, parse_tree
+from optimize import optimize
+from printer import pprint_term
+from run import (NoRuleApplies, clear_caches, eval_node, is_val, join, shift, subst_top, subtype,
+                 typeof)
+
+
+class ListContext(Context):
+    """The context as it was before it was persistent, backed by a list"""
+
+    def __init__(self) -> None:
+        self.items: list[_ContextElem] = []
+
+    def clone(self):
+        ctx = ListContext()
+        ctx.items = self.items.copy()
+        return ctx
+
+    @property
+    def data(self):
+        return self.items
+
+    def add_binding(self, name, binding):
+        self.items.append(_ContextElem(name, binding))
+
+    def find_binding(self, name):
+        for i, binding in enumerate(reversed(self.items)):
+            if binding.name == name:
+                return i, binding
+        raise ValueError
+
+    def get_binding(self, idx):
+        return self.items[~idx]
+
+    def pop_binding(self):
+        self.items.pop()
+
+    def __len__(self):
+        return len(self.items)
+
+
+def same_context(ctx: Context, old: ListContext):
+    assert len(ctx) == len(old) and ctx.data == old.data
+    for idx in range(len(old)):
+        assert ctx.get_binding(idx) == old.get_binding(idx)
+        assert ctx.get_type(idx) == old.get_type(idx)
+    for name in "abcdz":
+        try:
+            expected = old.find_binding(name)
+        except ValueError:
+            expected = None
+        try:
+            assert ctx.find_binding(name) == expected
+        except ValueError:
+            assert expected is None
+    if len(old):
+        assert ctx.top == old.top
+    for idx in (len(old), len(old) + 7):
+        try:
+            ctx.get_binding(idx)
+        except IndexError:
+            pass
+        else:
+            raise AssertionError(idx)
+
+
+rng = random.Random(0)
+tys = [BoolTy(), ArrowTy(TopTy(), BoolTy()), RecordTy(Shape.of(["a"]), (BoolTy(),))]
+contexts = [(Context(), ListContext())]
+for _ in range(3000):
+    ctx, old = rng.choice(contexts)
+    op = rng.random()
+    if op < 0.55:
+        name, ty = rng.choice("abcd"), rng.choice(tys)
+        ctx.add_binding(name, VarBinding(ty))
+        old.add_binding(name, VarBinding(ty))
+    elif op < 0.8 and len(old):
+        ctx.pop_binding()
+        old.pop_binding()
+    elif op < 0.9:
+        # the clones share cells, which must not change under the original
+        contexts.append((ctx.clone(), old.clone()))
+    same_context(ctx, old)
+for ctx, old in contexts:
+    same_context(ctx, old)
+try:
+    Context().pop_binding()
+except IndexError:
+    pass
+else:
+    raise AssertionError("pop from empty context")
+
+# typing in either context gives the same types and errors
+programs = """
+    lambda x:Top. lambda r:{x:Top->Top}. r.x r.x;
+    lambda a:Bool. lambda b:Bool->Bool. if a then b else (lambda w:Bool. {x=w}.x);
+    lambda x:Bot. lambda y:Bool. x y;
+    lambda x:Bool. lambda y:{a:Bool}. y.a x;
+    lambda x:Bool. lambda y:Bool. if x then y else {a=y};
+"""
+for node in parse(programs):
+    results = []
+    for ctx in (Context(), ListContext()):
+        try:
+            results.append(pprint_term(typeof(node, ctx), ctx))
+        except Exception as e:
+            results.append(str(e))
+    assert results[0] == results[1], results
+print("context: ok")
+
+# optimizing keeps the value of closed programs
+programs = """
+    (lambda cfg:{debug:Bool, not:Bool->Bool}.
+        (lambda check:Bool->{value:Bool}. {first=check true, second=check (cfg.not true)}.second.value)
+        (lambda x:Bool. if cfg.debug then {value=x, trace=true} else {value=x}))
+    {debug=false, not=lambda b:Bool. if b then false else true, unused={}};
+    (lambda r:{x:Bool->Bool}. r.x (r.x true)) {x=lambda z:Bool. if z then false else true, y=true};
+    (lambda f:Bool->{a:Bool, b:Bool}. (f true).b) (lambda x:Bool. {b=x, a=(if x then false else true)});
+    {a={b={c=true}.c}.b, d=if {e=false}.e then true else false};
+"""
+for node in parse(programs):
+    ctx = Context()
+    typeof(node, ctx)
+    opt, stats = optimize(node)
+    assert stats.removed > 0
+    assert pprint_term(eval_node(opt, ctx), ctx) == pprint_term(eval_node(node, ctx), ctx)
+# only values are inlined, a bound variable isn't one
+(node,) = parse("lambda y:{a:Bool}. (lambda x:{a:Bool}. x.a) y;")
+opt, stats = optimize(node)
+assert opt == node and stats.removed == 0
+(node,) = parse("lambda y:Bool. (lambda x:{a:Bool}. x.a) {a=y, b=true};")
+assert optimize(node)[0] == node
+(node,) = parse("lambda y:Bool. (lambda x:{a:Bool}. x.a) {a=false, b=true};")
+opt, stats = optimize(node)
+assert pprint_term(opt, Context()) == "(lambda y:Bool. false)" and (stats.inlined, stats.projected) == (1, 1)
+# far deeper than the recursion limit
+deep = TrueNode()
+for _ in range(100_000):
+    deep = ProjNode(RecordNode.of({"a": IfNode(TrueNode(), deep, FalseNode())}), "a")
+opt, stats = optimize(deep)
+assert opt == TrueNode() and stats.removed == 200_000
+print("optimize: ok")
+
+
+def recursive_typeof(node, context):
+    """typeof as it was before it used an explicit stack"""
+    match node:
+        case TrueNode() | FalseNode(): return BoolTy()
+        case IfNode(cond, then, else_):
+            match recursive_typeof(cond, context):
+                case BotTy() | BoolTy():
+                    then_ty = recursive_typeof(then, context)
+                    else_ty = recursive_typeof(else_, context)
+                    ret_ty = join(then_ty, else_ty)
+                    if isinstance(ret_ty, TopTy):
+                        print("Warning! Conditional returns Top:", pprint_term(node, context, max_width=80))
+                    return ret_ty
+                case _:
+                    raise TypeError("If condition should be bool")
+        case VarNode(idx, _):
+            return context.get_type(idx)
+        case AbsNode(var_name, ty, body):
+            new_context = context.clone()
+            new_context.add_binding(var_name, VarBinding(ty))
+            ret_ty = recursive_typeof(body, new_context)
+            return ArrowTy(ty, ret_ty)
+        case AppNode(t1, t2):
+            ty1, ty2 = recursive_typeof(t1, context), recursive_typeof(t2, context)
+            match ty1:
+                case BotTy():
+                    return BotTy()
+                case ArrowTy(ty11, ty12):
+                    if subtype(ty2, ty11):
+                        return ty12
+                    else:
+                        raise TypeError("Parameter type mismatch")
+                case _: raise TypeError("First term of abstraction should be arrow type")
+        case RecordNode():
+            return RecordTy.of({lab: recursive_typeof(field, context) for lab, field in node.fields.items()})
+        case ProjNode(rcd, label):
+            match recursive_typeof(rcd, context):
+                case BotTy():
+                    return BotTy()
+                case RecordTy() as ty:
+                    return ty.fields[label]
+                case _ as unknown:
+                    raise Exception(f"Expected RecordTy instead of {pprint_term(unknown, context)}")
+    raise Exception(f"Unknown node {node}")
+
+
+def random_type(rng: random.Random, depth: int):
+    choice = rng.randrange(5 if depth else 3)
+    if choice < 3:
+        return [BoolTy(), TopTy(), BotTy()][choice]
+    if choice == 3:
+        return ArrowTy(random_type(rng, depth - 1), random_type(rng, depth - 1))
+    return RecordTy.of({lab: random_type(rng, depth - 1) for lab in rng.sample("abc", rng.randrange(4))})
+
+
+def random_term(rng: random.Random, depth: int, level: int):
+    """Random term that is mostly ill typed, with level variables in scope"""
+    choice = rng.randrange(8 if depth else 3)
+    if choice < 2:
+        return [TrueNode(), FalseNode()][choice]
+    if choice == 2:
+        return VarNode(rng.randrange(level), level) if level else TrueNode()
+    if choice == 3:
+        return AbsNode("x", random_type(rng, 2), random_term(rng, depth - 1, level + 1))
+    if choice == 4:
+        return AppNode(random_term(rng, depth - 1, level), random_term(rng, depth - 1, level))
+    if choice == 5:
+        return IfNode(*(random_term(rng, depth - 1, level) for _ in range(3)))
+    if choice == 6:
+        labels = rng.sample("abc", rng.randrange(4))
+        return RecordNode.of({lab: random_term(rng, depth - 1, level) for lab in labels})
+    return ProjNode(random_term(rng, depth - 1, level), rng.choice("abc"))
+
+
+def type_or_error(typeof, node, ctx):
+    try:
+        with redirect_stdout(io.StringIO()):
+            return typeof(node, ctx)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+
+# the explicit stack gives the same types and the same first error
+ctx = Context()
+ctx.add_binding("w", VarBinding(BoolTy()))
+ctx.add_binding("f", VarBinding(ArrowTy(TopTy(), BoolTy())))
+rng = random.Random(1)
+results = set()
+for _ in range(5000):
+    node = random_term(rng, rng.randrange(1, 6), 2)
+    expected = type_or_error(recursive_typeof, node, ctx)
+    assert type_or_error(typeof, node, ctx) == expected, (node, expected)
+    results.add(expected.split(" instead")[0] if isinstance(expected, str) else type(expected))
+assert len(results) == 11, results
+assert typeof(app_spine(30_000), ctx) == BoolTy()
+assert typeof(if_chain(30_000), ctx).shape.labels == ("a",)
+assert typeof(record_nest(30_000), ctx) == BoolTy()
+deep = AppNode(VarNode(1, 2), app_spine(30_000))
+assert type_or_error(typeof, deep, ctx) == "TypeError: First term of abstraction should be arrow type"
+# parsing builds the same nodes, at any depth
+node = parse_tree(tree_spine(30_000), ctx.clone())
+for _ in range(30_000):
+    assert node.child1 == VarNode(0, 2)
+    node = node.child2
+assert node == ProjNode(RecordNode.of({"a": TrueNode()}), "a")
+node = parse_tree(tree_abs(30_000), ctx.clone())
+for _ in range(30_000 - 1):
+    node = node.body
+assert node == AbsNode("x", TopTy(), VarNode(0, 30_002))
+(node,) = parse("lambda x:{b:Bool->Top, a:{}}. x;")
+assert node.ty == RecordTy.of({"a": RecordTy.of({}), "b": ArrowTy(BoolTy(), TopTy())})
+try:
+    parse("lambda x:Bool. {a=y};")
+except Exception as e:
+    assert str(e) == "Unbound variable y"
+else:
+    raise AssertionError("unbound variable")
+print("typeof: ok")
+
+# shapes map labels to sorted slots, and only live shapes stay interned
+rng = random.Random(2)
+for _ in range(500):
+    big, small = rng.sample("abcdefg", rng.randrange(8)), rng.sample("abcdefg", rng.randrange(4))
+    shape, other = Shape.of(big), Shape.of(small)
+    assert shape is Shape.of(reversed(big)) and list(shape.labels) == sorted(big)
+    expected = tuple(sorted(big).index(lab) for lab in other.labels) if set(small) <= set(big) else None
+    assert shape.embedding(other) == expected and shape.embedding(other) == expected
+clear_caches()
+shape = Shape.of(["a", "b"])
+for i in range(1000):
+    shape.embedding(Shape.of([f"l{i}"]))
+gc.collect()
+assert not any(lab.startswith("l") for other in list(shape._embeddings) for lab in other.labels)
+assert not any(lab.startswith("l") for labels in list(Shape._table) for lab in labels)
+print("shape: ok")
+
+# fields are stored by label, and typed, evaluated and printed in source
+# order. Types print in label order, whatever order other types were written in
+(node, same) = parse("{b=true, c={}, a=false}; {a=false, c={}, b=true};")
+assert node == same and node.shape is same.shape and node.values == same.values
+assert list(node.fields) == ["b", "c", "a"] and node.order is node.shape.order("bca")
+assert pprint_term(node, Context()) == "{b=true, c={}, a=false}"
+assert pprint_term(typeof(node, Context()), Context()) == "{a:Bool, b:Bool, c:{}}"
+for source in ["lambda x:{b:Bool, a:Bool}. x; lambda x:{a:Bool, b:Bool}. x; {b=true, a=false};",
+               "{b=true, a=false}; lambda x:{a:Bool, b:Bool}. x; lambda x:{b:Bool, a:Bool}. x;"]:
+    types = {pprint_term(typeof(node, Context()), Context()) for node in parse(source)}
+    assert types == {"{a:Bool, b:Bool}", "({a:Bool, b:Bool})->{a:Bool, b:Bool}"}, types
+for source, message in [
+        ("{b=true true, a=if {} then true else true};", "First term of abstraction should be arrow type"),
+        ("{b=if {} then true else true, a=true true};", "If condition should be bool"),
+        ("lambda x:Bool->{a:Bool}. x.a;", "Expected RecordTy instead of Bool->{a:Bool}"),
+        ("lambda x:Top. {b=x.a, a=x.b};", "Expected RecordTy instead of Top")]:
+    (node,) = parse(source)
+    assert type_or_error(typeof, node, Context()) == type_or_error(recursive_typeof, node, Context())
+    assert type_or_error(typeof, node, Context()).split(": ", 1)[1] == message
+(node,) = parse("{b=(lambda x:Bool. x) true, c=true true, a=if true then false else true};")
+assert pprint_term(eval_node(node, Context()), Context()) == \
+    "{b=true, c=(true true), a=(if true then false else true)}"
+(node,) = parse("{b=true, a=false}.c;")
+try:
+    eval_node(node, Context())
+except Exception as e:
+    assert str(e) == "No label=Token('CNAME', 'c') in {b=true, a=false}"
+else:
+    raise AssertionError("missing label")
+(node,) = parse("(lambda y:Bool. {b=y, a={d=y, c=true}}) false;")
+assert pprint_term(eval_node(node, Context()), Context()) == "{b=false, a={d=false, c=true}}"
+opt, _ = optimize(node)
+assert pprint_term(opt, Context()) == "{b=false, a={d=false, c=true}}"
+print("order: ok")
+
+
+def small_step(node):
+    """One step of node, where a record steps its first field that isn't a value"""
+    def is_val(node):
+        if isinstance(node, RecordNode):
+            return all(is_val(value) for value in node.values)
+        return isinstance(node, (AbsNode, TrueNode, FalseNode))
+
+    match node:
+        case AppNode(AbsNode(_, _, body), t2) if is_val(t2):
+            return subst_top(t2, body)
+        case AppNode(t1, t2) if is_val(t1):
+            return AppNode(t1, small_step(t2))
+        case AppNode(t1, t2):
+            return AppNode(small_step(t1), t2)
+        case IfNode(TrueNode(), then, _):
+            return then
+        case IfNode(FalseNode(), _, else_):
+            return else_
+        case IfNode(cond, then, else_):
+            return IfNode(small_step(cond), then, else_)
+        case ProjNode(RecordNode() as rcd, label):
+            return rcd.fields[label]
+        case ProjNode(rcd, label):
+            return ProjNode(small_step(rcd), label)
+        case RecordNode(shape, values, _, order):
+            for slot in node.source_slots:
+                if not is_val(values[slot]):
+                    values = (*values[:slot], small_step(values[slot]), *values[slot + 1:])
+                    return RecordNode(shape, values, 0, order)
+    raise NoRuleApplies
+
+
+def eval_small_step(node):
+    while True:
+        try:
+            node = small_step(node)
+        except NoRuleApplies:
+            return node
+
+
+# evaluating records field by field gives the same result as small steps
+ctx = Context()
+ctx.add_binding("w", VarBinding(BoolTy()))
+ctx.add_binding("f", VarBinding(ArrowTy(TopTy(), BoolTy())))
+rng = random.Random(3)
+typed = 0
+for _ in range(20000):
+    node = random_term(rng, rng.randrange(2, 7), 2)
+    if isinstance(type_or_error(typeof, node, ctx), str):
+        continue
+    typed += 1
+    value = eval_node(node, ctx)
+    assert pprint_term(value, ctx) == pprint_term(eval_small_step(node), ctx)
+    assert is_val(value) == is_val(eval_small_step(node))
+assert typed > 1000, typed
+(node,) = parse("(lambda r:{b:Bool, a:Top}. {c=r.b, d=r}) {b=(lambda x:Bool. x) true, a={e=if false then true else false}};")
+value = eval_node(node, Context())
+assert pprint_term(value, Context()) == "{c=true, d={b=true, a={e=false}}}" and is_val(value)
+# the fields that are values stay known to be, also under substitution
+assert value.first_nonval == 2 and shift(value, 1).first_nonval == 2
+# wide records take one pass
+width = 20_000
+rcd = RecordNode.of({f"l{i}": IfNode(TrueNode(), FalseNode(), TrueNode()) for i in range(width)})
+value = eval_node(ProjNode(AppNode(AbsNode("r", TopTy(), VarNode(0, 1)), rcd), f"l{width - 1}"), Context())
+assert value == FalseNode()
+# typeof resolves the slots of projections, which records of another shape
+# don't use
+(wider, same) = parse("(lambda r:{b:Bool}. r.b) {a=false, b=true};"
+                      "(lambda r:{b:Bool, a:Bool}. r.b) {a=false, b=true};")
+for node, slot in [(wider, 0), (same, 1)]:
+    typeof(node, Context())
+    proj = node.child1.body
+    assert proj.shape is node.child1.ty.shape and proj.slot == slot
+    assert subst_top(node.child2, proj).slot == slot
+    assert eval_node(node, Context()) == TrueNode()
+print("record eval: ok")
+
+
+def warnings(typeof, node, ctx) -> str:
+    out = io.StringIO()
+    with redirect_stdout(out):
+        try:
+            typeof(node, ctx)
+        except Exception:
+            pass
+    return out.getvalue()
+
+
+# joining a whole if chain at once still warns once for each if returning Top
+(node,) = parse("lambda x:Bool. if x then true else (if x then {a=x} else (if x then {} else {b=x}));")
+assert warnings(typeof, node, Context()).count("Warning!") == 1
+(node,) = parse("lambda x:Bool. if x then true else (if x then (lambda y:Top. y) else (if x then false else true));")
+out = warnings(typeof, node, Context())
+assert out == warnings(recursive_typeof, node, Context()) and out.count("Warning!") == 2
+assert out.splitlines()[0] == "Warning! Conditional returns Top: (if x then (lambda y:Top. y) else (if x then false else true))"
+ctx = Context()
+ctx.add_binding("w", VarBinding(BoolTy()))
+ctx.add_binding("f", VarBinding(ArrowTy(TopTy(), BoolTy())))
+rng = random.Random(4)
+warned = 0
+for _ in range(5000):
+    node = random_term(rng, rng.randrange(1, 6), 2)
+    if rng.random() < 0.5:
+        # chains of ifs, with arms of any type
+        for _ in range(rng.randrange(1, 5)):
+            node = IfNode(VarNode(1, 2), random_term(rng, 2, 2), node)
+    out = warnings(typeof, node, ctx)
+    assert out == warnings(recursive_typeof, node, ctx), node
+    warned += out.count("Warning!") > 1
+assert warned > 100, warned
+print("warnings: ok")
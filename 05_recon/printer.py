@@ -0,0 +1,90 @@
+"""Printer for recon terms and types, on the shared engine in `pytapl.printer`"""
+from typing import Optional
+
+from pytapl.printer import POP, Bind, Printer
+
+from context import Context
+from nodes import (AbsNode, AppNode, ArrowTy, BoolTy, FalseNode, IdTy, IfNode,
+                   IsZeroNode, LetNode, NatTy, Node, PredNode, SuccNode, TrueNode,
+                   TupleNode, TupleTy, Ty, VarNode, ZeroNode)
+
+
+def _sep(items: tuple, sep: str, depth: int) -> list:
+    """Work items for `(i1<sep>i2<sep>...)`, in the order they are pushed"""
+    work: list = [")"]
+    for i, item in enumerate(reversed(items)):
+        if i:
+            work.append(sep)
+        work.append((item, depth))
+    return work
+
+
+def _visit(p: Printer, node: "Node | Ty", depth: int) -> None:
+    depth += 1
+    match node:
+        case TrueNode():
+            p.write("true")
+        case FalseNode():
+            p.write("false")
+        case VarNode(idx, _):
+            p.write(p.var(idx))
+        case AbsNode(orig_name, None, body):
+            p.write("(lambda ")
+            p.work.extend((")", POP, (body, depth), ". ", Bind(orig_name)))
+        case AbsNode(orig_name, ty, body):
+            p.write("(lambda ")
+            p.work.extend((")", POP, (body, depth), ". ", (ty, depth), ":", Bind(orig_name)))
+        case AppNode(c1, c2):
+            p.write("(")
+            p.work.extend((")", (c2, depth), " ", (c1, depth)))
+        case LetNode(varname, init, body):
+            p.write(f"(let {p.fresh(varname)} = ")
+            p.work.extend((")", POP, (body, depth), Bind(varname, False), " in ", (init, depth)))
+        case IfNode(cond, then, else_):
+            p.write("(if ")
+            p.work.extend((")", (else_, depth), " else ", (then, depth), " then ", (cond, depth)))
+        case TupleNode(fields):
+            p.write("(")
+            p.work.extend(_sep(fields, ", ", depth))
+        case ZeroNode():
+            p.write("0")
+        case SuccNode():
+            # walk the whole chain at once, so that long chains stay linear
+            num = 0
+            while isinstance(node, SuccNode):
+                num += 1
+                node = node.val
+            if isinstance(node, ZeroNode):
+                p.write(str(num))
+            else:
+                p.write("(succ " * num)
+                p.work.extend((")" * num, (node, depth)))
+        case PredNode(val):
+            p.write("(pred ")
+            p.work.extend((")", (val, depth)))
+        case IsZeroNode(val):
+            p.write("(iszero ")
+            p.work.extend((")", (val, depth)))
+        case BoolTy():
+            p.write("Bool")
+        case NatTy():
+            p.write("Nat")
+        case IdTy(name):
+            p.write(name)
+        case TupleTy(types):
+            p.write("(")
+            p.work.extend(_sep(types, ", ", depth))
+        case ArrowTy(ArrowTy() as ty1, ty2):
+            p.write("(")
+            p.work.extend(((ty2, depth), ")->", (ty1, depth)))
+        case ArrowTy(ty1, ty2):
+            p.work.extend(((ty2, depth), "->", (ty1, depth)))
+        case _:
+            raise Exception(f"Unknown node {node}")
+
+
+def pprint_term(node: "Node | Ty", context: Context, max_width: Optional[int] = None,
+                max_depth: Optional[int] = None, max_nodes: Optional[int] = None) -> str:
+    """Text of a term or type in context, see `Printer` for the limits"""
+    names = [elem.name for elem in context.data]
+    return Printer(names, max_width, max_depth, max_nodes).run(node, _visit)
@@ -7,6 +7,7 @@ from context import Context
 from nodes import (AbsNode, AppNode, ArrowTy, BindNode, Binding, BoolTy, EqConstraint, FalseNode, IdTy, IfNode,
                    IsZeroNode, LetNode, NatTy, Node, PredNode, SchemeBinding, SuccNode, TrueNode, TupleNode, TupleTy,
                    Ty, TypeSubst, VarBinding, VarNode, ZeroNode, type_map)
+from printer import pprint_term
 
 
 class NoRuleApplies(Exception):
@@ -308,7 +309,7 @@ def run(cmd, context, constraints, vargen, mode="eval"):
         context.add_binding(cmd.name, cmd.binding)
         print(cmd.name)
     elif mode == "eval":
-        print(eval_node(cmd, context))
+        print(pprint_term(eval_node(cmd, context), context))
         ty = recon(cmd, context, constraints, vargen)
         # print(ty)
         # print(*constraints, sep="\n", end="\n\n")
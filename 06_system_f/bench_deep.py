@@ -0,0 +1,108 @@
+"""Benchmark of parsing and type checking very deep terms.
+
+All of these are far deeper than the recursion limit, so they only work with
+the explicit-stack `parse_node` and `typeof`. The parse trees are built
+directly, since the Earley parser is slow on inputs this large:
+
+    python bench_deep.py [depth]
+"""
+import sys
+import time
+
+from lark.lexer import Token
+from lark.tree import Tree
+
+from context import Context
+from nodes import (AbsNode, AppNode, ArrowTy, BoolTy, IfNode, LetNode, NatTy, Node, SuccNode,
+                   TypeAbsNode, UnivTy, VarBinding, VarNode, ZeroNode)
+from parser import parse_node
+from run import typeof
+
+
+def app_spine(depth: int) -> Node:
+    """f (succ (f (succ ... (f 0))))"""
+    node: Node = ZeroNode()
+    for _ in range(depth):
+        node = AppNode(VarNode(0, 1), SuccNode(node))
+    return node
+
+
+def if_chain(depth: int) -> Node:
+    """if (if ... then w else w) then 0 else (if w then 0 else (...))"""
+    cond: Node = VarNode(1, 2)
+    else_: Node = ZeroNode()
+    for _ in range(depth):
+        cond = IfNode(cond, VarNode(1, 2), VarNode(1, 2))
+        else_ = IfNode(VarNode(1, 2), ZeroNode(), else_)
+    return IfNode(cond, ZeroNode(), else_)
+
+
+def abs_chain(depth: int) -> Node:
+    """(lambda x:Nat. (lambda x:Nat. (... x) (succ x)) (succ x)) 0"""
+    node: Node = VarNode(0, depth + 3)
+    for level in reversed(range(depth)):
+        node = AppNode(AbsNode("x", NatTy(), node), SuccNode(VarNode(0, level + 3)))
+    return AppNode(AbsNode("x", NatTy(), node), ZeroNode())
+
+
+def type_abs(depth: int) -> Node:
+    """lambda X. lambda X. ... f"""
+    node: Node = VarNode(depth, depth + 2)
+    for _ in range(depth):
+        node = TypeAbsNode("X", node)
+    return node
+
+
+def tree_spine(depth: int) -> Tree:
+    """The parse tree of f (succ (f (succ ... (f 0))))"""
+    f = Tree("var", [Token("CNAME", "f")])
+    tree = Tree("nat", [Token("INT", "0")])
+    for _ in range(depth):
+        tree = Tree("app", [f, Tree("succ", [tree])])
+    return tree
+
+
+def tree_let(depth: int) -> Tree:
+    """The parse tree of let x=0 in let x=succ x in ... succ x"""
+    x = Tree("var", [Token("CNAME", "x")])
+    tree = Tree("succ", [x])
+    for _ in range(depth - 1):
+        tree = Tree("let", [Token("CNAME", "x"), Tree("succ", [x]), tree])
+    return Tree("let", [Token("CNAME", "x"), Tree("nat", [Token("INT", "0")]), tree])
+
+
+def timed(name: str, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    print(f"{name:>30}: {time.perf_counter() - start:8.3f}s")
+    return result
+
+
+def main(depth=100_000):
+    print(f"depth {depth}, recursion limit {sys.getrecursionlimit()}")
+    ctx = Context()
+    ctx.add_binding("w", VarBinding(BoolTy()))
+    ctx.add_binding("f", VarBinding(ArrowTy(NatTy(), NatTy())))
+
+    assert timed("typeof application spine", typeof, app_spine(depth), ctx) == NatTy()
+    assert timed("typeof if chain", typeof, if_chain(depth), ctx) == NatTy()
+    assert timed("typeof abstraction chain", typeof, abs_chain(depth), ctx) == NatTy()
+    ty = timed("typeof type abstractions", typeof, type_abs(depth), ctx)
+    for _ in range(depth):
+        assert isinstance(ty, UnivTy)
+        ty = ty.body
+    assert ty == ArrowTy(NatTy(), NatTy())
+
+    node = timed("parse_node application spine", parse_node, tree_spine(depth), ctx)
+    assert timed("typeof parsed spine", typeof, node, ctx) == NatTy()
+    node = timed("parse_node let chain", parse_node, tree_let(depth), ctx)
+    for level in range(depth):
+        assert isinstance(node, LetNode)
+        assert node.init == (SuccNode(VarNode(0, level + 2)) if level else ZeroNode())
+        node = node.body
+    assert node == SuccNode(VarNode(0, depth + 2))
+    assert len(ctx) == 2
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -13,9 +13,10 @@ with open("grammar.lark") as f:
 
 def _num_to_church(num: int):
     assert num >= 0
-    if num == 0:
-        return ZeroNode()
-    return SuccNode(_num_to_church(num - 1))
+    node: Node = ZeroNode()
+    for _ in range(num):
+        node = SuccNode(node)
+    return node
 
 
 def parse_type(tree: str | Tree, context: Context) -> Ty:
@@ -47,72 +48,127 @@ def parse_type(tree: str | Tree, context: Context) -> Ty:
 
 
 def parse_node(tree: str | Tree, context: Context) -> Node:
-    match tree:
-        case Tree(data="true"):
-            return TrueNode()
-        case Tree(data="false"):
-            return FalseNode()
-        case Tree(data="bind", children=[var_name, ty]):
-            assert isinstance(var_name, Token)
-            ty = parse_type(ty, context)
-            context.add_binding(var_name, VarBinding(ty))
-            return BindNode(var_name, context.top.binding)
-        case Tree(data="abs", children=[name, ty, body]):
-            assert isinstance(name, Token)
-            ty = parse_type(ty, context)
-            with context.scoped_add(name, VarBinding(ty)):
-                node = AbsNode(name, ty, parse_node(body, context))
-            return node
-        case Tree(data="let", children=[name, init, body]):
-            assert isinstance(name, Token)
-            init_node = parse_node(init, context)
-            with context.scoped_add(name, Binding()):
-                node = LetNode(name, init_node, parse_node(body, context))
-            return node
-        case Tree(data="app", children=[c1, c2]):
-            return AppNode(parse_node(c1, context), parse_node(c2, context))
-        case Tree(data="var", children=[var_name]):
-            assert isinstance(var_name, Token)
-            try:
-                idx, _ = context.find_binding(var_name)
-            except ValueError:
-                raise Exception(f"Unbound variable {var_name}")
-            return VarNode(idx, len(context))
-        case Tree(data="type_abs", children=[typename, body]):
-            assert isinstance(typename, Token)
-            with context.scoped_add(typename, TyVarBinding()):
-                node = TypeAbsNode(typename, parse_node(body, context))
-            return node
-        case Tree(data="type_app", children=[body, ty]):
-            return TypeAppNode(parse_node(body, context), parse_type(ty, context))
-        case Tree(data="exis_pack", children=[exis_ty, body, ty]):
-            return ExisPackNode(parse_type(exis_ty, context),
-                                parse_node(body, context),
-                                parse_type(ty, context))
-        case Tree(data="exis_unpack", children=[tyname, varname, init, body]):
-            assert isinstance(tyname, Token)
-            assert isinstance(varname, Token)
-            init_node = parse_node(init, context)
-            
-            with context.scoped_add(tyname, TyVarBinding()),\
-                 context.scoped_add(varname, Binding()):
-                node = ExisUnpackNode(tyname, varname, init_node, parse_node(body, context))
-            return node
-        case Tree(data="if_stmt", children=[cond, then, else_]):
-            return IfNode(parse_node(cond, context),
-                          parse_node(then, context),
-                          parse_node(else_, context))
-        case Tree(data="nat", children=[number]):
-            assert isinstance(number, str)
-            num = int(number)
-            return _num_to_church(num)
-        case Tree(data="succ", children=[child]):
-            return SuccNode(parse_node(child, context))
-        case Tree(data="pred", children=[child]):
-            return PredNode(parse_node(child, context))
-        case Tree(data="iszero", children=[child]):
-            return IsZeroNode(parse_node(child, context))
-    raise Exception("Unmatched", tree)
+    """Node for tree in context
+
+    Uses an explicit stack instead of recursion, so the depth of tree is not
+    limited by the recursion limit. Each frame has a stage, like in `typeof`,
+    and the types of a frame wait on `tys` until its children are parsed.
+    """
+    nodes: list[Node] = []
+    tys: list[Ty] = []
+    stack: list[tuple[str | Tree, int]] = [(tree, 0)]
+    while stack:
+        tree, stage = stack.pop()
+        match tree:
+            case Tree(data="true"):
+                nodes.append(TrueNode())
+            case Tree(data="false"):
+                nodes.append(FalseNode())
+            case Tree(data="bind", children=[var_name, ty]):
+                assert isinstance(var_name, Token)
+                ty = parse_type(ty, context)
+                context.add_binding(var_name, VarBinding(ty))
+                nodes.append(BindNode(var_name, context.top.binding))
+            case Tree(data="abs", children=[name, ty, body]):
+                assert isinstance(name, Token)
+                if stage == 0:
+                    ty = parse_type(ty, context)
+                    tys.append(ty)
+                    context.add_binding(name, VarBinding(ty))
+                    stack.append((tree, 1))
+                    stack.append((body, 0))
+                else:
+                    context.pop_binding()
+                    nodes.append(AbsNode(name, tys.pop(), nodes.pop()))
+            case Tree(data="let", children=[name, init, body]):
+                assert isinstance(name, Token)
+                if stage == 0:
+                    stack.append((tree, 1))
+                    stack.append((init, 0))
+                elif stage == 1:
+                    context.add_binding(name, Binding())
+                    stack.append((tree, 2))
+                    stack.append((body, 0))
+                else:
+                    context.pop_binding()
+                    body_node = nodes.pop()
+                    nodes.append(LetNode(name, nodes.pop(), body_node))
+            case Tree(data="app", children=[c1, c2]):
+                if stage == 0:
+                    stack.append((tree, 1))
+                    stack.append((c2, 0))
+                    stack.append((c1, 0))
+                else:
+                    node2 = nodes.pop()
+                    nodes.append(AppNode(nodes.pop(), node2))
+            case Tree(data="var", children=[var_name]):
+                assert isinstance(var_name, Token)
+                try:
+                    idx, _ = context.find_binding(var_name)
+                except ValueError:
+                    raise Exception(f"Unbound variable {var_name}")
+                nodes.append(VarNode(idx, len(context)))
+            case Tree(data="type_abs", children=[typename, body]):
+                assert isinstance(typename, Token)
+                if stage == 0:
+                    context.add_binding(typename, TyVarBinding())
+                    stack.append((tree, 1))
+                    stack.append((body, 0))
+                else:
+                    context.pop_binding()
+                    nodes.append(TypeAbsNode(typename, nodes.pop()))
+            case Tree(data="type_app", children=[body, ty]):
+                if stage == 0:
+                    stack.append((tree, 1))
+                    stack.append((body, 0))
+                else:
+                    nodes.append(TypeAppNode(nodes.pop(), parse_type(ty, context)))
+            case Tree(data="exis_pack", children=[exis_ty, body, ty]):
+                if stage == 0:
+                    tys.append(parse_type(exis_ty, context))
+                    stack.append((tree, 1))
+                    stack.append((body, 0))
+                else:
+                    nodes.append(ExisPackNode(tys.pop(), nodes.pop(), parse_type(ty, context)))
+            case Tree(data="exis_unpack", children=[tyname, varname, init, body]):
+                assert isinstance(tyname, Token)
+                assert isinstance(varname, Token)
+                if stage == 0:
+                    stack.append((tree, 1))
+                    stack.append((init, 0))
+                elif stage == 1:
+                    context.add_binding(tyname, TyVarBinding())
+                    context.add_binding(varname, Binding())
+                    stack.append((tree, 2))
+                    stack.append((body, 0))
+                else:
+                    context.pop_binding()
+                    context.pop_binding()
+                    body_node = nodes.pop()
+                    nodes.append(ExisUnpackNode(tyname, varname, nodes.pop(), body_node))
+            case Tree(data="if_stmt", children=[cond, then, else_]):
+                if stage == 0:
+                    stack.append((tree, 1))
+                    stack.append((else_, 0))
+                    stack.append((then, 0))
+                    stack.append((cond, 0))
+                else:
+                    else_node, then_node = nodes.pop(), nodes.pop()
+                    nodes.append(IfNode(nodes.pop(), then_node, else_node))
+            case Tree(data="nat", children=[number]):
+                assert isinstance(number, str)
+                num = int(number)
+                nodes.append(_num_to_church(num))
+            case Tree(data="succ" | "pred" | "iszero" as op, children=[child]):
+                if stage == 0:
+                    stack.append((tree, 1))
+                    stack.append((child, 0))
+                else:
+                    cls = {"succ": SuccNode, "pred": PredNode, "iszero": IsZeroNode}[op]
+                    nodes.append(cls(nodes.pop()))
+            case _:
+                raise Exception("Unmatched", tree)
+    return nodes.pop()
 
 
 p = Lark(grammar, propagate_positions=True)
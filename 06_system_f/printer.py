@@ -0,0 +1,92 @@
+"""Printer for System F terms and types, on the shared engine in `pytapl.printer`"""
+from typing import Optional
+
+from pytapl.printer import POP, Bind, Printer
+
+from context import Context
+from nodes import (AbsNode, AppNode, ArrowTy, BoolTy, ExisPackNode, ExisTy,
+                   ExisUnpackNode, FalseNode, IfNode, IsZeroNode, LetNode, NatTy,
+                   Node, PredNode, SuccNode, TrueNode, Ty, TyVar, TypeAbsNode,
+                   TypeAppNode, UnivTy, VarNode, ZeroNode)
+
+
+def _visit(p: Printer, node: "Node | Ty", depth: int) -> None:
+    depth += 1
+    match node:
+        case TrueNode():
+            p.write("true")
+        case FalseNode():
+            p.write("false")
+        case VarNode(idx, _):
+            p.write(p.var(idx))
+        case AbsNode(orig_name, ty, body):
+            # the type is in the scope outside of the binder
+            p.write(f"(lambda {p.fresh(orig_name)}:")
+            p.work.extend((")", POP, (body, depth), Bind(orig_name, False), ". ", (ty, depth)))
+        case AppNode(c1, c2):
+            p.write("(")
+            p.work.extend((")", (c2, depth), " ", (c1, depth)))
+        case LetNode(varname, init, body):
+            p.write(f"(let {p.fresh(varname)} = ")
+            p.work.extend((")", POP, (body, depth), Bind(varname, False), " in ", (init, depth)))
+        case IfNode(cond, then, else_):
+            p.write("(if ")
+            p.work.extend((")", (else_, depth), " else ", (then, depth), " then ", (cond, depth)))
+        case ZeroNode():
+            p.write("0")
+        case SuccNode():
+            # walk the whole chain at once, so that long chains stay linear
+            num = 0
+            while isinstance(node, SuccNode):
+                num += 1
+                node = node.val
+            if isinstance(node, ZeroNode):
+                p.write(str(num))
+            else:
+                p.write("(succ " * num)
+                p.work.extend((")" * num, (node, depth)))
+        case PredNode(val):
+            p.write("(pred ")
+            p.work.extend((")", (val, depth)))
+        case IsZeroNode(val):
+            p.write("(iszero ")
+            p.work.extend((")", (val, depth)))
+        case TypeAbsNode(name, body):
+            p.write("(lambda ")
+            p.work.extend((")", POP, (body, depth), ". ", Bind(name)))
+        case TypeAppNode(body, ty):
+            p.write("(")
+            p.work.extend(("])", (ty, depth), " [", (body, depth)))
+        case ExisPackNode(exis_ty, body, ty):
+            p.write("({*")
+            p.work.extend((")", (ty, depth), "} as ", (body, depth), ", ", (exis_ty, depth)))
+        case ExisUnpackNode(tyname, varname, init, body):
+            p.write(f"(let {{{p.fresh(tyname)}, {p.fresh(varname)}}} = ")
+            p.work.extend((")", POP, POP, (body, depth), Bind(varname, False),
+                           Bind(tyname, False), " in ", (init, depth)))
+        case BoolTy():
+            p.write("Bool")
+        case NatTy():
+            p.write("Nat")
+        case TyVar(idx, _):
+            p.write(p.var(idx))
+        case UnivTy(name, body):
+            p.write("(All ")
+            p.work.extend((")", POP, (body, depth), ". ", Bind(name)))
+        case ExisTy(name, body):
+            p.write("{Some ")
+            p.work.extend(("}", POP, (body, depth), ", ", Bind(name)))
+        case ArrowTy(ArrowTy() | ExisTy() as ty1, ty2):
+            p.write("(")
+            p.work.extend(((ty2, depth), ")->", (ty1, depth)))
+        case ArrowTy(ty1, ty2):
+            p.work.extend(((ty2, depth), "->", (ty1, depth)))
+        case _:
+            raise Exception(f"Unknown node {node}")
+
+
+def pprint_term(node: "Node | Ty", context: Context, max_width: Optional[int] = None,
+                max_depth: Optional[int] = None, max_nodes: Optional[int] = None) -> str:
+    """Text of a term or type in context, see `Printer` for the limits"""
+    names = [elem.name for elem in context.data]
+    return Printer(names, max_width, max_depth, max_nodes).run(node, _visit)
@@ -7,6 +7,7 @@ from nodes import (AbsNode, AppNode, ArrowTy, BindNode, BoolTy, ExisPackNode, Ex
                    ExisUnpackNode, FalseNode, IfNode, IsZeroNode, LetNode, NatTy, Node,
                    PredNode, SuccNode, TrueNode, Ty, TyVar, TyVarBinding, TypeAbsNode, TypeAppNode,
                    UnivTy, VarBinding, VarNode, ZeroNode)
+from printer import pprint_term
 
 
 class NoRuleApplies(Exception):
@@ -204,68 +205,114 @@ def eval_node(node: Node, context: Context):
 
 
 def typeof(node: Node, context: Context):
-    match node:
-        case TrueNode() | FalseNode():
-            return BoolTy()
-        case ZeroNode():
-            return NatTy()
-        case PredNode(node) | SuccNode(node):
-            if typeof(node, context) != NatTy():
-                raise TypeError("body should be NatTy")
-            return NatTy()
-        case IfNode(cond, then, else_):
-            match typeof(cond, context):
-                case BoolTy():
-                    then_ty = typeof(then, context)
-                    else_ty = typeof(else_, context)
-                    if then_ty != else_ty:
-                        raise TypeError("If arms should have same type")
-                    return then_ty
-                case _:
-                    raise TypeError("If condition should be bool")
-        case VarNode(idx, _):
-            return context.get_type(idx)
-        case AbsNode(var_name, ty, body):
-            with context.scoped_add(var_name, VarBinding(ty)):
-                ret_ty = typeof(body, context)
-            return ArrowTy(ty, ret_ty)
-        case AppNode(t1, t2):
-            ty1, ty2 = typeof(t1, context), typeof(t2, context)
-            match ty1:
-                case ArrowTy(ty11, ty12):
-                    if ty11 == ty2:
-                        return ty12
-                    else:
-                        raise TypeError("Parameter type mismatch")
-                case _: raise TypeError("First term of abstraction should be arrow type")
-        case TypeAbsNode(name, body):
-            with context.scoped_add(name, TyVarBinding()):
-                body_ty = typeof(body, context)
-            return UnivTy(name, body_ty)
-        case TypeAppNode(body, ty):
-            body_ty = typeof(body, context)
-            match body_ty:
-                case UnivTy(name, internal_ty):
-                    return type_subst_top(internal_ty, ty)
-                case _: raise TypeError("Type Application needs universal type")
-        case ExisPackNode(exis_ty, body, ty):
-            if not isinstance(ty, ExisTy):
-                raise TypeError("Existential type expected")
-            real_body_ty = typeof(body, context)
-            subst_body_ty = type_subst_top(ty.body, exis_ty)
-            if real_body_ty != subst_body_ty:
-                raise TypeError("Doesn't match declared type")
-            return ty
-        case ExisUnpackNode(tyname, varname, init, body):
-            init_ty = typeof(init, context)
-            if not isinstance(init_ty, ExisTy):
-                raise TypeError("Unpack needs existential type, got", init_ty)
-            with context.scoped_add(tyname, TyVarBinding()),\
-                 context.scoped_add(varname, VarBinding(init_ty.body)):
-                body_ty = typeof(body, context)
-            return type_shift(body_ty, -2)
+    """Type of node in context
 
-    raise Exception(f"Unknown node {node}")
+    Uses an explicit stack instead of recursion, so the depth of node is not
+    limited by the recursion limit. Each frame has a stage, for the checks
+    that are done after some of its children are typed. Binders add to context
+    when their body is pushed and pop from it once the body is typed.
+    """
+    types: list[Ty] = []
+    stack: list[tuple[Node, int]] = [(node, 0)]
+    while stack:
+        node, stage = stack.pop()
+        match node:
+            case TrueNode() | FalseNode():
+                types.append(BoolTy())
+            case ZeroNode():
+                types.append(NatTy())
+            case PredNode(body) | SuccNode(body):
+                if stage == 0:
+                    stack.append((node, 1))
+                    stack.append((body, 0))
+                elif types.pop() != NatTy():
+                    raise TypeError("body should be NatTy")
+                else:
+                    types.append(NatTy())
+            case IfNode(cond, then, else_):
+                if stage == 0:
+                    stack.append((node, 1))
+                    stack.append((cond, 0))
+                elif stage == 1:
+                    if not isinstance(types.pop(), BoolTy):
+                        raise TypeError("If condition should be bool")
+                    stack.append((node, 2))
+                    stack.append((else_, 0))
+                    stack.append((then, 0))
+                elif types.pop() != types[-1]:
+                    raise TypeError("If arms should have same type")
+            case VarNode(idx, _):
+                types.append(context.get_type(idx))
+            case AbsNode(var_name, ty, body):
+                if stage == 0:
+                    context.add_binding(var_name, VarBinding(ty))
+                    stack.append((node, 1))
+                    stack.append((body, 0))
+                else:
+                    context.pop_binding()
+                    types.append(ArrowTy(ty, types.pop()))
+            case AppNode(t1, t2):
+                if stage == 0:
+                    stack.append((node, 1))
+                    stack.append((t2, 0))
+                    stack.append((t1, 0))
+                    continue
+                ty2, ty1 = types.pop(), types.pop()
+                match ty1:
+                    case ArrowTy(ty11, ty12):
+                        if ty11 == ty2:
+                            types.append(ty12)
+                        else:
+                            raise TypeError("Parameter type mismatch")
+                    case _: raise TypeError("First term of abstraction should be arrow type")
+            case TypeAbsNode(name, body):
+                if stage == 0:
+                    context.add_binding(name, TyVarBinding())
+                    stack.append((node, 1))
+                    stack.append((body, 0))
+                else:
+                    context.pop_binding()
+                    types.append(UnivTy(name, types.pop()))
+            case TypeAppNode(body, ty):
+                if stage == 0:
+                    stack.append((node, 1))
+                    stack.append((body, 0))
+                    continue
+                match types.pop():
+                    case UnivTy(name, internal_ty):
+                        types.append(type_subst_top(internal_ty, ty))
+                    case _: raise TypeError("Type Application needs universal type")
+            case ExisPackNode(exis_ty, body, ty):
+                if not isinstance(ty, ExisTy):
+                    raise TypeError("Existential type expected")
+                if stage == 0:
+                    stack.append((node, 1))
+                    stack.append((body, 0))
+                    continue
+                real_body_ty = types.pop()
+                subst_body_ty = type_subst_top(ty.body, exis_ty)
+                if real_body_ty != subst_body_ty:
+                    raise TypeError("Doesn't match declared type")
+                types.append(ty)
+            case ExisUnpackNode(tyname, varname, init, body):
+                if stage == 0:
+                    stack.append((node, 1))
+                    stack.append((init, 0))
+                elif stage == 1:
+                    init_ty = types.pop()
+                    if not isinstance(init_ty, ExisTy):
+                        raise TypeError("Unpack needs existential type, got", init_ty)
+                    context.add_binding(tyname, TyVarBinding())
+                    context.add_binding(varname, VarBinding(init_ty.body))
+                    stack.append((node, 2))
+                    stack.append((body, 0))
+                else:
+                    context.pop_binding()
+                    context.pop_binding()
+                    types.append(type_shift(types.pop(), -2))
+            case _:
+                raise Exception(f"Unknown node {node}")
+    return types.pop()
 
 
 def run(cmd, context, mode="eval"):
@@ -273,9 +320,9 @@ def run(cmd, context, mode="eval"):
         context.add_binding(cmd.name, cmd.binding)
         print(cmd.name)
     elif mode == "eval":
-        print(eval_node(cmd, context))
+        print(pprint_term(eval_node(cmd, context), context))
     elif mode == "type":
-        print(typeof(cmd, context))
+        print(pprint_term(typeof(cmd, context), context))
 
 
 def main():
@@ -0,0 +1,173 @@
+import random
+
+from bench_deep import abs_chain, app_spine, if_chain, tree_let, tree_spine, type_abs
+from context import Context
+from nodes import (AbsNode, AppNode, ArrowTy, BoolTy, ExisPackNode, ExisTy, ExisUnpackNode,
+                   FalseNode, IfNode, LetNode, NatTy, PredNode, SuccNode, TrueNode, TyVar,
+                   TyVarBinding, TypeAbsNode, TypeAppNode, UnivTy, VarBinding, VarNode,
+                   ZeroNode)
+from parser import parse, parse_node
+from run import type_shift, type_subst_top, typeof
+
+
+def recursive_typeof(node, context):
+    """typeof as it was before it used an explicit stack"""
+    match node:
+        case TrueNode() | FalseNode():
+            return BoolTy()
+        case ZeroNode():
+            return NatTy()
+        case PredNode(node) | SuccNode(node):
+            if recursive_typeof(node, context) != NatTy():
+                raise TypeError("body should be NatTy")
+            return NatTy()
+        case IfNode(cond, then, else_):
+            match recursive_typeof(cond, context):
+                case BoolTy():
+                    then_ty = recursive_typeof(then, context)
+                    else_ty = recursive_typeof(else_, context)
+                    if then_ty != else_ty:
+                        raise TypeError("If arms should have same type")
+                    return then_ty
+                case _:
+                    raise TypeError("If condition should be bool")
+        case VarNode(idx, _):
+            return context.get_type(idx)
+        case AbsNode(var_name, ty, body):
+            with context.scoped_add(var_name, VarBinding(ty)):
+                ret_ty = recursive_typeof(body, context)
+            return ArrowTy(ty, ret_ty)
+        case AppNode(t1, t2):
+            ty1, ty2 = recursive_typeof(t1, context), recursive_typeof(t2, context)
+            match ty1:
+                case ArrowTy(ty11, ty12):
+                    if ty11 == ty2:
+                        return ty12
+                    else:
+                        raise TypeError("Parameter type mismatch")
+                case _: raise TypeError("First term of abstraction should be arrow type")
+        case TypeAbsNode(name, body):
+            with context.scoped_add(name, TyVarBinding()):
+                body_ty = recursive_typeof(body, context)
+            return UnivTy(name, body_ty)
+        case TypeAppNode(body, ty):
+            body_ty = recursive_typeof(body, context)
+            match body_ty:
+                case UnivTy(name, internal_ty):
+                    return type_subst_top(internal_ty, ty)
+                case _: raise TypeError("Type Application needs universal type")
+        case ExisPackNode(exis_ty, body, ty):
+            if not isinstance(ty, ExisTy):
+                raise TypeError("Existential type expected")
+            real_body_ty = recursive_typeof(body, context)
+            subst_body_ty = type_subst_top(ty.body, exis_ty)
+            if real_body_ty != subst_body_ty:
+                raise TypeError("Doesn't match declared type")
+            return ty
+        case ExisUnpackNode(tyname, varname, init, body):
+            init_ty = recursive_typeof(init, context)
+            if not isinstance(init_ty, ExisTy):
+                raise TypeError("Unpack needs existential type, got", init_ty)
+            with context.scoped_add(tyname, TyVarBinding()),\
+                 context.scoped_add(varname, VarBinding(init_ty.body)):
+                body_ty = recursive_typeof(body, context)
+            return type_shift(body_ty, -2)
+
+    raise Exception(f"Unknown node {node}")
+
+
+def random_type(rng: random.Random, depth: int):
+    choice = rng.randrange(3 if depth else 2)
+    if choice < 2:
+        return [BoolTy(), NatTy()][choice]
+    return ArrowTy(random_type(rng, depth - 1), random_type(rng, depth - 1))
+
+
+def random_term(rng: random.Random, depth: int, level: int):
+    """Random term that is mostly ill typed, with level bindings in scope"""
+    choice = rng.randrange(11 if depth else 4)
+    if choice < 3:
+        return [TrueNode(), FalseNode(), ZeroNode()][choice]
+    if choice == 3:
+        return VarNode(rng.randrange(level), level) if level else ZeroNode()
+    if choice == 4:
+        return AbsNode("x", random_type(rng, 2), random_term(rng, depth - 1, level + 1))
+    if choice == 5:
+        return AppNode(random_term(rng, depth - 1, level), random_term(rng, depth - 1, level))
+    if choice == 6:
+        return IfNode(*(random_term(rng, depth - 1, level) for _ in range(3)))
+    if choice == 7:
+        return rng.choice((SuccNode, PredNode))(random_term(rng, depth - 1, level))
+    if choice == 8:
+        return TypeAbsNode("X", random_term(rng, depth - 1, level + 1))
+    if choice == 9:
+        return TypeAppNode(random_term(rng, depth - 1, level), random_type(rng, 1))
+    if rng.random() < 0.5:
+        ty = ExisTy("X", rng.choice([TyVar(0, level + 1), NatTy(), ArrowTy(TyVar(0, level + 1), BoolTy())]))
+        return ExisPackNode(random_type(rng, 1), random_term(rng, depth - 1, level), ty)
+    return ExisUnpackNode("X", "x", random_term(rng, depth - 1, level), random_term(rng, depth - 1, level + 2))
+
+
+def type_or_error(typeof, node):
+    ctx = Context()
+    ctx.add_binding("w", VarBinding(BoolTy()))
+    ctx.add_binding("f", VarBinding(ArrowTy(NatTy(), NatTy())))
+    try:
+        return typeof(node, ctx)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+
+# the explicit stack gives the same types and the same first error
+rng = random.Random(0)
+results = set()
+for _ in range(5000):
+    node = random_term(rng, rng.randrange(1, 6), 2)
+    expected = type_or_error(recursive_typeof, node)
+    assert type_or_error(typeof, node) == expected, (node, expected)
+    results.add(expected.split(" at ")[0].split(",")[0] if isinstance(expected, str) else type(expected))
+assert len(results) == 14, results
+for node in parse("""
+    lambda x:Nat. succ x;
+    lambda X. lambda x:X. x;
+    (lambda X. lambda x:X. x) [Nat->Bool];
+    let {X,x}=({*Nat,0} as {Some X,X}) in 0;
+    let {X,x}=({*Nat,lambda n:Nat. iszero n} as {Some X,X->Bool}) in true;
+    {*Nat,0} as {Some X,X->X};
+    lambda x:Bool. x [Nat];
+"""):
+    assert type_or_error(typeof, node) == type_or_error(recursive_typeof, node)
+ctx = Context()
+ctx.add_binding("w", VarBinding(BoolTy()))
+ctx.add_binding("f", VarBinding(ArrowTy(NatTy(), NatTy())))
+for make in (app_spine, if_chain, abs_chain):
+    assert typeof(make(30_000), ctx) == NatTy() and len(ctx) == 2
+ty = typeof(type_abs(30_000), ctx)
+for _ in range(30_000):
+    ty = ty.body
+assert ty == ArrowTy(NatTy(), NatTy())
+deep = IfNode(TrueNode(), app_spine(30_000), TrueNode())
+assert type_or_error(typeof, deep) == "TypeError: If arms should have same type"
+# parsing builds the same nodes, at any depth
+node = parse_node(tree_spine(30_000), ctx)
+for _ in range(30_000):
+    assert node.child1 == VarNode(0, 2)
+    node = node.child2.val
+assert node == ZeroNode()
+node = parse_node(tree_let(30_000), ctx)
+for level in range(30_000):
+    assert isinstance(node, LetNode)
+    node = node.body
+assert node == SuccNode(VarNode(0, 30_002)) and len(ctx) == 2
+(node,) = parse("lambda X. lambda x:All Y. X->Y. 3;")
+assert node.body.ty == UnivTy("Y", ArrowTy(TyVar(1, 2), TyVar(0, 2)))
+assert node.body.body == SuccNode(SuccNode(SuccNode(ZeroNode())))
+for source, message in [("lambda x:Nat. y;", "Unbound variable y"),
+                        ("lambda x:Y. x;", "Unbound type variable Y")]:
+    try:
+        parse(source)
+    except Exception as e:
+        assert str(e) == message
+    else:
+        raise AssertionError(message)
+print("typeof: ok")
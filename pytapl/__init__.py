@@ -0,0 +1 @@
+"""Code shared by the calculi in the numbered directories"""
@@ -0,0 +1,131 @@
+"""Partial evaluation engine shared by the typed calculi.
+
+The optimizer runs between type checking and evaluation, and does the
+reductions that don't depend on any input ahead of time, anywhere in the
+term, including under abstractions. Which reductions those are depends on the
+calculus, so each one has an `optimize.py` with the `Rules` for its nodes.
+
+Terms are walked with explicit stacks, so optimizing doesn't depend on the
+recursion limit. A node's subterms are optimized one by one, and after each
+of them its rules can replace the node, so for example only the branch of an
+`if` that is taken gets optimized once the condition is known.
+"""
+import abc
+from dataclasses import dataclass
+from typing import Generic, Optional, TypeVar
+
+# most nodes that copies of an inlined argument may add
+BUDGET = 64
+
+Node = TypeVar("Node")
+
+
+@dataclass
+class Stats:
+    folded: int = 0
+    inlined: int = 0
+    size_before: int = 0
+    size_after: int = 0
+
+    @property
+    def removed(self):
+        """Number of reductions that were done ahead of time"""
+        return self.folded + self.inlined
+
+
+class Rules(abc.ABC, Generic[Node]):
+    """How the optimizer walks and reduces the nodes of one calculus"""
+
+    @abc.abstractmethod
+    def children(self, node: Node) -> tuple[Node, ...]:
+        """Subterms of node, in the order they are optimized"""
+
+    @abc.abstractmethod
+    def rebuild(self, node: Node, children: list[Node]) -> Node:
+        """Copy of node with children as its subterms"""
+
+    @abc.abstractmethod
+    def binds(self, node: Node) -> bool:
+        """Whether node binds a variable around its subterms"""
+
+    @abc.abstractmethod
+    def var_idx(self, node: Node) -> Optional[int]:
+        """De Bruijn index of node if it is a variable, else None"""
+
+    @abc.abstractmethod
+    def reduce(self, node: Node, children: list[Node], depth: int,
+               budget: int, stats: Stats) -> Optional[tuple[Node, bool]]:
+        """Reduce node, after its first len(children) subterms are optimized
+
+        Returns None to go on with the next subterm, or with rebuilding node
+        once they are all done. Otherwise returns a pair of the node to use
+        instead, and whether it needs to be optimized again.
+
+        depth: Number of binders around node
+        """
+
+
+def size(node, rules: Rules) -> int:
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(rules.children(node))
+    return count
+
+
+def uses(node, rules: Rules, idx: int = 0) -> int:
+    """Number of occurrences of the variable idx in node"""
+    count = 0
+    stack = [(node, idx)]
+    while stack:
+        node, idx = stack.pop()
+        if rules.var_idx(node) == idx:
+            count += 1
+        if rules.binds(node):
+            idx += 1
+        stack.extend((child, idx) for child in rules.children(node))
+    return count
+
+
+def optimize(node, rules: Rules, budget: int = BUDGET, stats: Optional[Stats] = None):
+    """Partially evaluate the well typed node with rules
+
+    budget: Most nodes that the copies of an inlined argument may add
+    stats: Counts the reductions that were done
+    """
+    if stats is None:
+        stats = Stats()
+    stats.size_before += size(node, rules)
+    results: list = []
+    # (node, depth, number of its subterms that are optimized so far, and the
+    # subterms once they are known)
+    stack: list[tuple] = [(node, 0, 0, None)]
+    while stack:
+        node, depth, done, children = stack.pop()
+        if children is None:
+            children = rules.children(node)
+        if done:
+            optimized = results[len(results) - done:]
+            reduced = rules.reduce(node, optimized, depth, budget, stats)
+            if reduced is not None:
+                del results[len(results) - done:]
+                node, again = reduced
+                if again:
+                    stack.append((node, depth, 0, None))
+                else:
+                    results.append(node)
+                continue
+            if done == len(children):
+                del results[len(results) - done:]
+                results.append(rules.rebuild(node, optimized))
+                continue
+        elif not children:
+            results.append(node)
+            continue
+        stack.append((node, depth, done + 1, children))
+        stack.append((children[done], depth + rules.binds(node), 0, None))
+    node = results.pop()
+    stats.size_after += size(node, rules)
+    return node, stats
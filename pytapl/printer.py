@@ -0,0 +1,139 @@
+"""Printer engine shared by the calculi, which write into a single buffer in
+one pass.
+
+The term is walked with an explicit worklist, so printing is linear in the
+size of the output and doesn't depend on the recursion limit. Binders are
+freshened against a count of the names in scope, and a counter per name
+remembers the primes that are known to be taken, so finding a fresh name
+doesn't scan the context.
+
+The output can be limited by width, depth and number of nodes, and whatever
+is over a limit is elided as "...". Only the part that is printed is walked,
+so limited printing of a huge term takes time in the size of the output.
+
+Each calculus has a `printer.py` with a visit function for its own nodes,
+which writes a node and pushes its children, and passes it to `Printer.run`.
+"""
+from typing import Callable, NamedTuple, Optional
+
+POP = object()
+ELIDED = "..."
+
+
+class Bind(NamedTuple):
+    """Marker to bring a binder into scope when reached, and write its name
+    if show is set"""
+    name: str
+    show: bool = True
+
+
+class Printer:
+    """Buffer for printing one term
+
+    The worklist holds text, `(node, depth)` pairs, Bind markers, and POP
+    markers for when a binder goes out of scope.
+
+    names: Names of the variables in the context, outermost first
+    max_width: Characters after which the output is cut off
+    max_depth: Depth below which subterms are elided
+    max_nodes: Nodes after which the remaining subterms are elided
+    """
+
+    def __init__(self, names: list, max_width: Optional[int] = None,
+                 max_depth: Optional[int] = None, max_nodes: Optional[int] = None) -> None:
+        self.out: list[str] = []
+        self.work: list = []
+        self.width = 0
+        self.nodes = 0
+        self.full = False
+        self.max_width = max_width
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.names: list[str] = []
+        # number of variables in scope with each name
+        self.scope: dict[str, int] = {}
+        # for each name, the number of primes below which all are in scope
+        self.primes: dict[str, int] = {}
+        self.bound: list[tuple[str, int]] = []
+        if max_width is None:
+            self.write = self.out.append  # type: ignore
+        for name in names:
+            self._enter(str(name))
+
+    def _enter(self, name: str) -> None:
+        self.names.append(name)
+        self.scope[name] = self.scope.get(name, 0) + 1
+
+    def _fresh(self, name: str) -> tuple[str, int]:
+        primes = self.primes.get(name, 0)
+        fresh = name + "'" * primes
+        while fresh in self.scope:
+            primes += 1
+            fresh += "'"
+        return fresh, primes
+
+    def fresh(self, name: str) -> str:
+        """Name that `bind` would give to name, without bringing it into scope"""
+        return self._fresh(str(name))[0]
+
+    def bind(self, name: str) -> str:
+        """Bring a fresh variable for name into scope, returning its name"""
+        name = str(name)
+        fresh, primes = self._fresh(name)
+        self.primes[name] = primes + 1
+        self.bound.append((name, primes))
+        self._enter(fresh)
+        return fresh
+
+    def unbind(self) -> None:
+        name, primes = self.bound.pop()
+        fresh = self.names.pop()
+        self.scope[fresh] -= 1
+        if not self.scope[fresh]:
+            del self.scope[fresh]
+            self.primes[name] = min(self.primes[name], primes)
+
+    def var(self, idx: int) -> str:
+        if idx >= len(self.names):
+            return f"[bad index {idx}]"
+        return self.names[~idx]
+
+    def write(self, text: str) -> None:
+        if self.full:
+            return
+        if self.max_width is not None and self.width + len(text) > self.max_width:
+            self.out.append(text[:self.max_width - self.width] + ELIDED)
+            # nothing more fits, so stop walking
+            self.full = True
+            self.work.clear()
+            return
+        self.out.append(text)
+        self.width += len(text)
+
+    def run(self, node, visit: Callable[["Printer", object, int], None]) -> str:
+        """Print node, with visit writing a node and pushing its children"""
+        work, write = self.work, self.write
+        limited = self.max_depth is not None or self.max_nodes is not None
+        max_depth = self.max_depth if self.max_depth is not None else float("inf")
+        max_nodes = self.max_nodes if self.max_nodes is not None else float("inf")
+        work.append((node, 0))
+        while work and not self.full:
+            item = work.pop()
+            if type(item) is tuple:
+                node, depth = item
+                if limited:
+                    if depth > max_depth or self.nodes >= max_nodes:
+                        write(ELIDED)
+                        continue
+                    self.nodes += 1
+                visit(self, node, depth)
+            elif item is POP:
+                self.unbind()
+            elif type(item) is Bind:
+                name = self.bind(item.name)
+                if item.show:
+                    write(name)
+            else:
+                write(item)
+        return "".join(self.out)
+